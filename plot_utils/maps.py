@@ -1,43 +1,98 @@
 # -*- coding: utf-8 -*-
 
 import os
+import collections
 import numpy as np
 import pandas as pd
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 from matplotlib.colors import Normalize
-from distutils.version import LooseVersion
 
 from . import helper as hlp
 
-basemap_error_msg = '\nPlease install Basemap in order to use ' \
-                    '`choropleth_map_state()`.\n' \
-                    'To install with conda (recommended):\n' \
-                    '    >>> conda install basemap\n' \
-                    'To install without conda, refer to:\n' \
-                    '    https://matplotlib.org/basemap/users/installing.html'
-
-proj_lib_error_msg = 'Due to a bug in conda, the environmental variable ' \
-                     '"PROJ_LIB" is not correctly configured. Please ' \
-                     'manually add the path to "proj4" as an environmental' \
-                     ' variable "PROJ_LIB" on your system.\n\n' \
-                     'The path to "proj4" is usually in ' \
-                     '<anaconda_path>/pkgs/proj4-<version>/Library/share' \
-                     '\n\n' \
-                     'To add environmental variables in Windows:\n' \
-                     '  Control panel --> System properties --> ' \
-                     'Environment variables... \n    --> "User variables for USERNAME"' \
-                     '--> New...\n    ' \
-                     '--> Use "PROJ_LIB" as variable name, and paste in the path above.\n' \
-                     'Then, restart your computer.\n' \
-                     '(You only need to do this once.)'
+# State identifiers: (FIPS code, abbreviation, full name). The first 51 rows
+# are the 50 states and District of Columbia, followed by overseas territories.
+_STATE_IDENTIFIERS = (
+    ('01', 'AL', 'Alabama'), ('02', 'AK', 'Alaska'), ('04', 'AZ', 'Arizona'),
+    ('05', 'AR', 'Arkansas'), ('06', 'CA', 'California'),
+    ('08', 'CO', 'Colorado'), ('09', 'CT', 'Connecticut'),
+    ('10', 'DE', 'Delaware'), ('11', 'DC', 'District of Columbia'),
+    ('12', 'FL', 'Florida'), ('13', 'GA', 'Georgia'), ('15', 'HI', 'Hawaii'),
+    ('16', 'ID', 'Idaho'), ('17', 'IL', 'Illinois'), ('18', 'IN', 'Indiana'),
+    ('19', 'IA', 'Iowa'), ('20', 'KS', 'Kansas'), ('21', 'KY', 'Kentucky'),
+    ('22', 'LA', 'Louisiana'), ('23', 'ME', 'Maine'), ('24', 'MD', 'Maryland'),
+    ('25', 'MA', 'Massachusetts'), ('26', 'MI', 'Michigan'),
+    ('27', 'MN', 'Minnesota'), ('28', 'MS', 'Mississippi'),
+    ('29', 'MO', 'Missouri'), ('30', 'MT', 'Montana'), ('31', 'NE', 'Nebraska'),
+    ('32', 'NV', 'Nevada'), ('33', 'NH', 'New Hampshire'),
+    ('34', 'NJ', 'New Jersey'), ('35', 'NM', 'New Mexico'),
+    ('36', 'NY', 'New York'), ('37', 'NC', 'North Carolina'),
+    ('38', 'ND', 'North Dakota'), ('39', 'OH', 'Ohio'), ('40', 'OK', 'Oklahoma'),
+    ('41', 'OR', 'Oregon'), ('42', 'PA', 'Pennsylvania'),
+    ('44', 'RI', 'Rhode Island'), ('45', 'SC', 'South Carolina'),
+    ('46', 'SD', 'South Dakota'), ('47', 'TN', 'Tennessee'), ('48', 'TX', 'Texas'),
+    ('49', 'UT', 'Utah'), ('50', 'VT', 'Vermont'), ('51', 'VA', 'Virginia'),
+    ('53', 'WA', 'Washington'), ('54', 'WV', 'West Virginia'),
+    ('55', 'WI', 'Wisconsin'), ('56', 'WY', 'Wyoming'),
+    ('60', 'AS', 'American Samoa'), ('66', 'GU', 'Guam'),
+    ('69', 'MP', 'Northern Mariana Islands'), ('72', 'PR', 'Puerto Rico'),
+    ('78', 'VI', 'Virgin Islands'),
+)
+_STATES_AND_DC = [name for _, _, name in _STATE_IDENTIFIERS[:51]]
+_FIPS_TO_STATE_NAME = {FIPS: name for FIPS, _, name in _STATE_IDENTIFIERS}
+_ABBREV_TO_STATE_NAME = {abbrev: name for _, abbrev, name in _STATE_IDENTIFIERS}
+_STATE_NAME_TO_ABBREV = {name: abbrev for _, abbrev, name in _STATE_IDENTIFIERS}
+
+# Index from any (upper-case) state identifier to the full state name
+_STATE_NAME_INDEX = pd.Series({
+    key: name for FIPS, abbrev, name in _STATE_IDENTIFIERS
+    for key in (FIPS, abbrev, name.upper())
+})
+
+# Lambert Conformal projection, for the lower 48 states
+_LCC_PARAMS = dict(
+    llcrnrlon=-119, llcrnrlat=20, urcrnrlon=-64, urcrnrlat=49,
+    projection='lcc', lat_1=33, lat_2=45, lon_0=-95,
+)
+
+# Mercator projection, for Alaska and Hawaii (do not change these numbers)
+_MERC_PARAMS = dict(
+    llcrnrlon=-190, llcrnrlat=20, urcrnrlon=-143, urcrnrlat=46,
+    projection='merc', lat_ts=20,
+)
+
+# Process-level LRU cache of map projections and projected shapefile geometry,
+# bounded by the (estimated) memory size of the cached objects, so that many
+# small entries (e.g., projections) do not evict the large ones (e.g., the
+# full geometry), and many large entries do not use up the memory
+_MAP_CACHE_MAXBYTES = 512 * 1024**2
+_map_cache = collections.OrderedDict()  # key --> (object, size in bytes)
+
+# Precompiled geometry bundles (see `build_geometry_bundle()`)
+_BUNDLE_SUFFIX = '_geometry'
+_BUNDLE_VERSION = 2
+
+# Map insets: states drawn away from their actual locations, after scaling
+# their projected shapes and then shifting them by ``offset`` (in meters).
+# These values are obtained via manual trial and error, thus changing them is
+# not recommended. Islands not larger than ``min_area`` (in squared degrees)
+# are not drawn on state-level maps.
+_DEFAULT_INSETS = (
+    dict(state='02', scale=0.19, offset=(-250000, -750000), min_area=0.15),  # Alaska
+    dict(state='15', scale=1.0, offset=(-1900000, 250000), min_area=0.005),  # Hawaii
+)
+
+# Simplification tolerances (in map projection units, i.e., meters) of the
+# levels of detail of the polygons. Level 0 is the full detail.
+_LOD_TOLERANCES = (0.0,) + tuple(100.0 * 2 ** k for k in range(9))
 
 #%%============================================================================
 def choropleth_map_state(
         data_per_state, fig=None, ax=None, figsize=(10,7),
         dpi=100, vmin=None, vmax=None, map_title='USA map',
         unit='', cmap='OrRd', fontsize=14, cmap_midpoint=None,
-        shapefile_dir=None,
+        shapefile_dir=None, level_of_detail='auto', insets=None,
+        render='vector', raster_pixel_size=None, scheme=None, k=5,
 ):
     '''
     Generate a choropleth map of the US (including Alaska and Hawaii), on a
@@ -102,6 +157,58 @@ def choropleth_map_state(
             ``shapefile_dir``/usa_states/st99_d00.(...)
             ``shapefile_dir``/usa_counties/cb_2016_us_county_500k.(...)
         If ``None``, the shapefile directory within this library will be used.
+        Geometry bundles precompiled by :func:`~build_geometry_bundle` are
+        used in place of the shape files, if they exist.
+    level_of_detail : {'auto', int, ``None``}
+        How much the polygons are simplified before being drawn, which makes
+        small maps (such as thumbnails) much faster to draw. The polygons are
+        simplified with the Douglas-Peucker algorithm, and shared borders
+        stay aligned. If 'auto', the level is chosen from the size and
+        resolution of the axes, so that the removed details are smaller than
+        a pixel. An integer from 0 (full detail) to 9 (coarsest) pins the
+        level; ``None`` is the same as 0.
+    insets : list<dict> or ``None``
+        Layout of the map insets, i.e., the states drawn away from their
+        actual locations. Each dict describes one inset, with these keys:
+            - 'state': 2-digit FIPS code of the state (such as '72')
+            - 'scale': scaling factor of the state (default: 1.0)
+            - 'offset': (x, y) shift on the map, in meters, applied after
+              the scaling (default: (0, 0))
+            - 'projection': 'merc' (Mercator, the default) or 'lcc' (Lambert
+              Conformal, the projection of the lower 48 states)
+            - 'min_area': islands whose area (in squared degrees) is not
+              larger than this are not drawn (state-level maps only)
+        If ``None``, Alaska and Hawaii are drawn below the lower 48 states,
+        which is the same as
+        ``[dict(state='02', scale=0.19, offset=(-250000, -750000), min_area=0.15),
+        dict(state='15', offset=(-1900000, 250000), min_area=0.005)]``.
+        Appending ``dict(state='72', projection='lcc', offset=(-1400000, 150000))``
+        to this list adds Puerto Rico below Florida.
+    render : {'vector', 'raster'}
+        How the regions are drawn. If 'vector', each region is a polygon.
+        If 'raster', the regions are rasterized once into an image of region
+        labels (which is cached, so later maps with the same geometry and
+        resolution reuse it), and the map is an image whose colors are looked
+        up from these labels. This is much faster for generating many maps
+        (e.g., PNG files in batch), but the regions are not vector graphics,
+        and regions with NaN data are not hatched.
+    raster_pixel_size : float or ``None``
+        Size of a pixel (in meters on the map) of the raster image, if
+        ``render`` is 'raster'. If ``None``, it matches the size of a screen
+        pixel of the axes, according to the size and resolution of the axes.
+    scheme : {``None``, 'quantiles', 'equal_interval', 'natural_breaks'}
+        Classification scheme of the data. If ``None``, the colors change
+        continuously with the data. Otherwise, the data are classified into
+        ``k`` classes, each with one color (and the color bar is discrete):
+            - 'quantiles': each class has about the same number of regions
+            - 'equal_interval': the classes have the same width
+            - 'natural_breaks': the Jenks natural breaks (i.e., the classes
+              with the smallest total within-class variance), which suit
+              skewed data
+        ``cmap_midpoint`` is not used if ``scheme`` is not ``None``.
+    k : int
+        Number of classes if ``scheme`` is not ``None``. There can be fewer
+        classes if the data have fewer distinct values.
 
     Returns
     -------
@@ -117,494 +224,3698 @@ def choropleth_map_state(
     as well as a modification on Stack Overflow
     (https://stackoverflow.com/questions/39742305).
     '''
+    fig, ax, _ = _choropleth_map_state_helper(
+        data_per_state, fig=fig, ax=ax, figsize=figsize, dpi=dpi,
+        vmin=vmin, vmax=vmax, map_title=map_title, unit=unit, cmap=cmap,
+        fontsize=fontsize, cmap_midpoint=cmap_midpoint,
+        shapefile_dir=shapefile_dir, level_of_detail=level_of_detail,
+        insets=insets, render=render, raster_pixel_size=raster_pixel_size,
+        scheme=scheme, k=k,
+    )
+    return fig, ax  # return figure and axes handles
+
+#%%============================================================================
+def choropleth_map_county(
+        data_per_county, fig=None, ax=None, figsize=(10,7),
+        dpi=100, vmin=None, vmax=None, unit='', cmap='OrRd',
+        map_title='USA county map', fontsize=14,
+        cmap_midpoint=None, shapefile_dir=None, level_of_detail='auto',
+        insets=None, render='vector', raster_pixel_size=None, scheme=None,
+        k=5, dissolve=False,
+    ):
+    '''
+    Generate a choropleth map of the US (including Alaska and Hawaii), on a
+    county level.
+
+    According to Wikipedia, a choropleth map is a thematic map in which areas
+    are shaded or patterned in proportion to the measurement of the statistical
+    variable being displayed on the map, such as population density or
+    per-capita income.
+
+    Parameters
+    ----------
+    data_per_county : dict or pandas.Series or pandas.DataFrame
+        Numerical data of each county, to be plotted onto the map.
+        Acceptable data types include:
+            - pandas Series: Index should be valid county identifiers (i.e.,
+                             5-digit county FIPS codes)
+            - pandas DataFrame: The dataframe can have only one column (with
+                                the index being valid county identifiers), two
+                                columns (with one of the column named 'state',
+                                'State', or 'FIPS_code', and containing county
+                                identifiers).
+            - dictionary: with keys being valid county identifiers, and values
+                          being the numerical values to be visualized
+    fig : matplotlib.figure.Figure or ``None``
+        Figure object. If None, a new figure will be created.
+    ax : matplotlib.axes._subplots.AxesSubplot or ``None``
+        Axes object. If None, a new axes will be created.
+    figsize: (float, float)
+        Figure size in inches, as a tuple of two numbers. The figure
+        size of ``fig`` (if not ``None``) will override this parameter.
+    dpi : float
+        Figure resolution. The dpi of ``fig`` (if not ``None``) will override
+        this parameter.
+    vmin : float
+        Minimum value to be shown on the map. If ``vmin`` is larger than the
+        actual minimum value in the data, some of the data values will be
+        "clipped". This is useful if there are extreme values in the data
+        and you do not want those values to complete skew the color
+        distribution.
+    vmax : float
+        Maximum value to be shown on the map. Similar to ``vmin``.
+    map_title : str
+        Title of the map, to be shown on the top of the map.
+    unit : str
+        Unit of the numerical (for example, "population per km^2"), to be
+        shown on the right side of the color bar.
+    cmap : str or <matplotlib.colors.Colormap>
+        Color map name. Suggested names: 'hot_r', 'summer_r', and 'RdYlBu'
+        for plotting deviation maps.
+    fontsize : scalar
+        Font size of all the texts on the map.
+    cmap_midpoint : float
+        A numerical value that specifies the "deviation point". For example,
+        if your data ranges from -200 to 1000, and you want negative values
+        to appear blue-ish, and positive values to appear red-ish, then you
+        can set ``cmap_midpoint`` to 0.0. If ``None``, then the "deviation
+        point" will be the median value of the data values.
+    shapefile_dir : str
+        Directory where shape files are stored. Shape files (state level and
+        county level) should be organized as follows:
+            ``shapefile_dir``/usa_states/st99_d00.(...)
+            ``shapefile_dir``/usa_counties/cb_2016_us_county_500k.(...)
+        If ``None``, the shapefile directory within this library will be used.
+        Geometry bundles precompiled by :func:`~build_geometry_bundle` are
+        used in place of the shape files, if they exist.
+    level_of_detail : {'auto', int, ``None``}
+        How much the polygons are simplified before being drawn, which makes
+        small maps (such as thumbnails) much faster to draw. The polygons are
+        simplified with the Douglas-Peucker algorithm, and shared borders
+        stay aligned. If 'auto', the level is chosen from the size and
+        resolution of the axes, so that the removed details are smaller than
+        a pixel. An integer from 0 (full detail) to 9 (coarsest) pins the
+        level; ``None`` is the same as 0.
+    insets : list<dict> or ``None``
+        Layout of the map insets, i.e., the states drawn away from their
+        actual locations. Each dict describes one inset, with these keys:
+            - 'state': 2-digit FIPS code of the state (such as '72')
+            - 'scale': scaling factor of the state (default: 1.0)
+            - 'offset': (x, y) shift on the map, in meters, applied after
+              the scaling (default: (0, 0))
+            - 'projection': 'merc' (Mercator, the default) or 'lcc' (Lambert
+              Conformal, the projection of the lower 48 states)
+            - 'min_area': islands whose area (in squared degrees) is not
+              larger than this are not drawn (state-level maps only)
+        If ``None``, Alaska and Hawaii are drawn below the lower 48 states,
+        which is the same as
+        ``[dict(state='02', scale=0.19, offset=(-250000, -750000), min_area=0.15),
+        dict(state='15', offset=(-1900000, 250000), min_area=0.005)]``.
+        Appending ``dict(state='72', projection='lcc', offset=(-1400000, 150000))``
+        to this list adds Puerto Rico below Florida.
+    render : {'vector', 'raster'}
+        How the regions are drawn. If 'vector', each region is a polygon.
+        If 'raster', the regions are rasterized once into an image of region
+        labels (which is cached, so later maps with the same geometry and
+        resolution reuse it), and the map is an image whose colors are looked
+        up from these labels. This is much faster for generating many maps
+        (e.g., PNG files in batch), but the regions are not vector graphics,
+        and regions with NaN data are not hatched.
+    raster_pixel_size : float or ``None``
+        Size of a pixel (in meters on the map) of the raster image, if
+        ``render`` is 'raster'. If ``None``, it matches the size of a screen
+        pixel of the axes, according to the size and resolution of the axes.
+    scheme : {``None``, 'quantiles', 'equal_interval', 'natural_breaks'}
+        Classification scheme of the data. If ``None``, the colors change
+        continuously with the data. Otherwise, the data are classified into
+        ``k`` classes, each with one color (and the color bar is discrete):
+            - 'quantiles': each class has about the same number of regions
+            - 'equal_interval': the classes have the same width
+            - 'natural_breaks': the Jenks natural breaks (i.e., the classes
+              with the smallest total within-class variance), which suit
+              skewed data
+        ``cmap_midpoint`` is not used if ``scheme`` is not ``None``.
+    k : int
+        Number of classes if ``scheme`` is not ``None``. There can be fewer
+        classes if the data have fewer distinct values.
+    dissolve : bool
+        If ``True``, adjacent counties with the same color are merged before
+        being drawn, so that each color is one compound path, and the county
+        boundaries are not drawn (the state boundaries still are). This makes
+        vector output (such as SVG and PDF files) much smaller and faster to
+        display, especially when ``scheme`` is not ``None`` (i.e., when many
+        neighboring counties share the same color). Only available if
+        ``render`` is 'vector'.
+
+    Returns
+    -------
+    fig : matplotlib.figure.Figure
+        The figure object being created or being passed into this function.
+    ax : matplotlib.axes._subplots.AxesSubplot
+        The axes object being created or being passed into this function.
+
+    References
+    ----------
+    This function is based partly on an example in the Basemap repository
+    (https://github.com/matplotlib/basemap/blob/master/examples/fillstates.py)
+    as well as a modification on Stack Overflow
+    (https://stackoverflow.com/questions/39742305).
+    '''
+    fig, ax, _ = _choropleth_map_county_helper(
+        data_per_county, fig=fig, ax=ax, figsize=figsize, dpi=dpi,
+        vmin=vmin, vmax=vmax, unit=unit, cmap=cmap, map_title=map_title,
+        fontsize=fontsize, cmap_midpoint=cmap_midpoint,
+        shapefile_dir=shapefile_dir, level_of_detail=level_of_detail,
+        insets=insets, render=render, raster_pixel_size=raster_pixel_size,
+        scheme=scheme, k=k, dissolve=dissolve,
+    )
+    return fig, ax  # return figure and axes handles
+
+#%%============================================================================
+class ChoroplethMap():
+    '''
+    A choropleth map (state level or county level) whose data can be updated
+    without redrawing the map.
+
+    The map is drawn once, in the same way as :func:`~choropleth_map_state`
+    or :func:`~choropleth_map_county`. Afterwards, :meth:`update` only
+    recomputes the colors of the existing polygons and the limits of the
+    color bar, which takes milliseconds instead of seconds. This is useful
+    for dashboards that refresh the same map with new data.
+
+    Parameters
+    ----------
+    data : dict or pandas.Series or pandas.DataFrame
+        Numerical data of each state (or county), to be plotted onto the map.
+        See :func:`~choropleth_map_state` (or :func:`~choropleth_map_county`)
+        for the acceptable data types.
+    level : {'state', 'county'}
+        Whether to draw a state-level map or a county-level map.
+    **kwargs :
+        Other keyword arguments to be passed to :func:`~choropleth_map_state`
+        (or :func:`~choropleth_map_county`), such as ``vmin``, ``vmax``,
+        ``cmap``, ``map_title``, ``unit``, ``fig``, and ``ax``.
+
+    Attributes
+    ----------
+    fig : matplotlib.figure.Figure
+        The figure object of the map.
+    ax : matplotlib.axes._subplots.AxesSubplot
+        The axes object of the map.
+
+    Notes
+    -----
+    :meth:`query_point` and :meth:`query_lonlat` find the region under a
+    point using a spatial index (a uniform grid over the bounding boxes of
+    the polygons), so that only a few polygons are tested per query. The
+    index is built on the first query. :meth:`add_hover_annotation` uses it
+    to show the name and the value of the region under the mouse cursor.
+    '''
+    def __init__(self, data, level='county', **kwargs):
+        if level == 'state':
+            fig, ax, handle = _choropleth_map_state_helper(data, **kwargs)
+        elif level == 'county':
+            fig, ax, handle = _choropleth_map_county_helper(data, **kwargs)
+        else:
+            raise ValueError("`level` must be either 'state' or 'county'.")
+
+        self.fig = fig
+        self.ax = ax
+        self.level = level
+        self._handle = handle
+        self._spatial_indices = None
+        self._hover = None
+
+    def __repr__(self):
+        return 'ChoroplethMap (%s level, %d regions)' \
+               % (self.level, len(self._handle['keys']))
+
+    def update(self, data):
+        '''
+        Update the map with new data. Only the colors of the polygons and the
+        color bar are updated; the geometry is not redrawn. (The figure itself
+        is re-rendered the next time it is drawn or saved.)
+
+        Parameters
+        ----------
+        data : dict or pandas.Series or pandas.DataFrame
+            New numerical data of each state (or county). It accepts the same
+            data types as the data used to create this map.
+
+        Returns
+        -------
+        fig : matplotlib.figure.Figure
+            The figure object of the map.
+        ax : matplotlib.axes._subplots.AxesSubplot
+            The axes object of the map.
+        '''
+        h = self._handle
+        if self.level == 'state':
+            data = _preprocess_state_data(data, h['extra_states'])
+        else:
+            data = _preprocess_county_data(data)
+
+        vmin, vmax = _calc_color_limits(data, h['vmin'], h['vmax'])
+        norm = _get_color_norm(
+            vmin, vmax, h['cmap_midpoint'], h['scheme'], h['k'], data.values,
+            h['cmap'].N,
+        )
+        values = data.reindex(h['keys']).values
+        colors, is_nan = _values_to_colors(
+            values, h['cmap'], norm, h['nan_color'],
+        )
+
+        for layer in h['layers']:
+            layer.set_colors(colors, is_nan)
+        h['values'] = values
+
+        _update_colorbar(
+            h['colorbar'], norm, data.values, vmin, vmax, h['fontsize'],
+        )
+
+        return self.fig, self.ax
+
+    def query_point(self, x, y):
+        '''
+        Find the region (state or county) at a point of the map.
+
+        Parameters
+        ----------
+        x, y : float
+            Location of the point, in the data coordinates of the map axes
+            (such as ``event.xdata`` and ``event.ydata`` of a mouse event).
+            Alaska and Hawaii are found at their inset locations.
+
+        Returns
+        -------
+        key : str or ``None``
+            The state name (or the 5-digit county FIPS code) of the region,
+            or ``None`` if there is no region at this point.
+        '''
+        row = self._query_row(lambda k: (x, y))
+        return None if row is None else self._handle['keys'][row]
+
+    def query_lonlat(self, lon, lat):
+        '''
+        Find the region (state or county) at a geographic location.
+
+        Parameters
+        ----------
+        lon, lat : float
+            Longitude and latitude of the location, in degrees.
+
+        Returns
+        -------
+        key : str or ``None``
+            The state name (or the 5-digit county FIPS code) of the region,
+            or ``None`` if there is no region at this location.
+        '''
+        h = self._handle
+
+        def lonlat_to_xy(k):  # the k-th layer: the lower 48, then the insets
+            if k == 0:
+                return h['projection'](lon, lat)
+            inset = h['insets'][k - 1]
+            projection = _get_projection(
+                _LCC_PARAMS if inset['projection'] == 'lcc' else _MERC_PARAMS
+            )
+            x, y = projection(lon, lat)
+            return (
+                x * inset['scale'] + inset['offset'][0],
+                y * inset['scale'] + inset['offset'][1],
+            )
+
+        row = self._query_row(lonlat_to_xy)
+        return None if row is None else h['keys'][row]
+
+    def add_hover_annotation(self, fmt=None, **kwargs):
+        '''
+        Show the name and the value of the region under the mouse cursor as
+        an annotation, which follows the cursor (in interactive backends).
+
+        Parameters
+        ----------
+        fmt : str or ``None``
+            Format string of the annotation text, with the fields ``{key}``
+            (the state name or the county FIPS code), ``{name}``, and
+            ``{value}``. If ``None``, it is '{name}: {value:g}' for state-level
+            maps, and '{name} ({key}): {value:g}' for county-level maps.
+        **kwargs :
+            Other keyword arguments to be passed to ``ax.annotate()``, such as
+            ``bbox`` and ``arrowprops``.
+
+        Returns
+        -------
+        cid : int
+            The connection id of the callback, which can be disconnected via
+            ``fig.canvas.mpl_disconnect(cid)``.
+        '''
+        if fmt is None:
+            fmt = '{name}: {value:g}' if self.level == 'state' \
+                  else '{name} ({key}): {value:g}'
+
+        if self._hover is not None:  # only one annotation at a time
+            self.fig.canvas.mpl_disconnect(self._hover[1])
+            self._hover[0].remove()
+
+        annotate_kwargs = dict(
+            xytext=(10, 10), textcoords='offset points',
+            bbox=dict(boxstyle='round', fc='w', alpha=0.85),
+        )
+        annotate_kwargs.update(kwargs)
+        annotation = self.ax.annotate('', xy=(0, 0), **annotate_kwargs)
+        annotation.set_visible(False)
+
+        def on_move(event):
+            row = None
+            if event.inaxes is self.ax and event.xdata is not None:
+                row = self._query_row(lambda k: (event.xdata, event.ydata))
+
+            if row is None:
+                if annotation.get_visible():
+                    annotation.set_visible(False)
+                    self.fig.canvas.draw_idle()
+                return
+
+            h = self._handle
+            annotation.set_text(fmt.format(
+                key=h['keys'][row], name=h['names'][row],
+                value=h['values'][row],
+            ))
+            annotation.xy = (event.xdata, event.ydata)
+            annotation.set_visible(True)
+            self.fig.canvas.draw_idle()
+
+        cid = self.fig.canvas.mpl_connect('motion_notify_event', on_move)
+        self._hover = (annotation, cid)
+
+        return cid
+
+    def _query_row(self, get_xy):
+        '''
+        Find the position (in the aligned data values) of the polygon that
+        contains a point, where ``get_xy(k)`` returns the location of the
+        point in the coordinates of the k-th layer of polygons. The insets are
+        searched first, because they are drawn on top of the lower 48 states.
+        '''
+        if self._spatial_indices is None:  # build the spatial index on first use
+            self._spatial_indices = [
+                _SpatialIndex(layer.segments) for layer in self._handle['layers']
+            ]
+
+        layers = self._handle['layers']
+        for k in reversed(range(len(layers))):
+            j = self._spatial_indices[k].query(*get_xy(k))
+            if j is not None:
+                return layers[k].rows[j]
+
+        return None
+
+#%%============================================================================
+def choropleth_animation_state(
+        data_per_state, output_path, writer=None, fps=2, dpi=100,
+        map_title='{period}', vmin=None, vmax=None, **kwargs,
+):
+    '''
+    Generate an animated choropleth map of the US, on a state level, with one
+    frame per period (e.g., per month).
+
+    The geometry, the insets, and the color bar are drawn only once. The
+    colors of all the frames are computed in one vectorized pass, and then
+    each frame only swaps the face colors of the existing polygons. Frames
+    are written to ``output_path`` one by one, without keeping every frame in
+    memory.
+
+    Parameters
+    ----------
+    data_per_state : pandas.DataFrame
+        Numerical data of each state and each period. The index should be
+        valid state identifiers (i.e., state full name, abbreviation, or FIPS
+        code), and each column is a period (such as '2017-01').
+    output_path : str
+        Where to write the frames. If it contains a "%" placeholder for the
+        frame number (such as 'frames/map_%04d.png'), each frame is saved as
+        a numbered image file. Otherwise, it is the path of a video or an
+        animated image (such as 'map.mp4' or 'map.gif').
+    writer : str or matplotlib.animation.AbstractMovieWriter or ``None``
+        The movie writer (or its name, such as 'ffmpeg' or 'pillow'). If
+        ``None``, 'ffmpeg' is used if it is available, otherwise 'pillow'.
+        Not used if ``output_path`` is for numbered image files. (Note that
+        the 'pillow' writer holds all the frames in memory until the end.)
+    fps : float
+        Frames per second of the video.
+    dpi : float
+        Figure resolution.
+    map_title : str
+        Title of each frame. "{period}" in it is replaced by the column name
+        of the frame.
+    vmin : float
+        Minimum value to be shown on the map. If ``None``, the minimum value of
+        all the periods is used, so that the colors are comparable across
+        frames.
+    vmax : float
+        Maximum value to be shown on the map. Similar to ``vmin``.
+    **kwargs :
+        Other keyword arguments to be passed to :func:`~choropleth_map_state`,
+        such as ``cmap``, ``unit``, ``fontsize``, ``cmap_midpoint``, etc.
+
+    Returns
+    -------
+    fig : matplotlib.figure.Figure
+        The figure object being created or being passed into this function.
+    ax : matplotlib.axes._subplots.AxesSubplot
+        The axes object being created or being passed into this function.
+    '''
+    return _choropleth_animation_helper(
+        'state', data_per_state, output_path, writer=writer, fps=fps,
+        dpi=dpi, map_title=map_title, vmin=vmin, vmax=vmax, **kwargs
+    )
+
+#%%============================================================================
+def choropleth_animation_county(
+        data_per_county, output_path, writer=None, fps=2, dpi=100,
+        map_title='{period}', vmin=None, vmax=None, **kwargs,
+):
+    '''
+    Generate an animated choropleth map of the US, on a county level, with
+    one frame per period (e.g., per month).
+
+    The geometry, the insets, and the color bar are drawn only once. The
+    colors of all the frames are computed in one vectorized pass, and then
+    each frame only swaps the face colors of the existing polygons. Frames
+    are written to ``output_path`` one by one, without keeping every frame in
+    memory.
+
+    Parameters
+    ----------
+    data_per_county : pandas.DataFrame
+        Numerical data of each county and each period. The index should be
+        valid county identifiers (i.e., 5-digit county FIPS codes), and each
+        column is a period (such as '2017-01').
+    output_path : str
+        Where to write the frames. If it contains a "%" placeholder for the
+        frame number (such as 'frames/map_%04d.png'), each frame is saved as
+        a numbered image file. Otherwise, it is the path of a video or an
+        animated image (such as 'map.mp4' or 'map.gif').
+    writer : str or matplotlib.animation.AbstractMovieWriter or ``None``
+        The movie writer (or its name, such as 'ffmpeg' or 'pillow'). If
+        ``None``, 'ffmpeg' is used if it is available, otherwise 'pillow'.
+        Not used if ``output_path`` is for numbered image files. (Note that
+        the 'pillow' writer holds all the frames in memory until the end.)
+    fps : float
+        Frames per second of the video.
+    dpi : float
+        Figure resolution.
+    map_title : str
+        Title of each frame. "{period}" in it is replaced by the column name
+        of the frame.
+    vmin : float
+        Minimum value to be shown on the map. If ``None``, the minimum value of
+        all the periods is used, so that the colors are comparable across
+        frames.
+    vmax : float
+        Maximum value to be shown on the map. Similar to ``vmin``.
+    **kwargs :
+        Other keyword arguments to be passed to :func:`~choropleth_map_county`,
+        such as ``cmap``, ``unit``, ``fontsize``, ``cmap_midpoint``, etc.
+
+    Returns
+    -------
+    fig : matplotlib.figure.Figure
+        The figure object being created or being passed into this function.
+    ax : matplotlib.axes._subplots.AxesSubplot
+        The axes object being created or being passed into this function.
+    '''
+    return _choropleth_animation_helper(
+        'county', data_per_county, output_path, writer=writer, fps=fps,
+        dpi=dpi, map_title=map_title, vmin=vmin, vmax=vmax, **kwargs
+    )
+
+#%%============================================================================
+def _choropleth_animation_helper(
+        level, data, output_path, writer=None, fps=2, dpi=100,
+        map_title='{period}', vmin=None, vmax=None, **kwargs,
+):
+    '''
+    Helper function of :func:`~choropleth_animation_state` and
+    :func:`~choropleth_animation_county`.
+    '''
+    import matplotlib.animation as animation
+
+    _check_period_data(data)
+    periods = list(data.columns)
+
+    choropleth = ChoroplethMap(
+        data.iloc[:, 0], level=level, dpi=dpi, vmin=vmin, vmax=vmax,
+        map_title=map_title.format(period=periods[0]), **kwargs
+    )
+    fig, ax, h = choropleth.fig, choropleth.ax, choropleth._handle
+
+    #------  align all periods to the polygons, and compute all colors  --------
+    values = _align_period_data(
+        level, data, h['keys'], h.get('extra_states', ()),
+    )
+    is_nan = np.isnan(values)
+
+    # the color bar stays the same in all frames; mark its top/bottom tick
+    # labels according to the data of all the periods
+    vmin, vmax = _calc_color_limits(values.ravel(), vmin, vmax)
+    norm = _get_color_norm(  # the classes (if any) are also of all the periods
+        vmin, vmax, h['cmap_midpoint'], h['scheme'], h['k'], values.ravel(),
+        h['cmap'].N,
+    )
+    _update_colorbar(h['colorbar'], norm, values, vmin, vmax, h['fontsize'])
+    colors = h['cmap'](norm(values), bytes=True)  # uint8, to save memory
+    nan_color = mpl.colors.to_rgba(h['nan_color'])
+
+    #------  write frames one by one  ------------------------------------------
+    def draw_frame(k):
+        colors_k = colors[:, k] / 255.0
+        colors_k[is_nan[:, k]] = nan_color
+        for layer in h['layers']:
+            layer.set_colors(colors_k, is_nan[:, k])
+        h['values'] = values[:, k]
+        ax.title.set_text(map_title.format(period=periods[k]))
+
+    if '%' in output_path:  # numbered image files
+        for k in range(len(periods)):
+            draw_frame(k)
+            fig.savefig(output_path % k, dpi=dpi)
+    else:
+        if writer is None:
+            writer = 'ffmpeg' if animation.writers.is_available('ffmpeg') else 'pillow'
+        if isinstance(writer, str):
+            writer = animation.writers[writer](fps=fps)
+        with writer.saving(fig, output_path, dpi):
+            for k in range(len(periods)):
+                draw_frame(k)
+                writer.grab_frame()
+
+    return fig, ax
+
+#%%============================================================================
+def _check_period_data(data):
+    '''
+    Check that ``data`` is a pandas DataFrame with one column per period.
+    '''
+    if not isinstance(data, pd.DataFrame):
+        raise TypeError(
+            '`data` must be a pandas DataFrame, with each column being a period.'
+        )
+    if data.shape[1] == 0:
+        raise hlp.LengthError('`data` must have at least one column.')
+
+#%%============================================================================
+def _align_period_data(level, data, keys, extra_states=()):
+    '''
+    Align all the periods (columns) of ``data`` to the regions ``keys`` (the
+    state names or the county FIPS codes of the polygons), in one pass.
+
+    Returns
+    -------
+    values : numpy.ndarray
+        The data values, with shape (len(keys), number of periods), and NaN
+        for the regions without data.
+    '''
+    positions = pd.Series(np.arange(data.shape[0]), index=data.index)
+    if level == 'state':
+        positions = _preprocess_state_data(positions, extra_states)
+    else:
+        positions = _preprocess_county_data(positions)
+    positions = positions.reindex(keys).values
+    has_data = ~np.isnan(positions)
+
+    values = np.full((len(keys), data.shape[1]), np.nan)
+    values[has_data] = data.values.astype(float)[positions[has_data].astype(int)]
+
+    return values
+
+#%%============================================================================
+def render_choropleths(jobs, n_workers=None, shapefile_dir=None):
+    '''
+    Render many choropleth maps into image files (such as PNG files) in
+    parallel, over a pool of worker processes.
+
+    Each worker loads the geometry of the maps (from the geometry bundles
+    precompiled by :func:`~build_geometry_bundle`, which are memory-mapped and
+    thus shared among the workers via the OS page cache, or from the shape
+    files) once, and then reuses it for all the jobs that it renders. A job
+    that fails does not stop the other jobs: its error is reported in the
+    returned table instead.
+
+    Parameters
+    ----------
+    jobs : list<tuple>
+        The maps to render. Each job is a tuple ``(data, title, output_path)``
+        or ``(data, title, output_path, options)``, where:
+            - ``data``: numerical data of each state (or county); see
+              :func:`~choropleth_map_state` or :func:`~choropleth_map_county`
+            - ``title``: title of the map
+            - ``output_path``: path of the image file to save the map to
+            - ``options``: a dict of other keyword arguments of
+              :func:`~choropleth_map_state` or :func:`~choropleth_map_county`
+              (such as ``vmin``, ``cmap``, ``dpi``, or ``render``), plus the
+              key 'level' ('state' or 'county'; default: 'county')
+        The data and the options need to be picklable.
+    n_workers : int or ``None``
+        Number of worker processes. If ``None``, it is the number of CPUs. If
+        1, the jobs are rendered one by one in the current process.
+    shapefile_dir : str or ``None``
+        Directory of the shape files (see :func:`~choropleth_map_state`),
+        which applies to all the jobs whose ``options`` do not specify it.
+
+    Returns
+    -------
+    results : pandas.DataFrame
+        One row per job (in the same order as ``jobs``), with these columns:
+            - 'output_path': the path of the image file
+            - 'seconds': time spent on rendering and saving the map
+            - 'error': ``None`` if the job succeeded, otherwise the traceback
+              of the error
+    '''
+    import concurrent.futures
+
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    if not isinstance(n_workers, (int, np.integer)) or n_workers < 1:
+        raise ValueError('`n_workers` must be a positive integer or None.')
+
+    jobs = [_check_render_job(job, shapefile_dir) for job in jobs]
+    levels = sorted(set(options.get('level', 'county') for _, _, _, options in jobs))
+
+    if n_workers == 1 or len(jobs) <= 1:
+        _init_render_worker(shapefile_dir, levels, switch_backend=False)
+        outcomes = [_render_choropleth_job(job) for job in jobs]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=min(n_workers, len(jobs)),
+            initializer=_init_render_worker, initargs=(shapefile_dir, levels),
+        ) as executor:
+            outcomes = list(executor.map(_render_choropleth_job, jobs))
+
+    results = pd.DataFrame(
+        {
+            'output_path': [job[2] for job in jobs],
+            'seconds': [seconds for seconds, _ in outcomes],
+            'error': pd.Series([error for _, error in outcomes], dtype=object),
+        },
+        index=pd.RangeIndex(len(jobs), name='job'),
+    )
+
+    return results
+
+#%%============================================================================
+def _check_render_job(job, shapefile_dir):
+    '''
+    Check a job of :func:`~render_choropleths`, and return it as a tuple of
+    ``(data, title, output_path, options)``, where ``options`` is a new dict
+    that includes ``shapefile_dir`` (unless it is already specified).
+    '''
+    if not isinstance(job, (tuple, list)) or len(job) not in [3, 4]:
+        raise ValueError(
+            'Each job must be a tuple of (data, title, output_path) or '
+            '(data, title, output_path, options).'
+        )
+
+    data, title, output_path = job[:3]
+    options = dict(job[3]) if len(job) == 4 and job[3] is not None else {}
+    options.setdefault('shapefile_dir', shapefile_dir)
+
+    return data, title, output_path, options
+
+#%%============================================================================
+def _init_render_worker(shapefile_dir, levels, switch_backend=True):
+    '''
+    Initialize a worker of :func:`~render_choropleths`: load the geometry of
+    the maps of ``levels`` (a list of 'state' and/or 'county') into the map
+    cache of the worker, and (if ``switch_backend``) use the non-interactive
+    Agg backend.
+    '''
+    import pkg_resources
+
+    if switch_backend:
+        plt.switch_backend('Agg')
+
+    if shapefile_dir is None:
+        shapefile_dir = pkg_resources.resource_filename('plot_utils', 'shapefiles/')
+
+    shp_paths = [os.path.join(shapefile_dir, 'usa_states', 'st99_d00')]
+    if 'county' in levels:
+        shp_paths.append(
+            os.path.join(shapefile_dir, 'usa_counties', 'cb_2016_us_county_500k')
+        )
+
+    for shp_path in shp_paths:
+        for proj_params in [_LCC_PARAMS, _MERC_PARAMS]:
+            try:
+                _read_shapefile_cached(
+                    _get_projection(proj_params), proj_params, shp_path,
+                )
+            except IOError:  # reported by the jobs that need this shape file
+                pass
+
+#%%============================================================================
+def _render_choropleth_job(job):
+    '''
+    Render one job of :func:`~render_choropleths` (checked by
+    :func:`~_check_render_job`), and return the time spent (in seconds) and
+    the error traceback (``None`` if there is no error).
+    '''
+    import time
+    import traceback
+
+    data, title, output_path, options = job
+    options = dict(options)
+    level = options.pop('level', 'county')
+
+    existing_figures = set(plt.get_fignums())
+    t0 = time.perf_counter()
+    try:
+        if level == 'state':
+            fig, _ = choropleth_map_state(data, map_title=title, **options)
+        elif level == 'county':
+            fig, _ = choropleth_map_county(data, map_title=title, **options)
+        else:
+            raise ValueError("`level` must be either 'state' or 'county'.")
+        fig.savefig(output_path)
+        error = None
+    except Exception:
+        error = traceback.format_exc()
+    finally:  # close the figures of this job, even if it failed halfway
+        for num in set(plt.get_fignums()) - existing_figures:
+            plt.close(num)
+
+    return time.perf_counter() - t0, error
+
+#%%============================================================================
+def aggregate_points_to_regions(
+        lon, lat, values=None, agg='count', level='county',
+        shapefile_dir=None, chunk_size=200000,
+):
+    '''
+    Aggregate points (such as geocoded events) to the counties (or the
+    states) that they are in. The result can be directly plotted by
+    :func:`~choropleth_map_county` (or :func:`~choropleth_map_state`).
+
+    The points are processed in chunks (see :class:`~_RegionLocator`). Most
+    points are located by their cells in a fine grid, and only the points
+    in the grid cells that region boundaries pass through are tested against
+    the candidate regions from a bounding-box index (with vectorized
+    point-in-polygon tests).
+
+    Parameters
+    ----------
+    lon : list or numpy.ndarray or pandas.Series
+        Longitudes of the points, in degrees.
+    lat : list or numpy.ndarray or pandas.Series
+        Latitudes of the points, in degrees.
+    values : list or numpy.ndarray or pandas.Series or ``None``
+        Numerical values of the points, to be aggregated if ``agg`` is 'sum'
+        or 'mean'. NaN values are ignored.
+    agg : {'count', 'sum', 'mean'}
+        How the points in each region are aggregated: the number of points,
+        or the sum (or mean) of their ``values``.
+    level : {'county', 'state'}
+        Whether to aggregate the points to the counties or to the states.
+    shapefile_dir : str
+        Directory where shape files are stored (see
+        :func:`~choropleth_map_state`). If ``None``, the shapefile directory
+        within this library will be used.
+    chunk_size : int
+        Number of points to process at a time, which limits the memory usage.
+
+    Returns
+    -------
+    aggregated : pandas.Series
+        The aggregated values, indexed by the 5-digit county FIPS codes (or
+        the state names). Regions without points are 0 (if ``agg`` is 'count'
+        or 'sum') or NaN (if ``agg`` is 'mean'). Points outside of all the
+        regions are not counted.
+    '''
+    import pkg_resources
+
+    if agg not in ['count', 'sum', 'mean']:
+        raise ValueError("`agg` must be 'count', 'sum', or 'mean'.")
+    if level not in ['county', 'state']:
+        raise ValueError("`level` must be either 'state' or 'county'.")
+
+    lon = np.asarray(lon, dtype=float).ravel()
+    lat = np.asarray(lat, dtype=float).ravel()
+    if len(lon) != len(lat):
+        raise hlp.LengthError('`lon` and `lat` must have the same length.')
+    if agg == 'count':
+        values = np.ones(len(lon))
+    elif values is None:
+        raise ValueError('`values` must be provided if `agg` is "%s".' % agg)
+    else:
+        values = np.asarray(values, dtype=float).ravel()
+        if len(values) != len(lon):
+            raise hlp.LengthError('`values` must have the same length as `lon`.')
+
+    if shapefile_dir is None:
+        shapefile_dir = pkg_resources.resource_filename('plot_utils', 'shapefiles/')
+    if level == 'county':
+        shp_path = os.path.join(shapefile_dir, 'usa_counties', 'cb_2016_us_county_500k')
+    else:
+        shp_path = os.path.join(shapefile_dir, 'usa_states', 'st99_d00')
+
+    m = _get_projection(_LCC_PARAMS)
+    try:
+        segments, table = _read_shapefile_cached(m, _LCC_PARAMS, shp_path)
+    except IOError:
+        raise IOError(
+            'Shape files not found. Specify the location of the "shapefiles" folder.'
+        )
+
+    keys = table.index.values if level == 'county' else table['NAME'].values
+    region_codes, regions = pd.factorize(keys)
+    locator = _RegionLocator(segments, region_codes, table['SHAPENUM'].values)
+
+    sums = np.zeros(len(regions))
+    counts = np.zeros(len(regions), dtype=np.int64)
+    for start in range(0, len(lon), chunk_size):
+        x, y = m(lon[start:start + chunk_size], lat[start:start + chunk_size])
+        chunk_values = values[start:start + chunk_size]
+        codes = locator.locate(x, y)
+        found = (codes >= 0) & ~np.isnan(chunk_values)
+        sums += np.bincount(
+            codes[found], weights=chunk_values[found], minlength=len(regions),
+        )
+        counts += np.bincount(codes[found], minlength=len(regions))
+
+    if agg == 'count':
+        aggregated = counts.astype(float)
+    elif agg == 'sum':
+        aggregated = sums
+    else:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            aggregated = np.where(counts > 0, sums / counts, np.nan)
+
+    return pd.Series(aggregated, index=regions)
+
+#%%============================================================================
+class _RegionLocator():
+    '''
+    Find the regions that many points are in, for
+    :func:`~aggregate_points_to_regions`.
+
+    A fine grid is laid over the polygons. A grid cell that no polygon edge
+    passes through is entirely inside one region (or outside of all regions),
+    so it is located once (by its center), and all the points in it are in
+    the same region. Only the points in the other grid cells are tested
+    against the polygons, i.e., the candidates found by a
+    :class:`~_SpatialIndex` on the same grid.
+
+    Parameters
+    ----------
+    segments : list<numpy.ndarray>
+        Vertices of each polygon.
+    region_codes : numpy.ndarray
+        The region (an integer code) of each polygon.
+    shape_ids : numpy.ndarray
+        The shape (e.g., the shape number in the shapefile) of each polygon.
+        A region can have several shapes, and a shape can have several
+        polygons (including holes), so a point is in a shape if it is in an
+        odd number of the polygons of the shape.
+    n_cells : int
+        Approximate number of grid cells.
+    '''
+    def __init__(self, segments, region_codes, shape_ids, n_cells=2**19):
+        from matplotlib.path import Path
+
+        self.region_codes = np.asarray(region_codes)
+        self.shape_codes = pd.factorize(np.asarray(shape_ids))[0]
+        self.paths = [Path(np.asarray(seg).reshape(-1, 2)) for seg in segments]
+        self.index = _SpatialIndex(
+            segments, cells_per_polygon=n_cells / max(len(segments), 1),
+        )
+        if self.index._cell_size is None:  # no polygons at all
+            return
+
+        #------  mark the grid cells that polygon edges pass through  ---------
+        lengths = np.array([len(seg) for seg in segments], dtype=np.int64)
+        vertices = np.concatenate(
+            [np.asarray(seg, dtype=np.float64).reshape(-1, 2) for seg in segments]
+        )
+        is_last = np.zeros(len(vertices), dtype=bool)
+        is_last[np.cumsum(lengths)[lengths > 0] - 1] = True
+        p0, p1 = vertices[:-1][~is_last[:-1]], vertices[1:][~is_last[:-1]]
+        lo = self.index._get_cell(*np.minimum(p0, p1).T)
+        hi = self.index._get_cell(*np.maximum(p0, p1).T)
+        widths = hi[0] - lo[0] + 1
+        counts = widths * (hi[1] - lo[1] + 1)
+        offsets = np.cumsum(counts) - counts
+        local = np.arange(counts.sum()) - np.repeat(offsets, counts)
+        cell_x = np.repeat(lo[0], counts) + local % np.repeat(widths, counts)
+        cell_y = np.repeat(lo[1], counts) + local // np.repeat(widths, counts)
+        nx, ny = self.index._shape
+        self.is_boundary_cell = np.zeros(nx * ny, dtype=bool)
+        self.is_boundary_cell[cell_y * nx + cell_x] = True
+
+        #------  locate the other cells by their centers  ----------------------
+        self.cell_codes = np.full(nx * ny, -1, dtype=np.int64)
+        inner_cells = np.flatnonzero(~self.is_boundary_cell)
+        size = self.index._cell_size
+        centers_x = self.index._origin[0] + (inner_cells % nx + 0.5) * size
+        centers_y = self.index._origin[1] + (inner_cells // nx + 0.5) * size
+        self.cell_codes[inner_cells] = self._test_points(centers_x, centers_y)
+
+    def locate(self, x, y):
+        '''
+        Find the region of each point (x, y).
+
+        Returns
+        -------
+        codes : numpy.ndarray
+            The region code of each point, or -1 if a point is outside of all
+            the regions (or is not finite).
+        '''
+        x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+        codes = np.full(len(x), -1, dtype=np.int64)
+        if self.index._cell_size is None:
+            return codes
+
+        x0, y0 = self.index._origin
+        x1, y1 = self.index._origin + self.index._shape * self.index._cell_size
+        valid = np.flatnonzero(
+            (x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)
+        )  # (NaN and inf are not valid either)
+        ix, iy = self.index._get_cell(x[valid], y[valid])
+        cells = iy * self.index._shape[0] + ix
+
+        on_boundary = self.is_boundary_cell[cells]
+        codes[valid[~on_boundary]] = self.cell_codes[cells[~on_boundary]]
+        tested = valid[on_boundary]
+        codes[tested] = self._test_points(x[tested], y[tested])
+
+        return codes
+
+    def _test_points(self, x, y):
+        '''
+        Find the region of each point (x, y) by testing it against all its
+        candidate polygons. Each polygon tests all its candidate points at
+        once. A point on the border of two regions is in the region of the
+        first polygon.
+        '''
+        point_index, polygon_index = self.index.query_candidates(x, y)
+        order = np.argsort(polygon_index, kind='stable')
+        point_index, polygon_index = point_index[order], polygon_index[order]
+
+        xy = np.column_stack([x, y])
+        bounds = np.r_[0, np.flatnonzero(np.diff(polygon_index)) + 1, len(order)]
+        is_inside = np.zeros(len(order), dtype=bool)
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            if b > a:
+                is_inside[a:b] = self.paths[polygon_index[a]].contains_points(
+                    xy[point_index[a:b]]
+                )
+
+        hits = pd.DataFrame({
+            'point': point_index[is_inside],
+            'shape': self.shape_codes[polygon_index[is_inside]],
+            'region': self.region_codes[polygon_index[is_inside]],
+        })
+        n_polygons = hits.groupby(['point', 'shape', 'region']).size()
+        inside = n_polygons[n_polygons % 2 == 1].reset_index()
+        inside = inside.drop_duplicates('point')
+
+        codes = np.full(len(x), -1, dtype=np.int64)
+        codes[inside['point'].values] = inside['region'].values
+
+        return codes
+
+#%%============================================================================
+def choropleth_to_geojson(
+        data, level='state', cmap='OrRd', vmin=None, vmax=None,
+        cmap_midpoint=None, scheme=None, k=5, shapefile_dir=None,
+        level_of_detail='auto', insets=None, quantization=10000,
+        periods=False,
+):
+    '''
+    Export a choropleth map of the US (on a state or county level) as GeoJSON,
+    for rendering on the client side (e.g., in a web browser). The regions
+    are in the same map projection and inset layout as in
+    :func:`~choropleth_map_state` and :func:`~choropleth_map_county`, and
+    are colored in the same way, but no matplotlib figure is drawn.
+
+    The coordinates are projected map coordinates (in meters). If
+    ``quantization`` is not ``None``, they are quantized and delta-encoded
+    integers (as in TopoJSON): the first vertex of each ring is absolute,
+    and each following vertex is the difference from the previous vertex.
+    A vertex is decoded by the cumulative sums of the integers, as
+    ``x = sum_x * scale[0] + translate[0]`` (and the same for y), where
+    ``scale`` and ``translate`` are in the "transform" member of the output.
+
+    Parameters
+    ----------
+    data : dict or pandas.Series or pandas.DataFrame
+        Numerical data of each state (or county). It accepts the same data
+        types as :func:`~choropleth_map_state` (or
+        :func:`~choropleth_map_county`). If ``periods`` is ``True``, it must
+        be a pandas DataFrame whose index is the states (or counties), with
+        one column per period (as in :func:`~choropleth_animation_state`).
+    level : {'state', 'county'}
+        Level of the map.
+    cmap, vmin, vmax, cmap_midpoint, scheme, k, shapefile_dir, insets :
+        See :func:`~choropleth_map_state`. If ``periods`` is ``True``,
+        ``vmin``, ``vmax`` and the classes (if any) are of all the periods.
+    level_of_detail : {'auto', int, ``None``}
+        How much the polygons are simplified (see
+        :func:`~choropleth_map_state`). If 'auto', the removed details are
+        smaller than the quantization step (or nothing is removed, if
+        ``quantization`` is ``None``).
+    quantization : int or ``None``
+        Number of distinct coordinate values along the longer side of the map
+        region. If ``None``, the coordinates are neither quantized nor
+        delta-encoded.
+    periods : bool
+        If ``True``, the geometry is exported only once (without data), and
+        the data values and colors of all the periods are returned
+        separately as a table, so that the client can switch between the
+        periods by updating only the colors.
+
+    Returns
+    -------
+    geojson : dict
+        The GeoJSON FeatureCollection (to be serialized with ``json.dump()``).
+        Each feature is a region (with the state name or the county FIPS code
+        as its "id"), with the properties "name", and (if ``periods`` is
+        ``False``) "value" and "fill" (its color, such as "#fdd49e"). The
+        "legend" member contains ``vmin``, ``vmax``, and the class breaks (if
+        ``scheme`` is not ``None``).
+    table : dict
+        (Only if ``periods`` is ``True``.) The members "ids" (of the
+        regions), "periods" (the column names of ``data``), "values" and
+        "fills" (one list per period, in the order of "ids"), and "legend".
+    '''
+    export = _get_choropleth_export(
+        data, level, cmap=cmap, vmin=vmin, vmax=vmax,
+        cmap_midpoint=cmap_midpoint, scheme=scheme, k=k,
+        shapefile_dir=shapefile_dir, level_of_detail=level_of_detail,
+        insets=insets, quantization=quantization, periods=periods,
+    )
+
+    features = []
+    for j, key in enumerate(export['keys']):
+        polygons = _group_rings_into_polygons(export['rings'][j])
+        properties = dict(name=export['names'][j])
+        if not periods:
+            properties['value'] = export['values'][0][j]
+            properties['fill'] = export['fills'][0][j]
+        features.append(dict(
+            type='Feature', id=key, properties=properties,
+            geometry=dict(
+                type='MultiPolygon',
+                coordinates=[  # right-hand rule: exterior rings go CCW
+                    [_encode_ring(ring[::-1], quantization) for ring in polygon]
+                    for polygon in polygons
+                ],
+            ),
+        ))
+
+    geojson = dict(type='FeatureCollection', features=features)
+    if quantization is not None:
+        geojson['transform'] = dict(
+            scale=[export['scale']] * 2, translate=list(export['translate']),
+        )
+    if not periods:
+        geojson['legend'] = export['legend']
+        return geojson
+
+    return geojson, _get_export_table(export)
+
+#%%============================================================================
+def choropleth_to_svg(
+        data, level='state', cmap='OrRd', vmin=None, vmax=None,
+        cmap_midpoint=None, scheme=None, k=5, shapefile_dir=None,
+        level_of_detail='auto', insets=None, quantization=10000, width=960,
+        periods=False,
+):
+    '''
+    Export a choropleth map of the US (on a state or county level) as an SVG
+    image, without drawing a matplotlib figure. The regions are in the same
+    map projection and inset layout as in :func:`~choropleth_map_state` and
+    :func:`~choropleth_map_county`, and are colored in the same way.
+
+    Each region is one ``<path>`` element (with a ``data-id`` attribute of
+    its state name or county FIPS code). The coordinates are quantized
+    integers, and are relative (i.e., delta-encoded) except for the first
+    vertex of each ring, which keeps the file small.
+
+    Parameters
+    ----------
+    data : dict or pandas.Series or pandas.DataFrame
+        Numerical data of each state (or county). See
+        :func:`~choropleth_to_geojson`.
+    level : {'state', 'county'}
+        Level of the map.
+    cmap, vmin, vmax, cmap_midpoint, scheme, k, shapefile_dir, insets :
+        See :func:`~choropleth_map_state`.
+    level_of_detail : {'auto', int, ``None``}
+        See :func:`~choropleth_to_geojson`.
+    quantization : int
+        Number of distinct coordinate values along the longer side of the map
+        region (i.e., the width or height of the "viewBox" of the image).
+    width : float
+        Width of the image, in pixels.
+    periods : bool
+        If ``True``, the regions are not filled (so the image is only the
+        geometry), and the data values and colors of all the periods are
+        returned separately as a table (see :func:`~choropleth_to_geojson`).
+
+    Returns
+    -------
+    svg : str
+        The SVG image.
+    table : dict
+        (Only if ``periods`` is ``True``.) See :func:`~choropleth_to_geojson`.
+    '''
+    if quantization is None:
+        raise ValueError('`quantization` of the SVG image must be an integer.')
+
+    export = _get_choropleth_export(
+        data, level, cmap=cmap, vmin=vmin, vmax=vmax,
+        cmap_midpoint=cmap_midpoint, scheme=scheme, k=k,
+        shapefile_dir=shapefile_dir, level_of_detail=level_of_detail,
+        insets=insets, quantization=quantization, periods=periods,
+    )
+
+    size_x, size_y = export['size']
+    lines = [
+        '<svg xmlns="http://www.w3.org/2000/svg" width="%d" height="%d" '
+        'viewBox="0 0 %d %d">' % (
+            width, round(width * size_y / size_x), size_x, size_y,
+        ),
+        '<style>path{stroke:#bfbfbf;stroke-width:0.5px;'
+        'vector-effect:non-scaling-stroke}</style>',
+    ]
+    for j, key in enumerate(export['keys']):
+        d = []
+        for ring in export['rings'][j]:  # the y axis of SVG points down
+            deltas = _encode_ring(ring * [1, -1] + [0, size_y], quantization)
+            d.append('M%d %dl%sz' % (
+                deltas[0][0], deltas[0][1],
+                ' '.join('%d %d' % tuple(delta) for delta in deltas[1:-1]),
+            ))
+        fill = '' if periods else ' fill="%s"' % export['fills'][0][j]
+        lines.append('<path data-id="%s"%s d="%s"/>' % (
+            _escape_xml(key), fill, ''.join(d),
+        ))
+    lines.append('</svg>')
+    svg = '\n'.join(lines)
+
+    if not periods:
+        return svg
+
+    return svg, _get_export_table(export)
+
+#%%============================================================================
+def _get_choropleth_export(
+        data, level, cmap='OrRd', vmin=None, vmax=None, cmap_midpoint=None,
+        scheme=None, k=5, shapefile_dir=None, level_of_detail='auto',
+        insets=None, quantization=10000, periods=False,
+):
+    '''
+    Helper function of :func:`~choropleth_to_geojson` and
+    :func:`~choropleth_to_svg`. It projects the regions (with the same
+    inset layout as the choropleth maps), quantizes their coordinates, and
+    computes the colors of the data.
+
+    Returns
+    -------
+    export : dict
+        With these keys:
+            - 'keys', 'names': the state names (or county FIPS codes) and the
+              names of the regions
+            - 'rings': for each region, a list of its polygon rings (arrays
+              of vertices, quantized if ``quantization`` is not ``None``)
+            - 'scale', 'translate', 'size': the quantization step, the
+              origin, and the numbers of quantization steps along x and y
+            - 'periods', 'values', 'fills': the periods, and the data values
+              and colors of the regions in each period
+            - 'legend': ``vmin``, ``vmax``, and the class breaks (if any)
+    '''
+    import pkg_resources
+
+    if level not in ['state', 'county']:
+        raise ValueError("`level` must be either 'state' or 'county'.")
+    if quantization is not None and not quantization > 1:
+        raise ValueError('`quantization` must be larger than 1.')
+    if periods:
+        _check_period_data(data)
+
+    insets = _get_inset_layout(insets)
+    m = _get_projection(_LCC_PARAMS)
+
+    #---------  quantization grid, and the level of detail  --------------------
+    translate = (m.xmin, m.ymin)
+    if quantization is None:
+        scale = 1.0
+        size = (m.xmax - m.xmin, m.ymax - m.ymin)
+    else:
+        scale = max(m.xmax - m.xmin, m.ymax - m.ymin) / (quantization - 1)
+        size = (
+            int(np.ceil((m.xmax - m.xmin) / scale)),
+            int(np.ceil((m.ymax - m.ymin) / scale)),
+        )
+    if level_of_detail == 'auto':  # smaller than the quantization step
+        level_of_detail = None if quantization is None else max(
+            j for j, tol in enumerate(_LOD_TOLERANCES) if tol <= scale / 2.0
+        )
+
+    #---------  regions, in the same layout as the maps  -----------------------
+    if shapefile_dir is None:
+        shapefile_dir = pkg_resources.resource_filename('plot_utils', 'shapefiles/')
+    if level == 'state':
+        shp_path = os.path.join(shapefile_dir, 'usa_states', 'st99_d00')
+    else:
+        shp_path = os.path.join(
+            shapefile_dir, 'usa_counties', 'cb_2016_us_county_500k',
+        )
+    tol = _get_lod_tolerance(level_of_detail, None, None, m)
+    try:
+        segments, table = _read_shapefile_cached(
+            m, _LCC_PARAMS, shp_path, tolerance=tol,
+        )
+    except IOError:
+        raise IOError(
+            'Shape files not found. Specify the location of the "shapefiles" folder.'
+        )
+
+    is_inset = table['STATEFP'].isin([inset['state'] for inset in insets]).values
+    if level == 'state':
+        row_keys = table['NAME'].values
+        extra_states = sorted(set(row_keys[is_inset]) - set(_STATES_AND_DC))
+        rows = np.flatnonzero(  # skip DC and Puerto Rico, and the inset states
+            ~np.isin(row_keys, ['Puerto Rico', 'District of Columbia'])
+            & ~is_inset
+        )
+    else:
+        row_keys = table.index.values
+        extra_states = ()
+        rows = np.flatnonzero(~is_inset)
+
+    all_rows = [rows]
+    all_segments = [segments[j] for j in rows]
+    for inset in insets:
+        inset_segments, inset_rows = _get_inset_segments(
+            inset, shp_path, level_of_detail, None, None, m,
+        )
+        all_rows.append(inset_rows)
+        all_segments.extend(inset_segments)
+    all_rows = np.concatenate(all_rows)
+
+    region_codes, keys = pd.factorize(row_keys[all_rows])
+    names = pd.Series(table['NAME'].values[all_rows]).groupby(region_codes).first()
+    rings = [[] for _ in range(len(keys))]
+    for code, seg in zip(region_codes, all_segments):
+        ring = (np.asarray(seg, dtype=np.float64).reshape(-1, 2) - translate) / scale
+        if quantization is not None:
+            ring = np.round(ring).astype(np.int64)
+            n_distinct = 1 + np.count_nonzero(np.any(np.diff(ring, axis=0) != 0, axis=1))
+            if n_distinct < 4:  # collapsed into a point or a line
+                continue
+        rings[code].append(ring)
+
+    #---------  data values and colors  ----------------------------------------
+    if periods:
+        values = _align_period_data(level, data, keys, extra_states)
+        period_labels = list(data.columns)
+    else:
+        if level == 'state':
+            data = _preprocess_state_data(data, extra_states)
+        else:
+            data = _preprocess_county_data(data)
+        values = data.reindex(keys).values[:, None]
+        period_labels = [None]
+
+    cmap = plt.get_cmap(cmap)
+    vmin_, vmax_ = _calc_color_limits(values.ravel(), vmin, vmax)
+    norm = _get_color_norm(
+        vmin_, vmax_, cmap_midpoint, scheme, k, values.ravel(), cmap.N,
+    )
+    nan_color = [0.93] * 3  # the same as on the maps
+    colors, is_nan = _values_to_colors(values.ravel(), cmap, norm, nan_color)
+    unique_colors, inverse = np.unique(
+        np.round(colors[:, :3] * 255).astype(int), axis=0, return_inverse=True,
+    )
+    hex_colors = ['#%02x%02x%02x' % tuple(rgb) for rgb in unique_colors]
+    fills = np.array(hex_colors, dtype=object)[inverse.ravel()].reshape(values.shape)
+
+    legend = dict(vmin=float(vmin_), vmax=float(vmax_))
+    if scheme is not None:
+        legend['breaks'] = [float(b) for b in norm.boundaries]
+
+    return dict(
+        keys=[str(key) for key in keys], names=list(names.values), rings=rings,
+        scale=scale, translate=translate, size=size, periods=period_labels,
+        values=[
+            [None if np.isnan(v) else float(v) for v in column]
+            for column in values.T
+        ],
+        fills=[list(column) for column in fills.T], legend=legend,
+    )
+
+#%%============================================================================
+def _group_rings_into_polygons(rings):
+    '''
+    Group the rings of a region into polygons (as in GeoJSON): each exterior
+    ring (clockwise, as in shapefiles) is followed by its holes (the
+    counterclockwise rings inside it). A hole that is not inside any exterior
+    ring becomes a polygon of its own.
+    '''
+    areas = np.array([
+        np.sum(
+            ring[:-1, 0] * ring[1:, 1] - ring[1:, 0] * ring[:-1, 1],
+            dtype=np.float64,
+        )
+        for ring in rings
+    ])  # twice the signed areas (negative if clockwise)
+
+    polygons = [[ring] for ring, area in zip(rings, areas) if area <= 0]
+    exterior_areas = [-area for area in areas if area <= 0]
+    for ring, area in zip(rings, areas):
+        if area <= 0:
+            continue
+        containing = [  # the smallest exterior ring that contains the hole
+            (exterior_areas[i], i) for i, polygon in enumerate(polygons)
+            if _point_in_polygon(ring[0, 0], ring[0, 1], polygon[0])
+        ]
+        if containing:
+            polygons[min(containing)[1]].append(ring)
+        else:
+            polygons.append([ring])
+
+    return polygons
+
+#%%============================================================================
+def _encode_ring(ring, quantization):
+    '''
+    Delta-encode the quantized vertices ``ring`` (the first vertex stays
+    absolute), without the repeated vertices (i.e., the zero deltas). If
+    ``quantization`` is ``None``, the vertices are only converted to a list.
+    '''
+    if quantization is None:
+        return ring.tolist()
+
+    deltas = np.diff(ring, axis=0)
+    deltas = deltas[np.any(deltas != 0, axis=1)]
+
+    return np.concatenate([ring[:1], deltas]).tolist()
+
+#%%============================================================================
+def _get_export_table(export):
+    '''
+    Return the table of the data values and the colors of all the periods,
+    from the results of :func:`~_get_choropleth_export`.
+    '''
+    return dict(
+        ids=export['keys'], periods=[str(p) for p in export['periods']],
+        values=export['values'], fills=export['fills'],
+        legend=export['legend'],
+    )
+
+#%%============================================================================
+def _escape_xml(text):
+    '''
+    Escape the special characters of XML in ``text``.
+    '''
+    return str(text).replace('&', '&amp;').replace('<', '&lt;') \
+                    .replace('>', '&gt;').replace('"', '&quot;')
+
+#%%============================================================================
+def _choropleth_map_state_helper(
+        data_per_state, fig=None, ax=None, figsize=(10,7),
+        dpi=100, vmin=None, vmax=None, map_title='USA map',
+        unit='', cmap='OrRd', fontsize=14, cmap_midpoint=None,
+        shapefile_dir=None, level_of_detail='auto', insets=None,
+        render='vector', raster_pixel_size=None, scheme=None, k=5,
+):
+    '''
+    Helper function of :func:`~choropleth_map_state`. It draws the map, and
+    additionally returns a dict of the drawn artists (and of the information
+    needed to update their colors), which is used by :class:`~ChoroplethMap`.
+    '''
+    import pkg_resources
+
+    insets = _get_inset_layout(insets)
+
+    fig, ax = hlp._process_fig_ax_objects(fig, ax, figsize, dpi)
+
+    m = _get_projection(_LCC_PARAMS)  # Lambert Conformal: lower 48 states
+    m_ = _get_projection(_MERC_PARAMS)  # Mercator: Alaska and Hawaii
+
+    #---------   draw state boundaries  ----------------------------------------
+    if shapefile_dir is None:
+        shapefile_dir = pkg_resources.resource_filename('plot_utils', 'shapefiles/')
+    shp_path_state = os.path.join(shapefile_dir, 'usa_states', 'st99_d00')
+    tol = _get_lod_tolerance(level_of_detail, fig, ax, m)
+    try:
+        m_states, states_table = _read_shapefile_cached(
+            m, _LCC_PARAMS, shp_path_state, tolerance=tol,
+        )
+        arcs, owners, _ = _read_shapefile_cached(
+            m, _LCC_PARAMS, shp_path_state, tolerance=tol, arcs=True,
+        )
+    except IOError:
+        raise IOError('Shape files not found. Specify the location of the "shapefiles" folder.')
+
+    # states in the insets other than the 50 states and DC (e.g., Puerto Rico)
+    statenames = states_table['NAME'].values
+    is_inset = states_table['STATEFP'].isin(
+        [inset['state'] for inset in insets]
+    ).values
+    extra_states = sorted(set(statenames[is_inset]) - set(_STATES_AND_DC))
+
+    _draw_boundaries(  # the inset states are not at their actual locations
+        m, ax, _select_arcs(arcs, owners, ~is_inset),
+        linewidth=0.45, color='gray',
+    )
+
+    data_per_state = _preprocess_state_data(data_per_state, extra_states)
+
+    #-------- choose a color for each state based on population density. -------
+    cmap = plt.get_cmap(cmap)
+    vmin_, vmax_ = _calc_color_limits(data_per_state, vmin, vmax)
+    norm = _get_color_norm(
+        vmin_, vmax_, cmap_midpoint, scheme, k, data_per_state.values, cmap.N,
+    )
+
+    # align data to the order of the polygons, and map to colors in one pass
+    values = data_per_state.reindex(statenames).values
+    nan_color = [0.93] * 3  # light grey, with hatching pattern, for NaN data
+    colors, is_nan = _values_to_colors(values, cmap, norm, nan_color)
+
+    #---------  cycle through state names, color each one.  --------------------
+    add_layer = _get_layer_factory(render, raster_pixel_size, fig, ax, m)
+
+    rows = np.flatnonzero(  # skip DC and Puerto Rico, and the inset states
+        ~np.isin(statenames, ['Puerto Rico', 'District of Columbia'])
+        & ~is_inset
+    )
+    layers = [
+        add_layer(
+            ax, [m_states[nshape] for nshape in rows], rows,
+            edge_follows_face=True,
+            nan_style=dict(facecolors=nan_color, edgecolors=[0.4]*3, hatch='\\'),
+        ),
+    ]
+
+    for inset in insets:  # one collection per inset
+        inset_segments, inset_rows = _get_inset_segments(
+            inset, shp_path_state, level_of_detail, fig, ax, m,
+        )
+        layers.append(
+            add_layer(
+                ax, inset_segments, inset_rows,
+                edgecolors='gray', linewidths=.45,
+                nan_style=dict(
+                    facecolors=nan_color, edgecolors='gray',
+                    linewidths=.45, hatch='\\',
+                ),
+            )
+        )
+
+    for layer in layers:
+        layer.set_colors(colors, is_nan)
+
+    ax.set_title(map_title)
+
+    _draw_inset_bounding_boxes(m_, ax)
+
+    #---------   Show color bar  ---------------------------------------
+    cb = _add_colorbar(
+        ax, cmap, norm, unit, data_per_state.values, vmin_, vmax_,
+    )
+
+    #---------   Set overall font size  --------------------------------
+    for o in fig.findobj(mpl.text.Text):
+        o.set_fontsize(fontsize)
+
+    handle = dict(
+        keys=statenames, names=statenames, values=values, layers=layers,
+        colorbar=cb, cmap=cmap, vmin=vmin, vmax=vmax,
+        cmap_midpoint=cmap_midpoint, nan_color=nan_color, fontsize=fontsize,
+        extra_states=extra_states, projection=m, insets=insets,
+        scheme=scheme, k=k,
+    )
+
+    return fig, ax, handle
+
+#%%============================================================================
+def _choropleth_map_county_helper(
+        data_per_county, fig=None, ax=None, figsize=(10,7),
+        dpi=100, vmin=None, vmax=None, unit='', cmap='OrRd',
+        map_title='USA county map', fontsize=14,
+        cmap_midpoint=None, shapefile_dir=None, level_of_detail='auto',
+        insets=None, render='vector', raster_pixel_size=None, scheme=None,
+        k=5, dissolve=False,
+    ):
+    '''
+    Helper function of :func:`~choropleth_map_county`. It draws the map, and
+    additionally returns a dict of the drawn artists (and of the information
+    needed to update their colors), which is used by :class:`~ChoroplethMap`.
+    '''
+    import pkg_resources
+
+    if dissolve and render != 'vector':
+        raise ValueError("`dissolve` is only available if `render` is 'vector'.")
+
+    data_per_county = _preprocess_county_data(data_per_county)
+    insets = _get_inset_layout(insets)
+
+    fig, ax = hlp._process_fig_ax_objects(fig, ax, figsize, dpi)
+
+    m = _get_projection(_LCC_PARAMS)  # Lambert Conformal: lower 48 states
+    m_ = _get_projection(_MERC_PARAMS)  # Mercator: Alaska and Hawaii
+
+    #---------   draw state and county boundaries  ----------------------------
+    if shapefile_dir is None:
+        shapefile_dir = pkg_resources.resource_filename('plot_utils', 'shapefiles/')
+    shp_path_state = os.path.join(shapefile_dir, 'usa_states', 'st99_d00')
+    tol = _get_lod_tolerance(level_of_detail, fig, ax, m)
+    inset_FIPS = [inset['state'] for inset in insets]
+    try:
+        _, states_table = _read_shapefile_cached(
+            m, _LCC_PARAMS, shp_path_state, tolerance=tol,
+        )
+        state_arcs, state_owners, _ = _read_shapefile_cached(
+            m, _LCC_PARAMS, shp_path_state, tolerance=tol, arcs=True,
+        )
+    except IOError:
+        raise IOError(
+            'Shape files not found. Specify the location of the "shapefiles" folder.'
+        )
+
+    _draw_boundaries(  # the inset states are not at their actual locations
+        m, ax,
+        _select_arcs(
+            state_arcs, state_owners,
+            ~states_table['STATEFP'].isin(inset_FIPS).values,
+        ),
+        linewidth=0.45, color='gray',
+    )
+
+    cbc = [0.75] * 3  # county boundary color
+    cbw = 0.15  # county boundary line width
+    shp_path_county = os.path.join(shapefile_dir, 'usa_counties', 'cb_2016_us_county_500k')
     try:
-        from mpl_toolkits.basemap import Basemap as Basemap
-    except ImportError:
-        raise ImportError(basemap_error_msg)
-    except KeyError as e:
-        if e.args[0] == 'PROJ_LIB':
-            raise Exception(proj_lib_error_msg)
+        m_counties, counties_table = _read_shapefile_cached(
+            m, _LCC_PARAMS, shp_path_county, tolerance=tol,
+        )
+        county_arcs, county_owners, county_directions = _read_shapefile_cached(
+            m, _LCC_PARAMS, shp_path_county, tolerance=tol, arcs=True,
+        )
+    except IOError:
+        raise IOError(
+            'Shape files not found. Specify the location of the "shapefiles" folder.'
+        )
+
+    is_inset = counties_table['STATEFP'].isin(inset_FIPS).values
+    _draw_boundaries(  # (no county boundaries within the dissolved regions)
+        m, ax,
+        [] if dissolve else _select_arcs(county_arcs, county_owners, ~is_inset),
+        linewidth=cbw, color=cbc,
+    )
+
+    #-------- choose a color for each county based on unemployment rate -------
+    cmap = plt.get_cmap(cmap)
+    vmin_, vmax_ = _calc_color_limits(data_per_county, vmin, vmax)
+    norm = _get_color_norm(
+        vmin_, vmax_, cmap_midpoint, scheme, k, data_per_county.values, cmap.N,
+    )
+
+    # align data to the order of the polygons, and map to colors in one pass
+    county_FIPS_code_list = counties_table.index
+    values = data_per_county.reindex(county_FIPS_code_list).values
+    nan_color = [0.93] * 3  # light grey for NaN data
+    colors, is_nan = _values_to_colors(values, cmap, norm, nan_color)
+
+    #---------  cycle through county names, color each one.  --------------------
+    add_layer = _get_layer_factory(render, raster_pixel_size, fig, ax, m)
+    rows = np.flatnonzero(~is_inset)  # 48 lower states (and others not in insets)
+    if dissolve:
+        layers = [
+            _DissolvedLayer(
+                ax, [m_counties[j] for j in rows], rows,
+                arcs=(county_arcs, county_owners, county_directions),
+            ),
+        ]
+    else:
+        layers = [
+            add_layer(
+                ax, [m_counties[j] for j in rows], rows, edge_follows_face=True,
+            ),
+        ]
+
+    for inset in insets:  # one collection per inset (e.g., Alaska and Hawaii)
+        inset_segments, inset_rows = _get_inset_segments(
+            inset, shp_path_county, level_of_detail, fig, ax, m,
+        )
+        if dissolve:
+            layers.append(_DissolvedLayer(ax, inset_segments, inset_rows))
+        else:
+            layers.append(
+                add_layer(
+                    ax, inset_segments, inset_rows, edgecolors=cbc, linewidths=cbw,
+                )
+            )
+
+    for layer in layers:
+        layer.set_colors(colors, is_nan)
+
+    ax.set_title(map_title)
+
+    _draw_inset_bounding_boxes(m_, ax)
+
+    #------------   Show color bar   ---------------------------------------
+    cb = _add_colorbar(
+        ax, cmap, norm, unit, data_per_county.values, vmin_, vmax_,
+    )
+
+    #------------   Set overall font size  --------------------------------
+    for o in fig.findobj(mpl.text.Text):
+        o.set_fontsize(fontsize)
+
+    handle = dict(
+        keys=county_FIPS_code_list, names=counties_table['NAME'].values,
+        values=values, layers=layers, colorbar=cb, cmap=cmap,
+        vmin=vmin, vmax=vmax, cmap_midpoint=cmap_midpoint,
+        nan_color=nan_color, fontsize=fontsize, projection=m, insets=insets,
+        scheme=scheme, k=k,
+    )
+
+    return fig, ax, handle
+
+#%%============================================================================
+def _preprocess_state_data(data_per_state, extra_states=()):
+    '''
+    Convert ``data_per_state`` (dict, pandas Series, or pandas DataFrame) into
+    a float pandas Series whose index is full state names, and which contains
+    all 50 states and District of Columbia, plus ``extra_states`` (with NaN
+    for the missing ones). The state identifiers can be full names,
+    abbreviations, FIPS codes, or a mix of them.
+    '''
+    if isinstance(data_per_state, pd.Series):
+        pass
+    elif isinstance(data_per_state, pd.DataFrame):
+        if data_per_state.shape[1] == 1:  # only one column
+            data_per_state = data_per_state.iloc[:,0]
+        elif data_per_state.shape[1] == 2:  # two columns
+            if 'FIPS_code' in data_per_state.columns:
+                data_per_state = data_per_state.set_index('FIPS_code')
+            elif 'state' in data_per_state.columns:
+                data_per_state = data_per_state.set_index('state')
+            elif 'State' in data_per_state.columns:
+                data_per_state = data_per_state.set_index('State')
+            else:
+                raise ValueError('`data_per_state` has unrecognized column name.')
+            data_per_state = data_per_state.iloc[:,0]
+        else:  # more than two columns
+            raise hlp.DimensionError('`data_per_state` should have only two columns.')
+    elif isinstance(data_per_state,dict):
+        data_per_state = pd.Series(data_per_state, dtype=object)
+    else:
+        raise TypeError('`data_per_state` should be pandas.Series, '
+                        'pandas.DataFrame, or dict.')
+
+    state_names = _normalize_state_identifiers(data_per_state.index)
+    is_unknown = state_names.isnull().values
+    if is_unknown.any():
+        print('Unrecognized state identifiers (ignored): %s' \
+              % ', '.join(map(str, data_per_state.index[is_unknown])))
+
+    data_per_state = pd.Series(
+        data_per_state.values[~is_unknown], index=state_names.values[~is_unknown],
+    )
+    data_per_state = data_per_state[~data_per_state.index.duplicated(keep='last')]
+
+    all_states = _STATES_AND_DC + list(extra_states)
+    for state in all_states:
+        if state not in data_per_state.index:
+            print('%s data missing (replaced with NaN).'%state)
+
+    return data_per_state.reindex(all_states).astype(float)
+
+#%%============================================================================
+def _preprocess_county_data(data_per_county):
+    '''
+    Convert ``data_per_county`` (dict, pandas Series, or pandas DataFrame)
+    into a float pandas Series whose index is 5-digit county FIPS codes (as
+    strings, so integer codes such as 1001 become '01001').
+    '''
+    if isinstance(data_per_county, pd.Series):
+        pass
+    elif isinstance(data_per_county, pd.DataFrame):
+        if data_per_county.shape[1] == 1:  # only one column
+            data_per_county = data_per_county.iloc[:,0]
+        elif data_per_county.shape[1] == 2:  # two columns
+            if 'FIPS_code' in data_per_county.columns:
+                data_per_county = data_per_county.set_index('FIPS_code')
+            else:
+                raise ValueError(
+                    '`data_per_county` should have a column named "FIPS_code".'
+                )
+            data_per_county = data_per_county.iloc[:,0]
+        else:  # more than two columns
+            raise hlp.DimensionError('`data_per_county` should have only two columns.')
+    elif isinstance(data_per_county,dict):
+        data_per_county = pd.Series(data_per_county, dtype=object)
+    else:
+        raise TypeError(
+            '`data_per_county` should be pandas.Series, pandas.DataFrame, or dict.'
+        )
+
+    FIPS_codes = pd.Series(np.asarray(data_per_county.index, dtype=object))
+    FIPS_codes = FIPS_codes.astype(str).str.strip()
+    FIPS_codes = FIPS_codes.where(~FIPS_codes.str.isdigit(), FIPS_codes.str.zfill(5))
+
+    data_per_county = pd.Series(
+        data_per_county.values, index=FIPS_codes.values,
+    ).astype(float)
+
+    return data_per_county[~data_per_county.index.duplicated(keep='last')]
+
+#%%============================================================================
+def clear_map_cache():
+    '''
+    Remove all the map projections and the projected shapefile geometry
+    cached by :func:`~choropleth_map_state` and :func:`~choropleth_map_county`.
+
+    The geometry is cached at the process level, so that only the first map
+    pays the cost of reading and projecting the shapefiles. Long-running
+    processes can call this function to release the memory.
+    '''
+    _map_cache.clear()
+
+#%%============================================================================
+def _get_from_map_cache(key, loader):
+    '''
+    Return the object cached under ``key``. If it is not cached, call
+    ``loader()`` to create it, and store it in the cache. The least recently
+    used entries are evicted while the cached objects take more than
+    ``_MAP_CACHE_MAXBYTES`` bytes (see :func:`~_estimate_nbytes`) in total,
+    but the new entry is always kept.
+    '''
+    if key in _map_cache:
+        _map_cache.move_to_end(key)
+        return _map_cache[key][0]
+
+    value = loader()
+    _map_cache[key] = (value, _estimate_nbytes(value))
+    total = sum(nbytes for _, nbytes in _map_cache.values())
+    while total > _MAP_CACHE_MAXBYTES and len(_map_cache) > 1:
+        _, (_, nbytes) = _map_cache.popitem(last=False)
+        total -= nbytes
+
+    return value
+
+#%%============================================================================
+def _estimate_nbytes(obj):
+    '''
+    Estimate the memory size (in bytes) of ``obj``: the data of the numpy
+    arrays and pandas objects in it (recursively through lists, tuples, and
+    dicts), or the size of the Python object itself otherwise.
+    '''
+    import sys
+
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        return int(np.sum(obj.memory_usage(deep=True)))
+    if isinstance(obj, (list, tuple)):
+        return sys.getsizeof(obj) + sum(_estimate_nbytes(x) for x in obj)
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(_estimate_nbytes(x) for x in obj.values())
+    return sys.getsizeof(obj)
+
+#%%============================================================================
+class _MapProjection():
+    '''
+    A minimal replacement of Basemap, implementing (on a sphere, and
+    vectorized over whole vertex arrays) the two map projections that the
+    choropleth maps use: Lambert Conformal Conic and Mercator. The projected
+    coordinates are those of Basemap with the same parameters (i.e., the
+    lower-left corner of the map region is at (0, 0)), except that the
+    longitudes are always wrapped into the 360 degrees around ``lon_0`` (as
+    in PROJ), so that the Aleutian Islands west of the 180th meridian stay
+    next to the rest of Alaska in the Mercator projection too.
+
+    Parameters
+    ----------
+    llcrnrlon, llcrnrlat, urcrnrlon, urcrnrlat : float
+        Longitude and latitude of the lower-left and upper-right corners of
+        the map region.
+    projection : {'lcc', 'merc'}
+        The map projection.
+    lat_1, lat_2 : float
+        The two standard parallels ('lcc' only).
+    lon_0 : float
+        The central meridian. For 'merc', it is the middle of the map region
+        if not specified.
+    lat_ts : float
+        The latitude of true scale ('merc' only).
+    rsphere : float
+        Radius of the sphere, in meters.
+    '''
+    def __init__(
+            self, llcrnrlon, llcrnrlat, urcrnrlon, urcrnrlat,
+            projection, lat_1=None, lat_2=None, lon_0=None, lat_ts=0.0,
+            rsphere=6370997.0,
+    ):
+        if projection not in ['lcc', 'merc']:
+            raise ValueError("`projection` must be either 'lcc' or 'merc'.")
+
+        self.projection = projection
+        self.rsphere = rsphere
+        if lon_0 is None:
+            lon_0 = 0.5 * (llcrnrlon + urcrnrlon)
+        self.lon_0 = lon_0
+
+        if projection == 'lcc':
+            phi_1, phi_2 = np.radians(lat_1), np.radians(lat_2)
+            t = lambda phi: np.tan(np.pi / 4 + phi / 2)
+            if lat_1 == lat_2:
+                self._n = np.sin(phi_1)
+            else:
+                self._n = np.log(np.cos(phi_1) / np.cos(phi_2)) \
+                          / np.log(t(phi_2) / t(phi_1))
+            self._F = np.cos(phi_1) * t(phi_1) ** self._n / self._n
+            self._rho_0 = rsphere * self._F  # latitude of origin: equator
+        else:
+            self._k_0 = np.cos(np.radians(lat_ts))
+
+        self._x_0, self._y_0 = 0.0, 0.0
+        x_0, y_0 = self(llcrnrlon, llcrnrlat)
+        self._x_0, self._y_0 = -x_0, -y_0  # lower-left corner at (0, 0)
+
+        self.llcrnrx, self.llcrnry = 0.0, 0.0
+        self.urcrnrx, self.urcrnry = self(urcrnrlon, urcrnrlat)
+        self.xmin, self.xmax = self.llcrnrx, self.urcrnrx
+        self.ymin, self.ymax = self.llcrnry, self.urcrnry
+
+    def __call__(self, lon, lat):
+        '''
+        Project longitudes and latitudes (in degrees, scalars or arrays) into
+        map coordinates (in meters).
+        '''
+        lam = np.radians(np.asarray(lon, dtype=np.float64) - self.lon_0)
+        phi = np.radians(np.asarray(lat, dtype=np.float64))
+        R = self.rsphere
+
+        lam = (lam + np.pi) % (2 * np.pi) - np.pi  # into [-180, 180) degrees
+        if self.projection == 'lcc':
+            rho = R * self._F / np.tan(np.pi / 4 + phi / 2) ** self._n
+            x = rho * np.sin(self._n * lam)
+            y = self._rho_0 - rho * np.cos(self._n * lam)
+        else:
+            x = R * self._k_0 * lam
+            y = R * self._k_0 * np.log(np.tan(np.pi / 4 + phi / 2))
+
+        return x + self._x_0, y + self._y_0
+
+    def set_axes_limits(self, ax):
+        '''
+        Set the limits of ``ax`` to the map region, with equal aspect ratio
+        and without ticks.
+        '''
+        ax.set_autoscale_on(False)
+        ax.update_datalim(
+            ((self.llcrnrx, self.llcrnry), (self.urcrnrx, self.urcrnry))
+        )
+        ax.set_xlim((self.llcrnrx, self.urcrnrx))
+        ax.set_ylim((self.llcrnry, self.urcrnry))
+        ax.set_aspect('equal', anchor='C')
+        ax.set_xticks([])
+        ax.set_yticks([])
+
+    def plot(self, lon, lat, ax, **kwargs):
+        '''
+        Plot a line given by longitudes and latitudes onto ``ax``, and then
+        set the axes limits to the map region.
+        '''
+        x, y = self(lon, lat)
+        lines = ax.plot(x, y, **kwargs)
+        self.set_axes_limits(ax)
+
+        return lines
+
+#%%============================================================================
+def _get_projection(proj_params):
+    '''
+    Return a (cached) :class:`~_MapProjection` object constructed with
+    ``proj_params``.
+    '''
+    key = ('projection', tuple(sorted(proj_params.items())))
+    return _get_from_map_cache(key, lambda: _MapProjection(**proj_params))
+
+#%%============================================================================
+def _read_shapefile_cached(
+        projection, proj_params, shp_path, tolerance=0, arcs=False,
+):
+    '''
+    Read the shapefile at ``shp_path`` (without extension) and project it
+    using ``projection`` (a :class:`~_MapProjection` object constructed with
+    ``proj_params``). If a valid geometry bundle (see
+    :func:`~build_geometry_bundle`) exists next to the shapefile, it is loaded
+    instead. The results are cached, keyed on the source file path, its
+    modification time, and the projection parameters.
+
+    If ``tolerance`` is larger than 0, the polygons are simplified with this
+    tolerance (see :func:`~_compute_vertex_importance`), and the simplified
+    polygons are cached as well.
+
+    If ``arcs`` is ``True``, the unique arcs of the polygon boundaries (see
+    :func:`~_get_unique_arcs`) are returned (and cached) instead.
+
+    Returns
+    -------
+    segments : list<numpy.ndarray>
+        Vertices of each polygon, in map projection coordinates.
+    table : pandas.DataFrame
+        Attributes of each polygon, indexed by GEOID (see
+        :func:`~_get_geometry_table`).
+    (or, if ``arcs`` is ``True``)
+    arcs : list<numpy.ndarray>
+        Vertices of each unique arc, in map projection coordinates.
+    owners : numpy.ndarray
+        The indices of the (up to two) polygons that each arc belongs to.
+    directions : numpy.ndarray
+        The direction in which each of these polygons goes along the arc.
+    '''
+    bundle_dir = shp_path + _BUNDLE_SUFFIX
+    importance_path = None
+    if _is_valid_bundle(bundle_dir, shp_path, proj_params):
+        source = os.path.join(bundle_dir, 'meta.json')
+        loader = lambda: _load_geometry_bundle(bundle_dir, proj_params)
+        importance_path = os.path.join(
+            bundle_dir,
+            'importance_%s.npy' % _get_bundle_projection_name(bundle_dir, proj_params),
+        )
+    else:
+        source = shp_path + '.shp'
+
+        loader = lambda: _project_shapefile(projection, shp_path)
+
+    mtime = os.path.getmtime(source)  # raises OSError if missing
+    key = (
+        os.path.abspath(source), mtime, tuple(sorted(proj_params.items())),
+    )
+    segments, table = _get_from_map_cache(('shapefile',) + key, loader)
+    if tolerance:
+        def importance_loader():
+            if importance_path is not None and os.path.exists(importance_path):
+                return np.load(importance_path, mmap_mode='r')  # precomputed
+            return _compute_vertex_importance(segments)
+
+        importance = _get_from_map_cache(('importance',) + key, importance_loader)
+        segments = _get_from_map_cache(
+            ('simplified', tolerance) + key,
+            lambda: _simplify_segments(segments, importance, tolerance),
+        )
+
+    if arcs:
+        return _get_from_map_cache(
+            ('arcs', tolerance) + key, lambda: _get_unique_arcs(segments),
+        )
+
+    return segments, table
+
+#%%============================================================================
+def _project_shapefile(projection, shp_path):
+    '''
+    Read the shapefile at ``shp_path`` (without extension), and project all
+    its vertices using ``projection`` in one vectorized pass. The returned
+    segments are views into one array of projected vertices, and the returned
+    table is the geometry table (see :func:`~_get_geometry_table`).
+    '''
+    rings, rings_info = _read_shapefile(shp_path)
+    table = _get_geometry_table(rings_info)
+
+    lengths = [len(ring) for ring in rings]
+    offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+    if offsets[-1] == 0:
+        return [np.zeros((0, 2)) for _ in rings], table
+
+    lonlat = np.concatenate(rings)
+    vertices = np.column_stack(projection(lonlat[:, 0], lonlat[:, 1]))
+    segments = [
+        vertices[offsets[j]:offsets[j + 1]] for j in range(len(rings))
+    ]
+
+    return segments, table
+
+#%%============================================================================
+def _get_geometry_table(attributes):
+    '''
+    Build the geometry table of the polygons (i.e., rings) from their
+    ``attributes`` (a pandas DataFrame with one row per polygon): a pandas
+    DataFrame indexed by GEOID (which is the state FIPS code for state-level
+    shapefiles), with columns 'NAME', 'STATEFP', 'AREA', 'SHAPENUM', and
+    'ring' (the position of each polygon in the list of segments).
+    '''
+    n = len(attributes)
+    if 'STATEFP' in attributes:
+        state_FIPS = attributes['STATEFP'].astype(str).values
+    elif 'STATE' in attributes:  # state-level shapefile
+        state_FIPS = attributes['STATE'].astype(str).values
+    else:
+        state_FIPS = np.full(n, '')
+
+    if 'GEOID' in attributes:
+        GEOID = attributes['GEOID'].astype(str).values
+    else:
+        GEOID = state_FIPS
+
+    if 'AREA' in attributes:
+        area = attributes['AREA'].values.astype(np.float64)
+    else:
+        area = np.full(n, np.nan)
+
+    table = pd.DataFrame(
+        {
+            'NAME': attributes['NAME'].astype(str).values,
+            'STATEFP': state_FIPS,
+            'AREA': area,
+            'SHAPENUM': attributes['SHAPENUM'].values.astype(np.int64),
+            'ring': np.arange(n),
+        },
+        index=pd.Index(GEOID, name='GEOID'),
+    )
+
+    return table
+
+#%%============================================================================
+def read_shapefile(shp_path):
+    '''
+    Read a polygon (or polyline) shapefile, such as census tracts or ZIP code
+    areas, quickly and with little memory.
+
+    The ``.shp`` file is memory-mapped, and the record offsets in the ``.shx``
+    file are used to locate all the records at once, so the points of each
+    shape are zero-copy views into the file (i.e., they are only read from
+    disk when they are used). The ``.dbf`` attribute table is parsed into a
+    pandas DataFrame column by column.
+
+    Parameters
+    ----------
+    shp_path : str
+        Path to the shapefile, with or without the ".shp" extension. The
+        ``.dbf`` file (and, preferably, the ``.shx`` file) should be in the
+        same folder.
+
+    Returns
+    -------
+    shapes : list<list<numpy.ndarray>>
+        The parts (i.e., rings of polygons, or lines of polylines) of each
+        shape. Each part is a read-only array of shape (N, 2) of x and y
+        coordinates (usually longitudes and latitudes). Null shapes have no
+        parts.
+    attributes : pandas.DataFrame
+        The attribute table, with one row per shape (in the same order as
+        ``shapes``). Numerical fields are converted into numbers; all other
+        fields are kept as strings.
+    '''
+    if shp_path.lower().endswith('.shp'):
+        shp_path = shp_path[:-4]
+
+    content = np.memmap(shp_path + '.shp', dtype=np.uint8, mode='r')
+
+    shape_type = _gather_int32(content, [32], '<')[0]
+    if shape_type not in [3, 5, 13, 15, 23, 25]:  # polylines or polygons
+        raise ValueError(
+            'Only polyline and polygon shapefiles are supported (shape type '
+            'of "%s.shp" is %d).' % (shp_path, shape_type)
+        )
+
+    if os.path.exists(shp_path + '.shx'):
+        index = np.fromfile(shp_path + '.shx', dtype='>i4')[25:].reshape(-1, 2)
+        record_pos = index[:, 0].astype(np.int64) * 2  # 16-bit words --> bytes
+    else:  # walk through the record headers instead
+        record_pos = []
+        pos = 100  # end of the main file header
+        while pos < len(content):
+            record_pos.append(pos)
+            pos += 8 + _gather_int32(content, [pos + 4], '>')[0] * 2
+        record_pos = np.array(record_pos, dtype=np.int64)
+
+    #------  read the record headers of all the shapes at once  ---------------
+    n_shapes = len(record_pos)
+    record_type = _gather_int32(content, record_pos + 8, '<')
+    not_null = record_type != 0
+    n_parts = np.zeros(n_shapes, dtype=np.int64)
+    n_points = np.zeros(n_shapes, dtype=np.int64)
+    n_parts[not_null] = _gather_int32(content, record_pos[not_null] + 44, '<')
+    n_points[not_null] = _gather_int32(content, record_pos[not_null] + 48, '<')
+
+    # part indices of all the shapes, in one gather
+    part_shape = np.repeat(np.arange(n_shapes), n_parts)
+    part_rank = np.arange(len(part_shape)) \
+                - np.repeat(np.cumsum(n_parts) - n_parts, n_parts)
+    part_start = _gather_int32(
+        content, record_pos[part_shape] + 52 + 4 * part_rank, '<',
+    )
+    points_pos = record_pos + 52 + 4 * n_parts
+
+    #------  zero-copy views of the points  -----------------------------------
+    # Records start at even bytes, so the points of every record are aligned
+    # with one of the four float64 views of the file below.
+    views = [
+        np.ndarray(
+            shape=((len(content) - offset) // 8,), dtype='<f8',
+            buffer=content, offset=offset,
+        )
+        for offset in range(0, 8, 2)
+    ]
+    part_end = np.append(part_start[1:], 0)
+    part_end[np.cumsum(n_parts)[n_parts > 0] - 1] = n_points[n_parts > 0]
+    shift = points_pos[part_shape] % 8 // 2  # which of the four views
+    base = (points_pos[part_shape] - 2 * shift) // 8  # index in that view
+    parts = [
+        views[k][b:e].reshape(-1, 2) for k, b, e in zip(
+            shift.tolist(), (base + 2 * part_start).tolist(),
+            (base + 2 * part_end).tolist(),
+        )
+    ]
+    part_bounds = np.concatenate([[0], np.cumsum(n_parts)]).tolist()
+    shapes = [
+        parts[part_bounds[j]:part_bounds[j + 1]] for j in range(n_shapes)
+    ]
+
+    attributes = _read_dbf(shp_path + '.dbf')
+
+    return shapes, attributes
+
+#%%============================================================================
+def _gather_int32(content, positions, byte_order):
+    '''
+    Read 32-bit integers (with ``byte_order``, i.e., '<' or '>') at the byte
+    ``positions`` of ``content`` (a numpy.uint8 array), all at once.
+    '''
+    positions = np.asarray(positions, dtype=np.int64)
+    raw = content[positions[:, np.newaxis] + np.arange(4)]
+    return np.ascontiguousarray(raw).view(byte_order + 'i4').ravel()
+
+#%%============================================================================
+def _read_shapefile(shp_path):
+    '''
+    Read the polygons (or polylines) in the shapefile at ``shp_path`` (without
+    extension), and the attributes in its ``.dbf`` file, ring by ring.
+
+    Returns
+    -------
+    rings : list<numpy.ndarray>
+        Longitudes and latitudes of each ring (i.e., each part of each shape),
+        as an array of shape (N, 2).
+    rings_info : pandas.DataFrame
+        Attributes of the shape that each ring belongs to (one row per ring),
+        plus 'RINGNUM' and 'SHAPENUM' (both starting from 1), which is the
+        same as Basemap's ``*_info`` of its ``readshapefile()`` method.
+    '''
+    shapes, attributes = read_shapefile(shp_path)
+
+    rings = [ring for parts in shapes for ring in parts]
+    n_rings = np.array([len(parts) for parts in shapes], dtype=np.int64)
+    shape_index = np.repeat(np.arange(len(shapes)), n_rings)
+
+    rings_info = attributes.iloc[shape_index].reset_index(drop=True)
+    rings_info['RINGNUM'] = np.arange(len(rings)) \
+                            - np.repeat(np.cumsum(n_rings) - n_rings, n_rings) + 1
+    rings_info['SHAPENUM'] = shape_index + 1
+
+    return rings, rings_info
+
+#%%============================================================================
+def _read_dbf(dbf_path):
+    '''
+    Read the attribute table in the dBase file at ``dbf_path`` into a pandas
+    DataFrame. All the records are loaded as one 2D byte array, and then each
+    field is decoded as a column. Numerical fields become integers (or floats,
+    if they have decimals or empty values); all other fields are stripped
+    strings.
+    '''
+    import struct
+
+    with open(dbf_path, 'rb') as fp:
+        content = fp.read()
+
+    n_records, header_length, record_length = \
+        struct.unpack('<IHH', content[4:12])
+
+    fields = []  # (name, type, start position in the record, length, decimals)
+    start = 1  # the 1st byte of each record is the deletion flag
+    for pos in range(32, header_length - 1, 32):
+        if content[pos:pos + 1] == b'\r':  # end of field descriptors
+            break
+        name = content[pos:pos + 11].split(b'\x00')[0].decode('ascii')
+        field_type = content[pos + 11:pos + 12].decode('ascii')
+        length, decimals = content[pos + 16], content[pos + 17]
+        fields.append((name, field_type, start, length, decimals))
+        start += length
+
+    table = np.frombuffer(
+        content, dtype=np.uint8, count=n_records * record_length,
+        offset=header_length,
+    ).reshape(n_records, record_length)
+
+    columns = collections.OrderedDict()
+    for name, field_type, start, length, decimals in fields:
+        raw = np.ascontiguousarray(table[:, start:start + length])
+        raw = raw.view('S%d' % length).ravel()
+        if field_type in 'NF':
+            try:
+                numbers = raw.astype(np.float64)
+            except ValueError:  # empty values (or "*" for overflow)
+                numbers = pd.to_numeric(
+                    pd.Series(np.char.strip(raw).astype(str)), errors='coerce',
+                ).values
+            if decimals == 0 and not np.isnan(numbers).any():
+                numbers = numbers.astype(np.int64)
+            columns[name] = numbers
         else:
-            raise e
+            columns[name] = [
+                value.decode('utf-8', errors='replace').strip(' \x00')
+                for value in raw.tolist()
+            ]
+
+    return pd.DataFrame(columns, index=pd.RangeIndex(n_records))
+
+#%%============================================================================
+def build_geometry_bundle(shapefile_dir=None):
+    '''
+    Precompile the state-level and county-level shapefiles in
+    ``shapefile_dir`` into compact geometry bundles, which
+    :func:`~choropleth_map_state` and :func:`~choropleth_map_county` load much
+    faster than the shapefiles themselves.
+
+    Each bundle is a folder (next to the shapefile, with the same name plus
+    "_geometry") of flat ``.npy`` binary files:
+        - ``vertices_<projection>.npy``: float32 array of the projected
+          vertices of all polygons, one for each of the two map projections
+        - ``importance_<projection>.npy``: the precomputed simplification
+          tolerance at which each vertex is removed (for the levels of detail)
+        - ``offsets.npy``: the start index of each polygon in the vertex
+          arrays (plus the total number of vertices at the end)
+        - ``NAME.npy``, ``STATEFP.npy``, ``GEOID.npy``, ``AREA.npy``,
+          ``SHAPENUM.npy``: the attribute table, one entry per polygon
+        - ``meta.json``: format version, projection parameters, and a
+          fingerprint of the source ``.shp`` and ``.dbf`` files (their sizes
+          and a hash of their first and last kilobytes), to detect outdated
+          bundles; an outdated bundle is ignored (i.e., the shapefile is read
+          instead) until it is built again
+
+    The bundles are memory-mapped when loaded, so the vertex arrays are not
+    copied into memory until they are drawn.
+
+    Parameters
+    ----------
+    shapefile_dir : str
+        Directory where shape files are stored. Shape files (state level and
+        county level) should be organized as follows:
+            ``shapefile_dir``/usa_states/st99_d00.(...)
+            ``shapefile_dir``/usa_counties/cb_2016_us_county_500k.(...)
+        If ``None``, the shapefile directory within this library will be used.
 
+    Returns
+    -------
+    bundle_dirs : list<str>
+        The folders of the geometry bundles being written.
+    '''
+    import json
     import pkg_resources
-    from matplotlib.colors import rgb2hex
-    from matplotlib.patches import Polygon
-    from matplotlib.colorbar import ColorbarBase
-    from mpl_toolkits.axes_grid1 import make_axes_locatable
 
-    if isinstance(data_per_state, pd.Series):
-        data_per_state = data_per_state.to_dict()  # convert to dict
-    elif isinstance(data_per_state, pd.DataFrame):
-        if data_per_state.shape[1] == 1:  # only one column
-            data_per_state = data_per_state.iloc[:,0].to_dict()
-        elif data_per_state.shape[1] == 2:  # two columns
-            if 'FIPS_code' in data_per_state.columns:
-                data_per_state = data_per_state.set_index('FIPS_code')
-            elif 'state' in data_per_state.columns:
-                data_per_state = data_per_state.set_index('state')
-            elif 'State' in data_per_state.columns:
-                data_per_state = data_per_state.set_index('State')
-            else:
-                raise ValueError('`data_per_state` has unrecognized column name.')
-            data_per_state = data_per_state.iloc[:,0].to_dict()
-        else:  # more than two columns
-            raise hlp.DimensionError('`data_per_state` should have only two columns.')
-    elif isinstance(data_per_state,dict):
-        pass
+    if shapefile_dir is None:
+        shapefile_dir = pkg_resources.resource_filename('plot_utils', 'shapefiles/')
+
+    shp_paths = [
+        os.path.join(shapefile_dir, 'usa_states', 'st99_d00'),
+        os.path.join(shapefile_dir, 'usa_counties', 'cb_2016_us_county_500k'),
+    ]
+    projections = {'lcc': _LCC_PARAMS, 'merc': _MERC_PARAMS}
+
+    bundle_dirs = []
+    for shp_path in shp_paths:
+        if not os.path.exists(shp_path + '.shp'):
+            print('%s.shp not found (skipped).' % shp_path)
+            continue
+
+        bundle_dir = shp_path + _BUNDLE_SUFFIX
+        if not os.path.isdir(bundle_dir):
+            os.makedirs(bundle_dir)
+
+        for proj_name, proj_params in projections.items():
+            shapes, table = _project_shapefile(
+                _MapProjection(**proj_params), shp_path,
+            )
+            vertices = np.concatenate(
+                [np.asarray(seg, dtype=np.float32) for seg in shapes]
+            )
+            np.save(
+                os.path.join(bundle_dir, 'vertices_%s.npy' % proj_name),
+                vertices,
+            )
+            lengths = [len(seg) for seg in shapes]
+            offsets = np.concatenate([[0], np.cumsum(lengths)])
+            importance = _compute_vertex_importance(
+                [vertices[offsets[j]:offsets[j + 1]] for j in range(len(lengths))]
+            )
+            np.save(
+                os.path.join(bundle_dir, 'importance_%s.npy' % proj_name),
+                importance.astype(np.float32),
+            )
+
+        lengths = [len(seg) for seg in shapes]
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        np.save(os.path.join(bundle_dir, 'offsets.npy'), offsets)
+
+        attributes = {
+            'NAME': np.array(table['NAME'].tolist(), dtype=str),
+            'STATEFP': np.array(table['STATEFP'].tolist(), dtype=str),
+            'GEOID': np.array(table.index.tolist(), dtype=str),
+            'AREA': table['AREA'].values.astype(np.float64),
+            'SHAPENUM': table['SHAPENUM'].values.astype(np.int32),
+        }
+        for field, values in attributes.items():
+            np.save(os.path.join(bundle_dir, '%s.npy' % field), values)
+
+        meta = {
+            'version': _BUNDLE_VERSION,
+            'source_fingerprint': _get_shapefile_fingerprint(shp_path),
+            'projections': projections,
+        }
+        with open(os.path.join(bundle_dir, 'meta.json'), 'w') as fp:
+            json.dump(meta, fp, indent=2, sort_keys=True)
+
+        bundle_dirs.append(bundle_dir)
+
+    if len(bundle_dirs) == 0:
+        raise IOError(
+            'Shape files not found. Specify the location of the "shapefiles" folder.'
+        )
+
+    return bundle_dirs
+
+#%%============================================================================
+def _is_valid_bundle(bundle_dir, shp_path, proj_params):
+    '''
+    Check whether ``bundle_dir`` holds a geometry bundle with the current
+    format version, built from the shapefile at ``shp_path`` (if the shapefile
+    still exists), and projected with ``proj_params``.
+    '''
+    import json
+
+    meta_path = os.path.join(bundle_dir, 'meta.json')
+    if not os.path.exists(meta_path):
+        return False
+
+    with open(meta_path) as fp:
+        meta = json.load(fp)
+
+    if meta.get('version') != _BUNDLE_VERSION:
+        return False
+    if os.path.exists(shp_path + '.shp') \
+        and _get_shapefile_fingerprint(shp_path) != meta.get('source_fingerprint'):
+        return False
+
+    proj_params_ = json.loads(json.dumps(proj_params))  # e.g., tuple --> list
+    return proj_params_ in meta.get('projections', {}).values()
+
+#%%============================================================================
+def _get_shapefile_fingerprint(shp_path, n_bytes=1024):
+    '''
+    Return a cheap fingerprint of the .shp and .dbf files of the shapefile at
+    ``shp_path``: their sizes, and a SHA-1 hash of their first and last
+    ``n_bytes`` bytes (which include the headers, i.e., the bounding box,
+    the number of records, and the date of the last update). Unlike the
+    modification times, it does not change when the files are copied.
+    '''
+    import hashlib
+
+    sha1 = hashlib.sha1()
+    sizes = []
+    for ext in ['.shp', '.dbf']:
+        if not os.path.exists(shp_path + ext):
+            continue
+        size = os.path.getsize(shp_path + ext)
+        with open(shp_path + ext, 'rb') as fp:
+            sha1.update(fp.read(n_bytes))
+            fp.seek(max(size - n_bytes, 0))
+            sha1.update(fp.read(n_bytes))
+        sizes.append(size)
+
+    return '%s-%s' % ('-'.join(str(size) for size in sizes), sha1.hexdigest())
+
+#%%============================================================================
+def _load_geometry_bundle(bundle_dir, proj_params):
+    '''
+    Load a geometry bundle written by :func:`~build_geometry_bundle`. The
+    vertex array is memory-mapped, and each returned segment is a view into it.
+
+    Returns
+    -------
+    segments : list<numpy.ndarray>
+        Vertices of each polygon, in map projection coordinates.
+    table : pandas.DataFrame
+        Attributes of each polygon, indexed by GEOID (see
+        :func:`~_get_geometry_table`).
+    '''
+    proj_name = _get_bundle_projection_name(bundle_dir, proj_params)
+
+    load = lambda name: np.load(
+        os.path.join(bundle_dir, '%s.npy' % name), mmap_mode='r',
+    )
+    vertices = load('vertices_%s' % proj_name)
+    offsets = np.asarray(load('offsets'))
+
+    segments = [
+        vertices[offsets[j]:offsets[j + 1]] for j in range(len(offsets) - 1)
+    ]
+
+    fields = ['NAME', 'STATEFP', 'GEOID', 'AREA', 'SHAPENUM']
+    table = _get_geometry_table(
+        pd.DataFrame({field: np.asarray(load(field)) for field in fields})
+    )
+
+    return segments, table
+
+#%%============================================================================
+def _get_bundle_projection_name(bundle_dir, proj_params):
+    '''
+    Return the name (such as 'lcc') under which the geometry bundle in
+    ``bundle_dir`` stores the vertices projected with ``proj_params``.
+    '''
+    import json
+
+    with open(os.path.join(bundle_dir, 'meta.json')) as fp:
+        meta = json.load(fp)
+
+    proj_params_ = json.loads(json.dumps(proj_params))  # e.g., tuple --> list
+    return [
+        name for name, params in meta['projections'].items()
+        if params == proj_params_
+    ][0]
+
+#%%============================================================================
+def _get_lod_tolerance(level_of_detail, fig, ax, projection, scale=1.0):
+    '''
+    Return the simplification tolerance (in map projection units) of the
+    polygons that are drawn onto ``ax`` after being scaled by ``scale``.
+
+    If ``level_of_detail`` is 'auto', the tolerance is about half the size of
+    a pixel of ``ax``, so that simplifying the polygons does not change how
+    they look. Otherwise it is ``_LOD_TOLERANCES[level_of_detail]``. The
+    tolerance is then snapped to one of the levels in ``_LOD_TOLERANCES``
+    (after being converted to the unscaled units), so that the simplified
+    geometry can be cached and reused.
+    '''
+    if level_of_detail is None:
+        return 0.0
+
+    if level_of_detail == 'auto':
+        target = _get_pixel_size(fig, ax, projection) / 2.0 / scale
+    elif isinstance(level_of_detail, (int, np.integer)) \
+        and not isinstance(level_of_detail, bool) \
+        and 0 <= level_of_detail < len(_LOD_TOLERANCES):
+        target = _LOD_TOLERANCES[level_of_detail] / scale
     else:
-        raise TypeError('`data_per_state` should be pandas.Series, '
-                        'pandas.DataFrame, or dict.')
+        raise ValueError(
+            '`level_of_detail` must be "auto", None, or an integer between '
+            '0 and %d.' % (len(_LOD_TOLERANCES) - 1)
+        )
 
-    #  if dict keys are state abbreviations such as "AK", "CA", etc.
-    if len(list(data_per_state.keys())[0])==2 and list(data_per_state.keys())[0].isalpha():
-        data_per_state = _translate_state_abbrev(data_per_state) # convert from 'AK' to 'Alaska'
+    return max(tol for tol in _LOD_TOLERANCES if tol <= target)
 
-    #  if dict keys are state FIPS codes such as "01", "45", etc.
-    if len(list(data_per_state.keys())[0])==2 and list(data_per_state.keys())[0].isdigit():
-        data_per_state = _convert_FIPS_to_state_name(data_per_state) # convert from '01' to 'Alabama'
+#%%============================================================================
+def _get_pixel_size(fig, ax, projection):
+    '''
+    Return the size of a pixel of ``ax`` in map projection units, when ``ax``
+    shows the map region of ``projection`` (with "equal" aspect ratio).
+    '''
+    width, height = hlp._get_ax_size(fig, ax, unit='pixels')
+    return max(
+        (projection.xmax - projection.xmin) / max(width, 1.0),
+        (projection.ymax - projection.ymin) / max(height, 1.0),
+    )
 
-    data_per_state = _check_all_states(data_per_state)  # see function definition of _check_all_states()
+#%%============================================================================
+def _compute_vertex_importance(segments):
+    '''
+    Compute the Douglas-Peucker "importance" of each vertex of ``segments``,
+    i.e., the largest tolerance at which the vertex is still kept. Simplifying
+    the polygons with any tolerance is then only a comparison of the
+    importance with the tolerance (see :func:`~_simplify_segments`).
 
-    fig, ax = hlp._process_fig_ax_objects(fig, ax, figsize, dpi)
+    To preserve the topology, the polygon rings are split into arcs at the
+    junctions (see :func:`~_split_into_arcs`). Junctions are never removed,
+    and each shared arc is simplified only once, so the shared borders of
+    adjacent polygons stay aligned at any tolerance.
+
+    Returns
+    -------
+    importance : numpy.ndarray
+        The importance of all the vertices of ``segments`` concatenated
+        (``numpy.inf`` for vertices that are never removed).
+    '''
+    vertices, point_id, arcs, closed = _split_into_arcs(segments)
+    importance = np.zeros(len(vertices))
+    simplified_arcs = {}
+    for _, arc, _ in arcs:
+        key = point_id[arc].tobytes()
+        if key not in simplified_arcs:
+            simplified_arcs[key] = _douglas_peucker(vertices[arc])
+        importance[arc] = simplified_arcs[key]
+
+    # the closing vertex of a ring goes with its first vertex
+    offsets = np.concatenate([[0], np.cumsum([len(seg) for seg in segments])])
+    starts, ends = offsets[:-1][closed], offsets[1:][closed]
+    importance[ends - 1] = importance[starts]
+
+    return importance
+
+#%%============================================================================
+def _get_unique_arcs(segments):
+    '''
+    Extract the boundaries of the polygons ``segments`` as unique arcs (as in
+    TopoJSON): a border shared by two adjacent polygons becomes one arc, so
+    that drawing all the arcs strokes each border only once.
+
+    Returns
+    -------
+    arcs : list<numpy.ndarray>
+        Vertices of each unique arc.
+    owners : numpy.ndarray
+        For each arc, the indices of the (up to two) polygons that it belongs
+        to, with shape (len(arcs), 2). The two indices are the same if the arc
+        belongs to only one polygon.
+    directions : numpy.ndarray
+        For each arc, the direction in which the ring of each of its owners
+        goes along the arc: 1 if in the order of the vertices of the arc, -1
+        if in the reverse order. (Adjacent polygons go along their shared arc
+        in opposite directions.)
+    '''
+    vertices, point_id, arcs_, _ = _split_into_arcs(segments)
+
+    arc_index = {}
+    arcs, owners, directions = [], [], []
+    for j, arc, is_reversed in arcs_:
+        key = point_id[arc].tobytes()
+        direction = -1 if is_reversed else 1
+        if key in arc_index:  # a border shared with an earlier polygon
+            owners[arc_index[key]][1] = j
+            directions[arc_index[key]][1] = direction
+        else:
+            arc_index[key] = len(arcs)
+            arcs.append(vertices[arc])
+            owners.append([j, j])
+            directions.append([direction, direction])
+
+    return arcs, np.array(owners, dtype=np.int64).reshape(-1, 2), \
+           np.array(directions, dtype=np.int8).reshape(-1, 2)
+
+#%%============================================================================
+def _split_into_arcs(segments):
+    '''
+    Split the polygon rings of ``segments`` into arcs at the junctions (the
+    vertices where a ring stops sharing its border with the same neighbor).
+    A shared arc is in a canonical direction, so it is identical (in terms of
+    the point IDs of its vertices) in all the polygons that share it.
+
+    Returns
+    -------
+    vertices : numpy.ndarray
+        All the vertices of ``segments`` concatenated.
+    point_id : numpy.ndarray
+        The point ID of each vertex (identical vertices share the same ID).
+    arcs : list<(int, numpy.ndarray, bool)>
+        The index of the polygon, the indices of the vertices (in
+        ``vertices``) of each arc, and whether the arc is in the reverse
+        order of the ring. The closing vertex of a ring is not used.
+    closed : numpy.ndarray
+        Whether each polygon is a closed ring (otherwise, an open polyline
+        is one arc).
+    '''
+    lengths = np.array([len(seg) for seg in segments], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    n_vertices = offsets[-1]
+    if n_vertices == 0:
+        return np.zeros((0, 2)), np.zeros(0, dtype=np.int64), [], \
+               np.zeros(len(segments), dtype=bool)
+
+    vertices = np.concatenate(
+        [np.asarray(seg, dtype=np.float64).reshape(-1, 2) for seg in segments]
+    )
+    # identical vertices share the same point ID (in lexicographic order)
+    _, point_id = np.unique(vertices, axis=0, return_inverse=True)
+    point_id = point_id.ravel()
+
+    #--------  find junctions  -------------------------------------------------
+    starts, ends = offsets[:-1], offsets[1:]
+    closed = np.zeros(len(segments), dtype=bool)
+    nonempty = lengths >= 4
+    closed[nonempty] = \
+        point_id[starts[nonempty]] == point_id[ends[nonempty] - 1]
+    n_distinct = lengths - closed  # without the closing vertex
+
+    ring = np.repeat(np.arange(len(segments)), lengths)
+    position = np.arange(n_vertices) - starts[ring]
+    in_ring = (position < n_distinct[ring]) & closed[ring]
+    n_ = np.maximum(n_distinct[ring], 1)
+    prev_id = point_id[starts[ring] + (position - 1) % n_]
+    next_id = point_id[starts[ring] + (position + 1) % n_]
+    neighbors = np.stack(
+        [point_id, np.minimum(prev_id, next_id), np.maximum(prev_id, next_id)],
+        axis=1,
+    )[in_ring]
+    unique_neighbors = np.unique(neighbors, axis=0)
+    n_neighbor_pairs = np.bincount(
+        unique_neighbors[:, 0], minlength=point_id.max() + 1,
+    )
+    is_junction = n_neighbor_pairs[point_id] > 1
+
+    #--------  split each ring at its junctions  -------------------------------
+    arcs = []
+    for j in range(len(segments)):
+        start, n = starts[j], n_distinct[j]
+        if n < 3 or not closed[j]:  # open polylines: keep the two ends
+            ring_arcs = [np.arange(start, start + lengths[j])]
+        else:
+            junctions = np.flatnonzero(is_junction[start:start + n])
+            if len(junctions) == 0:  # an unshared ring, or an enclave
+                junctions = [np.argmin(point_id[start:start + n])]
+            first = junctions[0]
+            loop = start + (np.arange(n + 1) + first) % n
+            cuts = list(np.asarray(junctions) - first) + [n]
+            ring_arcs = [loop[a:b + 1] for a, b in zip(cuts[:-1], cuts[1:])]
+
+        for arc in ring_arcs:
+            ids = point_id[arc]
+            is_reversed = len(arc) > 1 and (ids[-1], ids[-2]) < (ids[0], ids[1])
+            if is_reversed:
+                arc = arc[::-1]  # canonical direction of a shared arc
+            arcs.append((j, arc, is_reversed))
+
+    return vertices, point_id, arcs, closed
+
+#%%============================================================================
+def _douglas_peucker(points):
+    '''
+    Return the Douglas-Peucker importance of each of the ``points`` of a
+    polyline: the distance of a vertex to the chord that it splits, capped by
+    the importance of the vertex that split the chord before it. The two
+    ends of the polyline have an importance of ``numpy.inf``.
+    '''
+    n = len(points)
+    importance = np.zeros(n)
+    importance[[0, -1]] = np.inf
+
+    stack = [(0, n - 1, np.inf)]
+    while stack:
+        i, j, parent_importance = stack.pop()
+        if j - i < 2:
+            continue
+
+        chord = points[j] - points[i]
+        offsets = points[i + 1:j] - points[i]
+        chord_length = np.hypot(chord[0], chord[1])
+        if chord_length > 0:
+            dist = np.abs(chord[0] * offsets[:, 1] - chord[1] * offsets[:, 0])
+            dist /= chord_length
+        else:  # closed arc: distance to the end point
+            dist = np.hypot(offsets[:, 0], offsets[:, 1])
+
+        k = np.argmax(dist)
+        importance[i + 1 + k] = min(dist[k], parent_importance)
+        stack.append((i, i + 1 + k, importance[i + 1 + k]))
+        stack.append((i + 1 + k, j, importance[i + 1 + k]))
+
+    return importance
+
+#%%============================================================================
+def _simplify_segments(segments, importance, tolerance):
+    '''
+    Simplify ``segments`` by removing the vertices whose importance (computed
+    by :func:`~_compute_vertex_importance`) is not larger than ``tolerance``.
+    A closed ring stays closed, even if its first vertex is removed.
+    '''
+    keep = np.asarray(importance) > tolerance
+    offsets = np.concatenate([[0], np.cumsum([len(seg) for seg in segments])])
+
+    simplified = []
+    for j, seg in enumerate(segments):
+        seg = np.asarray(seg).reshape(-1, 2)
+        keep_j = keep[offsets[j]:offsets[j + 1]]
+        if len(seg) >= 4 and not keep_j[0] and np.array_equal(seg[0], seg[-1]):
+            kept = seg[keep_j]
+            simplified.append(np.concatenate([kept, kept[:1]]))
+        else:
+            simplified.append(seg[keep_j])
+
+    return simplified
 
-    # Lambert Conformal map of lower 48 states.
-    m = Basemap(
-        llcrnrlon=-119, llcrnrlat=20, urcrnrlon=-64, urcrnrlat=49,
-        projection='lcc', lat_1=33, lat_2=45, lon_0=-95,
+#%%============================================================================
+def _get_inset_layout(insets=None):
+    '''
+    Check the map inset layout ``insets`` (see :func:`~choropleth_map_state`),
+    and fill in the default values. If ``insets`` is ``None``, the default
+    layout of Alaska and Hawaii is returned.
+    '''
+    if insets is None:
+        insets = _DEFAULT_INSETS
+
+    layout = []
+    for inset in insets:
+        if 'state' not in inset:
+            raise ValueError('Each inset must specify the "state" (its FIPS code).')
+        projection = inset.get('projection', 'merc')
+        if projection not in ['merc', 'lcc']:
+            raise ValueError("The projection of an inset must be 'merc' or 'lcc'.")
+        layout.append(dict(
+            state=str(inset['state']).zfill(2),
+            scale=float(inset.get('scale', 1.0)),
+            offset=tuple(inset.get('offset', (0, 0))),
+            projection=projection,
+            min_area=float(inset.get('min_area', 0.0)),
+        ))
+
+    return layout
+
+#%%============================================================================
+def _get_inset_segments(inset, shp_path, level_of_detail, fig, ax, m):
+    '''
+    Get the polygons of the state in ``inset`` (an item returned by
+    :func:`~_get_inset_layout`) from the shapefile at ``shp_path``, moved to
+    the inset location.
+
+    Returns
+    -------
+    segments : list<numpy.ndarray>
+        The transformed polygons.
+    rows : list<int>
+        Their indices in the shapefile.
+    '''
+    proj_params = _LCC_PARAMS if inset['projection'] == 'lcc' else _MERC_PARAMS
+    # scaled-down states can be simplified with a larger tolerance
+    tol = _get_lod_tolerance(level_of_detail, fig, ax, m, scale=inset['scale'])
+    segments, table = _read_shapefile_cached(
+        _get_projection(proj_params), proj_params, shp_path, tolerance=tol,
+    )
+
+    is_selected = table['STATEFP'].values == inset['state']
+    if inset['min_area'] > 0:  # skip small islands (AREA is NaN if unknown)
+        is_selected &= ~(table['AREA'].values <= inset['min_area'])
+    rows = np.flatnonzero(is_selected)
+
+    segments = _transform_segments(
+        [segments[nshape] for nshape in rows], inset['scale'], inset['offset'],
     )
 
-    # Mercator projection, for Alaska and Hawaii
-    m_ = Basemap(
-        llcrnrlon=-190, llcrnrlat=20, urcrnrlon=-143, urcrnrlat=46,
-        projection='merc', lat_ts=20,  # do not change these numbers
+    return segments, rows
+
+#%%============================================================================
+def _transform_segments(segments, scale, offset):
+    '''
+    Apply the affine transform ``(x, y) * scale + offset`` to all the vertices
+    of ``segments`` in one vectorized pass. The returned segments are views
+    into one array of transformed vertices.
+    '''
+    if len(segments) == 0:
+        return []
+
+    lengths = [len(seg) for seg in segments]
+    bounds = np.concatenate([[0], np.cumsum(lengths)])
+    vertices = np.concatenate(
+        [np.asarray(seg, dtype=np.float64).reshape(-1, 2) for seg in segments]
     )
+    vertices = vertices * scale + np.asarray(offset, dtype=np.float64)
+
+    return [vertices[bounds[j]:bounds[j + 1]] for j in range(len(segments))]
+
+#%%============================================================================
+def _draw_boundaries(projection, ax, arcs, linewidth, color):
+    '''
+    Draw polygon boundaries (the unique arcs returned by
+    :func:`~_get_unique_arcs`, so that each shared border is stroked only
+    once) onto ``ax`` as a LineCollection, and set the axes limits to the map
+    region of ``projection`` (a :class:`~_MapProjection`).
+
+    All the arcs are joined into one polyline, separated by NaN vertices
+    (where the line is broken), so that the boundaries are a single path in
+    vector output formats instead of thousands of path elements.
+    '''
+    from matplotlib.collections import LineCollection
+
+    if len(arcs) > 0:
+        separator = np.full((1, 2), np.nan)
+        arcs = [np.concatenate(
+            [part for arc in arcs for part in (np.asarray(arc), separator)][:-1]
+        )]
+
+    lines = LineCollection(arcs, antialiaseds=(1,))
+    lines.set_color(color)
+    lines.set_linewidth(linewidth)
+    lines.set_label('_nolabel_')
+    ax.add_collection(lines)
+    projection.set_axes_limits(ax)
+
+    return lines
+
+#%%============================================================================
+def _select_arcs(arcs, owners, is_selected):
+    '''
+    Select the arcs (returned by :func:`~_get_unique_arcs`) that belong to at
+    least one of the selected polygons (``is_selected``, a boolean array).
+    '''
+    keep = is_selected[owners[:, 0]] | is_selected[owners[:, 1]]
+    return [arc for arc, keep_ in zip(arcs, keep) if keep_]
+
+#%%============================================================================
+def _chain_arcs(arcs, signs):
+    '''
+    Chain directed arcs into closed rings, where each arc of ``arcs`` goes in
+    the order of its vertices if its sign (in ``signs``) is positive, and in
+    the reverse order otherwise. Each arc starts where the previous arc of its
+    ring ends. (Where several arcs start at the same vertex, any of them can
+    be the next one: the filled area with the nonzero winding rule is the
+    same.)
+
+    Returns
+    -------
+    path : matplotlib.path.Path
+        All the rings as one compound path.
+    '''
+    from matplotlib.path import Path
+
+    pieces = [
+        np.asarray(arc) if sign > 0 else np.asarray(arc)[::-1]
+        for arc, sign in zip(arcs, signs)
+    ]
+    starting_at = {}
+    for i, piece in enumerate(pieces):
+        starting_at.setdefault(piece[0].tobytes(), []).append(i)
+
+    is_used = np.zeros(len(pieces), dtype=bool)
+    rings = []
+    for i in range(len(pieces)):
+        if is_used[i]:
+            continue
+        ring = []
+        start = pieces[i][0].tobytes()
+        while True:
+            is_used[i] = True
+            ring.append(pieces[i][:-1])
+            end = pieces[i][-1].tobytes()
+            if end == start:
+                break
+            candidates = starting_at.get(end, [])
+            while candidates and is_used[candidates[-1]]:
+                candidates.pop()
+            if not candidates:  # an open ring (only if the data are broken)
+                break
+            i = candidates.pop()
+        ring.append(ring[0][:1])  # the closing vertex
+        rings.append(np.concatenate(ring))
+
+    if len(rings) == 0:
+        return Path(np.zeros((0, 2)))
+
+    lengths = np.array([len(ring) for ring in rings])
+    codes = np.full(lengths.sum(), Path.LINETO, dtype=Path.code_type)
+    ends = np.cumsum(lengths)
+    codes[ends - lengths] = Path.MOVETO
+    codes[ends - 1] = Path.CLOSEPOLY
+
+    return Path(np.concatenate(rings), codes)
+
+#%%============================================================================
+def _values_to_colors(values, cmap, norm, nan_color):
+    '''
+    Map data values to colors in one vectorized pass: normalize with ``norm``
+    and then apply ``cmap``.
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        Data values, already aligned to the order of the polygons.
+    cmap : matplotlib.colors.Colormap
+        Color map.
+    norm : matplotlib.colors.Normalize
+        Normalization (such as ``_MidpointNormalize``), shared with the
+        color bar.
+    nan_color : list<float>
+        RGB color for NaN values.
+
+    Returns
+    -------
+    colors : numpy.ndarray
+        RGBA colors, with shape (len(values), 4).
+    is_nan : numpy.ndarray
+        Boolean array indicating which values are NaN.
+    '''
+    values = np.asarray(values, dtype=float)
+    is_nan = np.isnan(values)
+
+    colors = cmap(norm(values))
+    colors[is_nan] = mpl.colors.to_rgba(nan_color)
+
+    return colors, is_nan
+
+#%%============================================================================
+class _SpatialIndex():
+    '''
+    A uniform grid over the bounding boxes of polygons, which finds the
+    polygon that contains a point by testing only the few polygons whose
+    bounding boxes overlap the grid cell of the point.
+
+    Parameters
+    ----------
+    segments : list<numpy.ndarray>
+        Vertices of each polygon, as arrays of shape (N, 2).
+    cells_per_polygon : float
+        Number of grid cells per polygon, which determines the grid size.
+    '''
+    def __init__(self, segments, cells_per_polygon=1.0):
+        self.segments = segments
+
+        n = len(segments)
+        lengths = np.array([len(seg) for seg in segments], dtype=np.int64)
+        self.bboxes = np.full((n, 4), np.nan)  # xmin, ymin, xmax, ymax
+        valid = np.flatnonzero(lengths > 0)
+        if len(valid) == 0:
+            self._cell_size = None
+            return
+
+        vertices = np.concatenate(
+            [np.asarray(segments[j], dtype=np.float64).reshape(-1, 2) for j in valid]
+        )
+        starts = np.concatenate([[0], np.cumsum(lengths[valid])[:-1]])
+        self.bboxes[valid, :2] = np.minimum.reduceat(vertices, starts, axis=0)
+        self.bboxes[valid, 2:] = np.maximum.reduceat(vertices, starts, axis=0)
+
+        #------  grid of (nearly) square cells over all the bounding boxes  ----
+        bboxes = self.bboxes[valid]
+        self._origin = bboxes[:, :2].min(axis=0)
+        extent = np.maximum(bboxes[:, 2:].max(axis=0) - self._origin, 1e-9)
+        n_cells = max(1.0, len(valid) * cells_per_polygon)
+        self._cell_size = max(
+            np.sqrt(extent[0] * extent[1] / n_cells), extent.max() / n_cells,
+        )
+        self._shape = np.maximum(np.ceil(extent / self._cell_size), 1).astype(np.int64)
+
+        #------  register each polygon in all the cells of its bounding box  ---
+        lo = self._get_cell(bboxes[:, 0], bboxes[:, 1])
+        hi = self._get_cell(bboxes[:, 2], bboxes[:, 3])
+        widths = hi[0] - lo[0] + 1
+        counts = widths * (hi[1] - lo[1] + 1)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        cell_x = np.repeat(lo[0], counts) + local % np.repeat(widths, counts)
+        cell_y = np.repeat(lo[1], counts) + local // np.repeat(widths, counts)
+        cell_ids = cell_y * self._shape[0] + cell_x
+
+        order = np.argsort(cell_ids, kind='stable')
+        self._polygons = np.repeat(valid, counts)[order]
+        self._cell_starts = np.searchsorted(
+            cell_ids[order], np.arange(self._shape.prod() + 1),
+        )
+
+    def _get_cell(self, x, y):
+        '''
+        Get the grid cell (column and row) of the points (x, y).
+        '''
+        ix = np.floor((np.asarray(x) - self._origin[0]) / self._cell_size)
+        iy = np.floor((np.asarray(y) - self._origin[1]) / self._cell_size)
+        return (
+            np.clip(ix, 0, self._shape[0] - 1).astype(np.int64),
+            np.clip(iy, 0, self._shape[1] - 1).astype(np.int64),
+        )
+
+    def query_candidates(self, x, y):
+        '''
+        Find the candidate polygons of many points at once: the polygons whose
+        bounding boxes contain each point.
+
+        Parameters
+        ----------
+        x, y : numpy.ndarray
+            Locations of the points (which need to be finite).
+
+        Returns
+        -------
+        point_index : numpy.ndarray
+            Indices of the points (in ``x`` and ``y``).
+        polygon_index : numpy.ndarray
+            Indices of the candidate polygons, one per item in ``point_index``.
+        '''
+        x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+        if self._cell_size is None or len(x) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+        ix, iy = self._get_cell(x, y)
+        cell = iy * self._shape[0] + ix
+        first = self._cell_starts[cell]
+        counts = self._cell_starts[cell + 1] - first
+        offsets = np.cumsum(counts) - counts
+        point_index = np.repeat(np.arange(len(x)), counts)
+        polygon_index = self._polygons[
+            np.arange(counts.sum()) + np.repeat(first - offsets, counts)
+        ]
+
+        bboxes = self.bboxes[polygon_index]
+        x_, y_ = x[point_index], y[point_index]
+        inside = (bboxes[:, 0] <= x_) & (x_ <= bboxes[:, 2]) \
+                 & (bboxes[:, 1] <= y_) & (y_ <= bboxes[:, 3])
+
+        return point_index[inside], polygon_index[inside]
+
+    def query(self, x, y):
+        '''
+        Find the polygon that contains the point (x, y). If several polygons
+        contain it (e.g., an enclave and the polygon around it), the one with
+        the smallest bounding box is returned.
+
+        Returns
+        -------
+        index : int or ``None``
+            The position of the polygon in ``segments``, or ``None`` if no
+            polygon contains the point.
+        '''
+        if self._cell_size is None or not (np.isfinite(x) and np.isfinite(y)):
+            return None
+
+        ix, iy = self._get_cell(x, y)
+        cell = iy * self._shape[0] + ix
+        candidates = self._polygons[self._cell_starts[cell]:self._cell_starts[cell + 1]]
+
+        bboxes = self.bboxes[candidates]
+        inside = (bboxes[:, 0] <= x) & (x <= bboxes[:, 2]) \
+                 & (bboxes[:, 1] <= y) & (y <= bboxes[:, 3])
+        candidates, bboxes = candidates[inside], bboxes[inside]
+        areas = (bboxes[:, 2] - bboxes[:, 0]) * (bboxes[:, 3] - bboxes[:, 1])
+
+        for j in candidates[np.argsort(areas, kind='stable')]:
+            if _point_in_polygon(x, y, self.segments[j]):
+                return int(j)
+
+        return None
+
+#%%============================================================================
+def _point_in_polygon(x, y, vertices):
+    '''
+    Whether the point (x, y) is inside the polygon ``vertices`` (an array of
+    shape (N, 2)), using the even-odd (ray casting) rule.
+    '''
+    vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 2)
+    xs, ys = vertices[:, 0], vertices[:, 1]
+    xs_next, ys_next = np.roll(xs, -1), np.roll(ys, -1)
+
+    crosses = (ys > y) != (ys_next > y)  # edges that cross the horizontal ray
+    x0, y0 = xs[crosses], ys[crosses]
+    x1, y1 = xs_next[crosses], ys_next[crosses]
+    x_cross = x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+
+    return np.count_nonzero(x_cross > x) % 2 == 1
+
+#%%============================================================================
+class _ChoroplethLayer():
+    '''
+    A PolyCollection of the map, together with the indices of its polygons in
+    the aligned data values, so that its colors can be updated in place.
+
+    Parameters
+    ----------
+    ax : matplotlib.axes._subplots.AxesSubplot
+        Axes object to draw onto.
+    segments : list
+        Vertices of each polygon.
+    rows : list<int>
+        The position of each polygon in the aligned data values.
+    edge_follows_face : bool
+        Whether the edge color of each polygon is the same as its face color.
+    nan_style : dict or ``None``
+        If not ``None``, polygons with NaN data are additionally drawn as a
+        separate overlay collection with this style (such as a hatch pattern,
+        which cannot be set per polygon within one collection).
+    **kwargs :
+        Other keyword arguments to be passed to PolyCollection.
+    '''
+    def __init__(
+            self, ax, segments, rows, edge_follows_face=False,
+            nan_style=None, **kwargs,
+    ):
+        self.ax = ax
+        self.segments = segments
+        self.rows = np.asarray(rows, dtype=int)
+        self.edge_follows_face = edge_follows_face
+        self.nan_style = nan_style
+        self.collection = _add_polygon_collection(
+            ax, segments, 'none', **kwargs
+        )
+        self.nan_collection = None
+        self._nan_rows = None
+
+    def set_colors(self, colors, is_nan):
+        '''
+        Set the face colors (and the NaN overlay) of this layer.
+
+        Parameters
+        ----------
+        colors : numpy.ndarray
+            RGBA colors of all the aligned data values.
+        is_nan : numpy.ndarray
+            Boolean array indicating which data values are NaN.
+        '''
+        if self.collection is None:  # no polygons in this layer
+            return
+
+        facecolors = colors[self.rows]
+        self.collection.set_facecolor(facecolors)
+        if self.edge_follows_face:
+            self.collection.set_edgecolor(facecolors)
+
+        if self.nan_style is not None:
+            nan_rows = is_nan[self.rows]
+            if self._nan_rows is None or not np.array_equal(nan_rows, self._nan_rows):
+                if self.nan_collection is not None:
+                    self.nan_collection.remove()
+                segments_nan = [
+                    self.segments[j] for j in np.flatnonzero(nan_rows)
+                ]
+                style = dict(self.nan_style)
+                facecolors_nan = style.pop('facecolors')
+                self.nan_collection = _add_polygon_collection(
+                    self.ax, segments_nan, facecolors_nan, **style
+                )
+                self._nan_rows = nan_rows
+
+#%%============================================================================
+class _DissolvedLayer():
+    '''
+    A variant of :class:`~_ChoroplethLayer` where adjacent polygons of the
+    same color are merged: each color is drawn as one compound path, made of
+    the arcs (see :func:`~_get_unique_arcs`) that are not shared by two
+    polygons of this color. The arcs keep the directions of the polygon
+    rings, so holes (and enclaves of other colors) stay unfilled under the
+    nonzero winding rule. The paths are rebuilt whenever the colors change.
+
+    Parameters
+    ----------
+    ax : matplotlib.axes._subplots.AxesSubplot
+        Axes object to draw onto.
+    segments : list
+        Vertices of each polygon.
+    rows : list<int>
+        The position of each polygon in the aligned data values.
+    arcs : (list, numpy.ndarray, numpy.ndarray) or ``None``
+        The unique arcs of the polygons, their owners, and their directions
+        (as returned by :func:`~_get_unique_arcs`), where the owners are the
+        positions in the aligned data values. (Arcs can also belong to
+        polygons that are not in ``rows``, which are ignored.) If ``None``,
+        they are computed from ``segments``.
+    **kwargs :
+        Other keyword arguments to be passed to PathCollection.
+    '''
+    def __init__(self, ax, segments, rows, arcs=None, **kwargs):
+        from matplotlib.collections import PathCollection
+
+        self.ax = ax
+        self.segments = segments
+        self.rows = np.asarray(rows, dtype=int)
+        if arcs is None:
+            arcs, owners, directions = _get_unique_arcs(segments)
+            owners = self.rows[owners] if len(self.rows) > 0 else owners
+        else:
+            arcs, owners, directions = arcs
+        self.arcs = arcs
+        self.owners = owners
+        self.directions = directions.astype(np.int64)
+        self.collection = PathCollection([], **kwargs)
+        ax.add_collection(self.collection)
+
+    def set_colors(self, colors, is_nan):
+        '''
+        Merge the polygons by their colors, and draw them.
+
+        Parameters
+        ----------
+        colors : numpy.ndarray
+            RGBA colors of all the aligned data values.
+        is_nan : numpy.ndarray
+            Boolean array indicating which data values are NaN. (Not used,
+            because NaN values already have their own color in ``colors``.)
+        '''
+        colors = np.asarray(colors)
+        if len(self.rows) == 0:
+            return
+
+        unique_colors, group = np.unique(
+            colors[self.rows], axis=0, return_inverse=True,
+        )
+        group_of_row = np.full(len(colors), -1, dtype=np.int64)
+        group_of_row[self.rows] = group.ravel()
+
+        #------  net direction of each arc in the boundary of each group  ------
+        groups = group_of_row[self.owners]
+        groups[self.owners[:, 0] == self.owners[:, 1], 1] = -1  # count once
+        arc_index = np.repeat(np.arange(len(self.owners))[:, None], 2, axis=1)
+        is_owned = groups >= 0
+        keys = arc_index[is_owned] * len(unique_colors) + groups[is_owned]
+        keys, inverse = np.unique(keys, return_inverse=True)
+        net = np.bincount(inverse, weights=self.directions[is_owned])
+        is_boundary = net != 0  # arcs inside a group cancel out
+        keys, net = keys[is_boundary], net[is_boundary]
+        boundary_arcs, boundary_groups = np.divmod(keys, len(unique_colors))
+
+        paths = []
+        for g in range(len(unique_colors)):
+            selected = np.flatnonzero(boundary_groups == g)
+            paths.append(_chain_arcs(
+                [self.arcs[a] for a in boundary_arcs[selected]], net[selected],
+            ))
+
+        self.collection.set_paths(paths)
+        self.collection.set_facecolor(unique_colors)
+        self.collection.set_edgecolor(unique_colors)
+
+#%%============================================================================
+def _calc_color_limits(data, vmin=None, vmax=None):
+    '''
+    Determine the limits of the color map: ``vmin`` and ``vmax`` if they are
+    specified, or otherwise the minimum and maximum values of ``data`` (a
+    dict or a pandas Series).
+    '''
+    values = pd.Series(data, dtype=float).values
+    if vmin is None:
+        vmin = np.nanmin(values)
+    if vmax is None:
+        vmax = np.nanmax(values)
+
+    return vmin, vmax
+
+#%%============================================================================
+def _get_color_norm(
+        vmin, vmax, cmap_midpoint=None, scheme=None, k=5, values=None,
+        ncolors=256,
+):
+    '''
+    Return a linear normalization between ``vmin`` and ``vmax``, or a
+    piecewise linear one if ``cmap_midpoint`` is not ``None``.
+
+    If ``scheme`` is not ``None``, return a BoundaryNorm instead, whose
+    boundaries are the class breaks of the data ``values`` (see
+    :func:`~_get_class_breaks`), spread over the ``ncolors`` colors of the
+    color map.
+    '''
+    from matplotlib.colors import BoundaryNorm
+
+    if scheme is not None:
+        breaks = _get_class_breaks(values, scheme, k, vmin, vmax)
+        norm = BoundaryNorm(breaks, ncolors=ncolors)
+    elif cmap_midpoint is None:
+        norm = Normalize(vmin=vmin, vmax=vmax)
+    else:
+        norm = hlp._MidpointNormalize(vmin=vmin, vmax=vmax, midpoint=cmap_midpoint)
+
+    return norm
+
+#%%============================================================================
+def _get_class_breaks(values, scheme, k, vmin, vmax):
+    '''
+    Classify the data ``values`` (clipped to ``vmin`` and ``vmax``) into ``k``
+    classes using ``scheme`` (see :func:`~choropleth_map_state`).
 
-    #---------   draw state boundaries  ----------------------------------------
-    if shapefile_dir is None:
-        shapefile_dir = pkg_resources.resource_filename('plot_utils', 'shapefiles/')
-    shp_path_state = os.path.join(shapefile_dir, 'usa_states', 'st99_d00')
-    try:
-        shp_info = m.readshapefile(
-            shp_path_state, 'states', drawbounds=True,
-            linewidth=0.45, color='gray',
+    Returns
+    -------
+    breaks : numpy.ndarray
+        The class boundaries, in increasing order, starting from ``vmin`` and
+        ending at ``vmax``. There are fewer than ``k`` classes if the data have
+        fewer than ``k`` distinct values.
+    '''
+    if scheme not in ['quantiles', 'equal_interval', 'natural_breaks']:
+        raise ValueError(
+            "`scheme` must be None, 'quantiles', 'equal_interval', or "
+            "'natural_breaks'."
         )
-        shp_info_ = m_.readshapefile(shp_path_state, 'states', drawbounds=False)
-    except IOError:
-        raise IOError('Shape files not found. Specify the location of the "shapefiles" folder.')
+    if not isinstance(k, (int, np.integer)) or k < 1:
+        raise ValueError('`k` must be a positive integer.')
 
-    #-------- choose a color for each state based on population density. -------
-    colors={}
-    statenames=[]
-    cmap = plt.get_cmap(cmap)
-    if vmin is None:
-        vmin = np.nanmin(list(data_per_state.values()))
-    if vmax is None:
-        vmax = np.nanmax(list(data_per_state.values()))
-    for shapedict in m.states_info:
-        statename = shapedict['NAME']
-        # skip DC and Puerto Rico.
-        if statename not in ['District of Columbia','Puerto Rico']:
-            data_ = data_per_state[statename]
-            if not np.isnan(data_):
-                # calling colormap with value between 0 and 1 returns rgba value.
-                colors[statename] = cmap(float(data_-vmin)/(vmax-vmin))[:3]
-            else:  # if data_ is NaN, set color to light grey, and with hatching pattern
-                colors[statename] = None #np.nan#[0.93]*3
-        statenames.append(statename)
+    values = np.asarray(values, dtype=float).ravel()
+    values = np.clip(values[np.isfinite(values)], vmin, vmax)
 
-    #---------  cycle through state names, color each one.  --------------------
-    ax = plt.gca() # get current axes instance
-
-    for nshape, seg in enumerate(m.states):
-        # skip DC and Puerto Rico.
-        if statenames[nshape] not in ['Puerto Rico', 'District of Columbia']:
-            if colors[statenames[nshape]] == None:
-                color = rgb2hex([0.93] * 3)
-                poly = Polygon(seg, facecolor=color, edgecolor=[0.4]*3, hatch='\\')
-            else:
-                color = rgb2hex(colors[statenames[nshape]])
-                poly = Polygon(seg, facecolor=color, edgecolor=color)
-
-            ax.add_patch(poly)
-
-    AREA_1 = 0.005  # exclude small Hawaiian islands that are smaller than AREA_1
-    AREA_2 = AREA_1 * 30.0  # exclude Alaskan islands that are smaller than AREA_2
-    AK_SCALE = 0.19  # scale down Alaska to show as a map inset
-    HI_OFFSET_X = -1900000  # X coordinate offset amount to move Hawaii "beneath" Texas
-    HI_OFFSET_Y = 250000    # similar to above: Y offset for Hawaii
-    AK_OFFSET_X = -250000   # X offset for Alaska (These four values are obtained
-    AK_OFFSET_Y = -750000   # via manual trial and error, thus changing them is not recommended.)
-
-    for nshape, shapedict in enumerate(m_.states_info):  # plot Alaska and Hawaii as map insets
-        if shapedict['NAME'] in ['Alaska', 'Hawaii']:
-            seg = m_.states[int(shapedict['SHAPENUM'] - 1)]
-            if shapedict['NAME']=='Hawaii' and float(shapedict['AREA'])>AREA_1:
-                seg = [
-                    (x + HI_OFFSET_X, y + HI_OFFSET_Y)
-                    for x, y in seg
-                ]
-            elif shapedict['NAME']=='Alaska' and float(shapedict['AREA'])>AREA_2:
-                seg = [
-                    (x * AK_SCALE + AK_OFFSET_X, y * AK_SCALE + AK_OFFSET_Y)
-                    for x, y in seg
-                ]
+    if len(values) == 0 or scheme == 'equal_interval':
+        breaks = np.linspace(vmin, vmax, k + 1)
+    elif scheme == 'quantiles':
+        breaks = np.quantile(values, np.linspace(0, 1, k + 1))
+    else:
+        breaks = _fisher_jenks_breaks(values, k)
 
-            if colors[statenames[nshape]] == None:
-                color = rgb2hex([0.93] * 3)
-                poly = Polygon(
-                    seg, facecolor=color, edgecolor='gray',
-                    linewidth=.45, hatch='\\',
-                )
-            else:
-                color = rgb2hex(colors[statenames[nshape]])
-                poly = Polygon(
-                    seg, facecolor=color, edgecolor='gray', linewidth=.45,
-                )
+    breaks = np.unique(np.concatenate([[vmin], breaks[1:-1], [vmax]]))
+    if len(breaks) < 2:  # all the values are the same
+        breaks = np.array([breaks[0] - 0.5, breaks[0] + 0.5])
 
-            ax.add_patch(poly)
+    return breaks
 
-    ax.set_title(map_title)
+#%%============================================================================
+def _fisher_jenks_breaks(values, k):
+    '''
+    Compute the Jenks natural breaks of ``values`` into ``k`` classes, using
+    Fisher's exact dynamic programming on the sorted unique values (weighted
+    by their counts).
+
+    The optimal start of the last class does not decrease as the end of the
+    data moves right, so each step of the dynamic programming is solved by
+    divide and conquer, vectorized over all the subproblems at the same
+    recursion depth. This takes O(k * m * log(m)) time for m unique values,
+    instead of the O(k * n^2) time of the naive algorithm.
+
+    Returns
+    -------
+    breaks : numpy.ndarray
+        The minimum value, the smallest value of each of the other classes,
+        and the maximum value.
+    '''
+    x, counts = np.unique(values, return_counts=True)
+    m = len(x)
+    if m <= k:  # each unique value is a class
+        return np.concatenate([x, x[-1:]])
+
+    # prefix sums, for the sum of squared deviations of x[s], ..., x[j]
+    W = np.concatenate([[0.0], np.cumsum(counts)])
+    S1 = np.concatenate([[0.0], np.cumsum(counts * x)])
+    S2 = np.concatenate([[0.0], np.cumsum(counts * x * x)])
+
+    def ssd(s, j):
+        s1 = S1[j + 1] - S1[s]
+        return np.maximum(S2[j + 1] - S2[s] - s1 * s1 / (W[j + 1] - W[s]), 0.0)
+
+    cost = ssd(np.zeros(m, dtype=np.int64), np.arange(m))  # one class
+    last_start = np.zeros((k, m), dtype=np.int64)
+    for c in range(1, k):  # classes 0, ..., c for x[0], ..., x[j] (j >= c)
+        new_cost = np.full(m, np.inf)
+        # subproblems: j in [j_lo, j_hi], with the start of the last class
+        # in [s_lo, s_hi]
+        j_lo, j_hi = np.array([c]), np.array([m - 1])
+        s_lo, s_hi = np.array([c]), np.array([m - 1])
+        while len(j_lo) > 0:
+            mid = (j_lo + j_hi) // 2
+            n_candidates = np.minimum(mid, s_hi) - s_lo + 1
+            first = np.cumsum(n_candidates) - n_candidates
+            s = np.arange(n_candidates.sum()) + np.repeat(s_lo - first, n_candidates)
+            candidate_cost = cost[s - 1] + ssd(s, np.repeat(mid, n_candidates))
+
+            best_cost = np.minimum.reduceat(candidate_cost, first)
+            is_best = candidate_cost <= np.repeat(best_cost, n_candidates)
+            best_s = np.minimum.reduceat(np.where(is_best, s, m), first)
+            new_cost[mid] = best_cost
+            last_start[c, mid] = best_s
+
+            left, right = mid > j_lo, mid < j_hi
+            j_lo, j_hi, s_lo, s_hi = (
+                np.concatenate([j_lo[left], mid[right] + 1]),
+                np.concatenate([mid[left] - 1, j_hi[right]]),
+                np.concatenate([s_lo[left], best_s[right]]),
+                np.concatenate([best_s[left], s_hi[right]]),
+            )
+
+        cost = new_cost
+
+    starts = []
+    j = m - 1
+    for c in range(k - 1, 0, -1):
+        j = last_start[c, j]
+        starts.append(j)
+        j -= 1
+
+    return np.concatenate([x[:1], x[starts[::-1]], x[-1:]])
 
-    #---------  Plot bounding boxes for Alaska and Hawaii insets  --------------
+#%%============================================================================
+def _draw_inset_bounding_boxes(m_, ax):
+    '''
+    Plot the bounding boxes of the Alaska and Hawaii insets onto ``ax``, using
+    the Mercator projection object ``m_``.
+    '''
     light_gray = [0.8] * 3
     m_.plot(
-        np.linspace(170, 177), np.linspace(29, 29), linewidth=1.,
-        color=light_gray, latlon=True,
+        np.linspace(170, 177), np.linspace(29, 29), ax,
+        linewidth=1., color=light_gray,
     )
     m_.plot(
-        np.linspace(177, 180), np.linspace(29, 26), linewidth=1.,
-        color=light_gray, latlon=True,
+        np.linspace(177, 180), np.linspace(29, 26), ax,
+        linewidth=1., color=light_gray,
     )
     m_.plot(
-        np.linspace(180, 180), np.linspace(26, 23), linewidth=1.,
-        color=light_gray, latlon=True,
+        np.linspace(180, 180), np.linspace(26, 23), ax,
+        linewidth=1., color=light_gray,
     )
     m_.plot(
-        np.linspace(-180, -177), np.linspace(23, 20), linewidth=1.,
-        color=light_gray, latlon=True,
+        np.linspace(-180, -177), np.linspace(23, 20), ax,
+        linewidth=1., color=light_gray,
     )
     m_.plot(
-        np.linspace(-180, -175), np.linspace(26, 26), linewidth=1.,
-        color=light_gray, latlon=True,
+        np.linspace(-180, -175), np.linspace(26, 26), ax,
+        linewidth=1., color=light_gray,
     )
     m_.plot(
-        np.linspace(-175, -171), np.linspace(26, 22), linewidth=1.,
-        color=light_gray, latlon=True,
+        np.linspace(-175, -171), np.linspace(26, 22), ax,
+        linewidth=1., color=light_gray,
     )
     m_.plot(
-        np.linspace(-171, -171), np.linspace(22, 20), linewidth=1.,
-        color=light_gray, latlon=True,
+        np.linspace(-171, -171), np.linspace(22, 20), ax,
+        linewidth=1., color=light_gray,
     )
 
-    #---------   Show color bar  ---------------------------------------
-    if cmap_midpoint is None:
-        norm = Normalize(vmin=vmin, vmax=vmax)
-    else:
-        norm = hlp._MidpointNormalize(vmin=vmin, vmax=vmax, midpoint=cmap_midpoint)
+#%%============================================================================
+def _add_colorbar(ax, cmap, norm, unit, values, vmin, vmax):
+    '''
+    Show a color bar on the right side of ``ax``, and mark the top/bottom tick
+    labels if the data ``values`` are clipped by ``vmax``/``vmin``.
+    '''
+    from matplotlib.colorbar import ColorbarBase
+    from mpl_toolkits.axes_grid1 import make_axes_locatable
 
     divider = make_axes_locatable(ax)
     cax = divider.append_axes("right", size="3%", pad=0.08)
     cb = ColorbarBase(cax, cmap=cmap, norm=norm, orientation='vertical', label=unit)
 
-    if LooseVersion(mpl.__version__) >= LooseVersion('2.1.0'):
-        cb = _adjust_colorbar_tick_labels(
-            cb,
-            np.nanmax(list(data_per_state.values())) > vmax,
-            np.nanmin(list(data_per_state.values())) < vmin,
-        )
+    if isinstance(norm, mpl.colors.BoundaryNorm):  # one tick per class break
+        cb.set_ticks(norm.boundaries)
 
-    #---------   Set overall font size  --------------------------------
-    for o in fig.findobj(mpl.text.Text):
-        o.set_fontsize(fontsize)
+    cb = _adjust_colorbar_tick_labels(
+        cb, np.nanmax(values) > vmax, np.nanmin(values) < vmin,
+    )
 
-    return fig, ax  # return figure and axes handles
+    return cb
 
 #%%============================================================================
-def choropleth_map_county(
-        data_per_county, fig=None, ax=None, figsize=(10,7),
-        dpi=100, vmin=None, vmax=None, unit='', cmap='OrRd',
-        map_title='USA county map', fontsize=14,
-        cmap_midpoint=None, shapefile_dir=None,
-    ):
+def _update_colorbar(colorbar_obj, norm, values, vmin, vmax, fontsize):
     '''
-    Generate a choropleth map of the US (including Alaska and Hawaii), on a
-    county level.
-
-    According to Wikipedia, a choropleth map is a thematic map in which areas
-    are shaded or patterned in proportion to the measurement of the statistical
-    variable being displayed on the map, such as population density or
-    per-capita income.
-
-    Parameters
-    ----------
-    data_per_county : dict or pandas.Series or pandas.DataFrame
-        Numerical data of each county, to be plotted onto the map.
-        Acceptable data types include:
-            - pandas Series: Index should be valid county identifiers (i.e.,
-                             5-digit county FIPS codes)
-            - pandas DataFrame: The dataframe can have only one column (with
-                                the index being valid county identifiers), two
-                                columns (with one of the column named 'state',
-                                'State', or 'FIPS_code', and containing county
-                                identifiers).
-            - dictionary: with keys being valid county identifiers, and values
-                          being the numerical values to be visualized
-    fig : matplotlib.figure.Figure or ``None``
-        Figure object. If None, a new figure will be created.
-    ax : matplotlib.axes._subplots.AxesSubplot or ``None``
-        Axes object. If None, a new axes will be created.
-    figsize: (float, float)
-        Figure size in inches, as a tuple of two numbers. The figure
-        size of ``fig`` (if not ``None``) will override this parameter.
-    dpi : float
-        Figure resolution. The dpi of ``fig`` (if not ``None``) will override
-        this parameter.
-    vmin : float
-        Minimum value to be shown on the map. If ``vmin`` is larger than the
-        actual minimum value in the data, some of the data values will be
-        "clipped". This is useful if there are extreme values in the data
-        and you do not want those values to complete skew the color
-        distribution.
-    vmax : float
-        Maximum value to be shown on the map. Similar to ``vmin``.
-    map_title : str
-        Title of the map, to be shown on the top of the map.
-    unit : str
-        Unit of the numerical (for example, "population per km^2"), to be
-        shown on the right side of the color bar.
-    cmap : str or <matplotlib.colors.Colormap>
-        Color map name. Suggested names: 'hot_r', 'summer_r', and 'RdYlBu'
-        for plotting deviation maps.
-    fontsize : scalar
-        Font size of all the texts on the map.
-    cmap_midpoint : float
-        A numerical value that specifies the "deviation point". For example,
-        if your data ranges from -200 to 1000, and you want negative values
-        to appear blue-ish, and positive values to appear red-ish, then you
-        can set ``cmap_midpoint`` to 0.0. If ``None``, then the "deviation
-        point" will be the median value of the data values.
-    shapefile_dir : str
-        Directory where shape files are stored. Shape files (state level and
-        county level) should be organized as follows:
-            ``shapefile_dir``/usa_states/st99_d00.(...)
-            ``shapefile_dir``/usa_counties/cb_2016_us_county_500k.(...)
-        If ``None``, the shapefile directory within this library will be used.
-
-    Returns
-    -------
-    fig : matplotlib.figure.Figure
-        The figure object being created or being passed into this function.
-    ax : matplotlib.axes._subplots.AxesSubplot
-        The axes object being created or being passed into this function.
-
-    References
-    ----------
-    This function is based partly on an example in the Basemap repository
-    (https://github.com/matplotlib/basemap/blob/master/examples/fillstates.py)
-    as well as a modification on Stack Overflow
-    (https://stackoverflow.com/questions/39742305).
+    Update the limits (i.e., ``norm``) of an existing color bar created by
+    :func:`~_add_colorbar`, and re-mark its top/bottom tick labels according
+    to the data ``values``.
     '''
-    try:
-        from mpl_toolkits.basemap import Basemap as Basemap
-    except ImportError:
-        raise ImportError(basemap_error_msg)
-    except KeyError as e:
-        if e.args[0] == 'PROJ_LIB':
-            raise Exception(proj_lib_error_msg)
-        else:
-            raise e
-
-    import pkg_resources
-    from matplotlib.colors import rgb2hex
-    from matplotlib.patches import Polygon
-    from matplotlib.colorbar import ColorbarBase
-    from mpl_toolkits.axes_grid1 import make_axes_locatable
-
-    if isinstance(data_per_county, pd.Series):
-        data_per_county = data_per_county.to_dict()  # convert to dict
-    elif isinstance(data_per_county, pd.DataFrame):
-        if data_per_county.shape[1] == 1:  # only one column
-            data_per_county = data_per_county.iloc[:,0].to_dict()
-        elif data_per_county.shape[1] == 2:  # two columns
-            if 'FIPS_code' in data_per_county.columns:
-                data_per_county = data_per_county.set_index('FIPS_code')
-            else:
-                raise ValueError(
-                    '`data_per_county` should have a column named "FIPS_code".'
-                )
-            data_per_county = data_per_county.iloc[:,0].to_dict()
-        else:  # more than two columns
-            raise hlp.DimensionError('`data_per_county` should have only two columns.')
-    elif isinstance(data_per_county,dict):
-        pass
-    else:
-        raise TypeError(
-            '`data_per_county` should be pandas.Series, pandas.DataFrame, or dict.'
-        )
+    colorbar_obj.mappable.set_norm(norm)
+    colorbar_obj.update_normal(colorbar_obj.mappable)
 
-    fig, ax = hlp._process_fig_ax_objects(fig, ax, figsize, dpi)
+    if isinstance(norm, mpl.colors.BoundaryNorm):  # one tick per class break
+        colorbar_obj.set_ticks(norm.boundaries)
 
-    # Lambert Conformal map of lower 48 states.
-    m = Basemap(
-        llcrnrlon=-119, llcrnrlat=20, urcrnrlon=-64, urcrnrlat=49,
-        projection='lcc', lat_1=33, lat_2=45, lon_0=-95,
+    colorbar_obj = _adjust_colorbar_tick_labels(
+        colorbar_obj, np.nanmax(values) > vmax, np.nanmin(values) < vmin,
     )
 
-    # Mercator projection, for Alaska and Hawaii
-    m_ = Basemap(
-        llcrnrlon=-190, llcrnrlat=20, urcrnrlon=-143, urcrnrlat=46,
-        projection='merc', lat_ts=20,  # do not change these numbers
-    )
+    for o in colorbar_obj.ax.findobj(mpl.text.Text):
+        o.set_fontsize(fontsize)
 
-    #---------   draw state and county boundaries  ----------------------------
-    if shapefile_dir is None:
-        shapefile_dir = pkg_resources.resource_filename('plot_utils', 'shapefiles/')
-    shp_path_state = os.path.join(shapefile_dir, 'usa_states', 'st99_d00')
-    try:
-        shp_info = m.readshapefile(shp_path_state, 'states', drawbounds=True,
-                                   linewidth=0.45, color='gray')
-        shp_info_ = m_.readshapefile(shp_path_state, 'states', drawbounds=False)
-    except IOError:
-        raise IOError(
-            'Shape files not found. Specify the location of the "shapefiles" folder.'
-        )
+    return colorbar_obj
 
-    cbc = [0.75] * 3  # county boundary color
-    cbw = 0.15  # county boundary line width
-    shp_path_county = os.path.join(shapefile_dir, 'usa_counties', 'cb_2016_us_county_500k')
-    try:
-        shp_info_cnty = m.readshapefile(
-            shp_path_county, 'counties', drawbounds=True, linewidth=cbw, color=cbc,
-        )
-        shp_info_cnty_ = m_.readshapefile(
-            shp_path_county, 'counties', drawbounds=False,
-        )
-    except IOError:
-        raise IOError(
-            'Shape files not found. Specify the location of the "shapefiles" folder.'
+#%%============================================================================
+def _get_layer_factory(render, raster_pixel_size, fig, ax, projection):
+    '''
+    Return the class (or a function) that creates the layers of polygons of
+    the map, according to ``render`` (see :func:`~choropleth_map_state`).
+    '''
+    if render == 'vector':
+        return _ChoroplethLayer
+    if render != 'raster':
+        raise ValueError("`render` must be either 'vector' or 'raster'.")
+
+    if raster_pixel_size is None:
+        raster_pixel_size = _get_pixel_size(fig, ax, projection)
+    if not raster_pixel_size > 0:
+        raise ValueError('`raster_pixel_size` must be a positive number.')
+
+    def add_layer(ax, segments, rows, edgecolors=None, linewidths=None, **kwargs):
+        return _RasterLayer(  # other styles (e.g., hatching) are not supported
+            ax, segments, rows, raster_pixel_size,
+            edgecolors=edgecolors, linewidths=linewidths,
         )
 
-    #-------- choose a color for each county based on unemployment rate -------
-    colors={}
-    county_FIPS_code_list=[]
-    cmap = plt.get_cmap(cmap)
-    if vmin is None:
-        vmin = np.nanmin(list(data_per_county.values()))
-    if vmax is None:
-        vmax = np.nanmax(list(data_per_county.values()))
-    for shapedict in m.counties_info:
-        county_FIPS_code = shapedict['GEOID']
-        if county_FIPS_code in data_per_county.keys():
-            data_ = data_per_county[county_FIPS_code]
-        else:
-            data_ = np.nan
+    return add_layer
 
-        # calling colormap with value between 0 and 1 returns rgba value.
-        if not np.isnan(data_):
-            colors[county_FIPS_code] = cmap(float(data_-vmin)/(vmax-vmin))[:3]
-        else:
-            colors[county_FIPS_code] = None
+#%%============================================================================
+class _RasterLayer():
+    '''
+    The raster counterpart of :class:`~_ChoroplethLayer`: the polygons are
+    rasterized (once, and cached) into an image of labels, where a pixel is
+    ``j + 1`` if it is inside the j-th polygon and 0 outside of all polygons.
+    Coloring the polygons is then a single lookup of the colors by the labels.
 
-        county_FIPS_code_list.append(county_FIPS_code)
+    Parameters
+    ----------
+    ax : matplotlib.axes._subplots.AxesSubplot
+        Axes object to draw onto.
+    segments : list
+        Vertices of each polygon.
+    rows : list<int>
+        The position of each polygon in the aligned data values.
+    pixel_size : float
+        Size of a pixel, in the data coordinates of ``ax``.
+    edgecolors : color or ``None``
+        If not ``None``, the outlines of the polygons are drawn (as vector
+        lines, only once) in this color.
+    linewidths : float or ``None``
+        Line width of the outlines.
+    '''
+    def __init__(
+            self, ax, segments, rows, pixel_size,
+            edgecolors=None, linewidths=None,
+    ):
+        from matplotlib.collections import LineCollection
+
+        self.ax = ax
+        self.segments = segments
+        self.rows = np.asarray(rows, dtype=int)
+        self.image = None
+        if len(segments) == 0:  # no polygons in this layer
+            return
+
+        self.labels, extent = _get_label_image(segments, pixel_size)
+        self.image = ax.imshow(
+            np.zeros(self.labels.shape + (4,), dtype=np.uint8),
+            extent=extent, origin='upper', interpolation='nearest',
+        )
+        if edgecolors is not None:
+            ax.add_collection(LineCollection(
+                segments, colors=edgecolors, linewidths=linewidths,
+            ))
+
+    def set_colors(self, colors, is_nan):
+        '''
+        Set the colors of the polygons of this layer.
+
+        Parameters
+        ----------
+        colors : numpy.ndarray
+            RGBA colors of all the aligned data values.
+        is_nan : numpy.ndarray
+            Boolean array indicating which data values are NaN. (Not used,
+            because NaN values already have their own color in ``colors``.)
+        '''
+        if self.image is None:
+            return
+
+        lut = np.zeros((len(self.rows) + 1, 4), dtype=np.uint8)  # 0: transparent
+        lut[1:] = np.round(np.asarray(colors)[self.rows] * 255)
+        self.image.set_data(lut[self.labels])
 
-    #---------  cycle through county names, color each one.  --------------------
-    AK_SCALE = 0.19  # scale down Alaska to show as a map inset
-    HI_OFFSET_X = -1900000  # X coordinate offset amount to move Hawaii "beneath" Texas
-    HI_OFFSET_Y = 250000    # similar to above: Y offset for Hawaii
-    AK_OFFSET_X = -250000   # X offset for Alaska (These four values are obtained
-    AK_OFFSET_Y = -750000   # via manual trial and error, thus changing them is not recommended.)
-
-    for j, seg in enumerate(m.counties):  # for 48 lower states
-        shapedict = m.counties_info[j]  # query shape dict at j-th position
-        if shapedict['STATEFP'] not in ['02','15']:  # not Alaska or Hawaii
-            if colors[county_FIPS_code_list[j]] == None:
-                color = rgb2hex([0.93] * 3)
-                poly = Polygon(seg, facecolor=color, edgecolor=color)
-            else:
-                color = rgb2hex(colors[county_FIPS_code_list[j]])
-                poly = Polygon(seg, facecolor=color, edgecolor=color)
-            ax.add_patch(poly)
-
-    for j, seg in enumerate(m_.counties):  # for Alaska and Hawaii
-        shapedict = m.counties_info[j]  # query shape dict at j-th position
-        if shapedict['STATEFP'] == '02':  # Alaska
-            seg = [
-                (x * AK_SCALE + AK_OFFSET_X, y * AK_SCALE + AK_OFFSET_Y)
-                for x, y in seg
-            ]
-            if colors[county_FIPS_code_list[j]] == None:
-                color = rgb2hex([0.93]*3)
-                poly = Polygon(seg, facecolor=color, edgecolor=cbc, lw=cbw)
-            else:
-                color = rgb2hex(colors[county_FIPS_code_list[j]])
-                poly = Polygon(seg, facecolor=color, edgecolor=cbc, lw=cbw)
-            ax.add_patch(poly)
-        if shapedict['STATEFP'] == '15':  # Hawaii
-            seg = [(x + HI_OFFSET_X, y + HI_OFFSET_Y) for x, y in seg]
-            if colors[county_FIPS_code_list[j]] == None:
-                color = rgb2hex([0.93] * 3)
-                poly = Polygon(seg, facecolor=color, edgecolor=cbc, lw=cbw)
-            else:
-                color = rgb2hex(colors[county_FIPS_code_list[j]])
-                poly = Polygon(seg, facecolor=color, edgecolor=cbc, lw=cbw)
-            ax.add_patch(poly)
+#%%============================================================================
+def _get_label_image(segments, pixel_size):
+    '''
+    Rasterize the polygons ``segments`` into an image of labels (``j + 1`` for
+    the pixels inside the j-th polygon, and 0 elsewhere), where each pixel is
+    a square of size ``pixel_size``. Later polygons are on top of earlier
+    ones, the same as in a PolyCollection. The result is cached by the
+    vertices of the polygons and by ``pixel_size``.
 
-    ax.set_title(map_title)
+    Returns
+    -------
+    labels : numpy.ndarray
+        The label image (the first row is the top of the image).
+    extent : (float, float, float, float)
+        The extent (left, right, bottom, top) of the image.
+    '''
+    import hashlib
 
-    #------------  Plot bounding boxes for Alaska and Hawaii insets  --------------
-    light_gray = [0.8] * 3
-    m_.plot(
-        np.linspace(170, 177), np.linspace(29, 29), linewidth=1.,
-        color=light_gray, latlon=True,
-    )
-    m_.plot(
-        np.linspace(177, 180), np.linspace(29, 26), linewidth=1.,
-        color=light_gray, latlon=True,
-    )
-    m_.plot(
-        np.linspace(180, 180), np.linspace(26, 23), linewidth=1.,
-        color=light_gray, latlon=True,
-    )
-    m_.plot(
-        np.linspace(-180, -177), np.linspace(23, 20), linewidth=1.,
-        color=light_gray, latlon=True,
-    )
-    m_.plot(
-        np.linspace(-180, -175), np.linspace(26, 26), linewidth=1.,
-        color=light_gray, latlon=True,
-    )
-    m_.plot(
-        np.linspace(-175, -171), np.linspace(26, 22), linewidth=1.,
-        color=light_gray, latlon=True,
+    lengths = np.array([len(seg) for seg in segments], dtype=np.int64)
+    vertices = np.concatenate(
+        [np.asarray(seg, dtype=np.float64).reshape(-1, 2) for seg in segments]
     )
-    m_.plot(
-        np.linspace(-171, -171), np.linspace(22, 20), linewidth=1.,
-        color=light_gray, latlon=True,
+    digest = hashlib.sha1(lengths.tobytes() + vertices.tobytes()).hexdigest()
+
+    xmin, ymin = np.floor(vertices.min(axis=0) / pixel_size) * pixel_size
+    width, height = np.maximum(
+        np.ceil((vertices.max(axis=0) - (xmin, ymin)) / pixel_size), 1,
+    ).astype(int)
+    extent = (xmin, xmin + width * pixel_size, ymin, ymin + height * pixel_size)
+
+    def loader():
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.collections import PolyCollection
+
+        # draw each polygon (without anti-aliasing) in a color that encodes
+        # its label in the R, G, and B channels
+        labels = np.arange(1, len(segments) + 1)
+        codes = np.column_stack(
+            [labels & 255, (labels >> 8) & 255, (labels >> 16) & 255]
+        )
+        facecolors = np.column_stack([codes / 255.0, np.ones(len(segments))])
+
+        fig = Figure(figsize=(width, height), dpi=1, facecolor=(0, 0, 0, 0))
+        canvas = FigureCanvasAgg(fig)
+        ax = fig.add_axes([0, 0, 1, 1])
+        ax.set_axis_off()
+        ax.set_xlim(extent[:2])
+        ax.set_ylim(extent[2:])
+        ax.add_collection(PolyCollection(
+            segments, facecolors=facecolors, edgecolors='none',
+            linewidths=0, antialiaseds=False,
+        ))
+        canvas.draw()
+
+        rgba = np.asarray(canvas.buffer_rgba()).astype(np.int32)
+        label_image = rgba[..., 0] | (rgba[..., 1] << 8) | (rgba[..., 2] << 16)
+        label_image[rgba[..., 3] == 0] = 0  # outside of all polygons
+
+        return label_image
+
+    labels = _get_from_map_cache(
+        ('label_image', digest, float(pixel_size), extent), loader,
     )
 
-    #------------   Show color bar   ---------------------------------------
-    if cmap_midpoint is None:
-        norm = Normalize(vmin=vmin, vmax=vmax)
-    else:
-        norm = hlp._MidpointNormalize(vmin=vmin, vmax=vmax, midpoint=cmap_midpoint)
+    return labels, extent
 
-    divider = make_axes_locatable(ax)
-    cax = divider.append_axes("right", size="3%", pad=0.08)
-    cb = ColorbarBase(cax,cmap=cmap,norm=norm,orientation='vertical',label=unit)
+#%%============================================================================
+def _add_polygon_collection(ax, segments, facecolors, **kwargs):
+    '''
+    Draw polygons onto ``ax`` as a single PolyCollection, which is much faster
+    to draw (and much smaller in vector output formats) than adding one
+    Polygon patch per polygon.
 
-    if LooseVersion(mpl.__version__) >= LooseVersion('2.1.0'):
-        cb = _adjust_colorbar_tick_labels(
-            cb,
-            np.nanmax(list(data_per_county.values())) > vmax,
-            np.nanmin(list(data_per_county.values())) < vmin,
-        )
+    Parameters
+    ----------
+    ax : matplotlib.axes._subplots.AxesSubplot
+        Axes object to draw onto.
+    segments : list
+        Vertices of each polygon.
+    facecolors : list or array or color
+        Face color of each polygon, or a single color for all polygons.
+    **kwargs :
+        Other keyword arguments to be passed to PolyCollection, such as
+        ``edgecolors``, ``linewidths``, ``hatch``.
 
-    #------------   Set overall font size  --------------------------------
-    for o in fig.findobj(mpl.text.Text):
-        o.set_fontsize(fontsize)
+    Returns
+    -------
+    collection : matplotlib.collections.PolyCollection or ``None``
+        The collection being added (``None`` if ``segments`` is empty).
+    '''
+    from matplotlib.collections import PolyCollection
 
-    return fig, ax  # return figure and axes handles
+    if len(segments) == 0:
+        return None
+
+    collection = PolyCollection(segments, facecolors=facecolors, **kwargs)
+    ax.add_collection(collection)
+
+    return collection
 
 #%%============================================================================
 def _adjust_colorbar_tick_labels(colorbar_obj, adjust_top=True, adjust_bottom=True):
@@ -628,7 +3939,10 @@ def _adjust_colorbar_tick_labels(colorbar_obj, adjust_top=True, adjust_bottom=Tr
           does not check for matplotlib version. Use with caution.
     '''
     cbar_ticks = colorbar_obj.get_ticks()  # get_ticks() is only added in ver 2.1.0
-    new_ticks = [str(int(a)) if int(a)==a else str(a) for a in cbar_ticks]  # convert to int if possible
+    if isinstance(colorbar_obj.norm, mpl.colors.BoundaryNorm):  # class breaks
+        new_ticks = ['%.4g' % a for a in cbar_ticks]
+    else:
+        new_ticks = [str(int(a)) if int(a)==a else str(a) for a in cbar_ticks]  # convert to int if possible
 
     if (adjust_top == True) and (adjust_bottom == True):
         new_ticks[-1] = '>' + new_ticks[-1]   # adjust_top and adjust_bottom may
@@ -656,40 +3970,24 @@ def _convert_FIPS_to_state_name(dict1):
 
     Returns
     -------
-    dict3 : dict
-        A dictionary whose keys are state abbreviations. Its values of each
-        state come from ``dict``.
+    dict2 : dict
+        A dictionary whose keys are full state names. Its values of each
+        state come from ``dict1``.
     '''
     assert(isinstance(dict1, dict))
 
-    fips2state = {
-        "01": "AL", "02": "AK", "04": "AZ", "05": "AR", "06": "CA",
-        "08": "CO", "09": "CT", "10": "DE", "11": "DC", "12": "FL",
-        "13": "GA", "15": "HI", "16": "ID", "17": "IL", "18": "IN",
-        "19": "IA", "20": "KS", "21": "KY", "22": "LA", "23": "ME",
-        "24": "MD", "25": "MA", "26": "MI", "27": "MN", "28": "MS",
-        "29": "MO", "30": "MT", "31": "NE", "32": "NV", "33": "NH",
-        "34": "NJ", "35": "NM", "36": "NY", "37": "NC", "38": "ND",
-        "39": "OH", "40": "OK", "41": "OR", "42": "PA", "44": "RI",
-        "45": "SC", "46": "SD", "47": "TN", "48": "TX", "49": "UT",
-        "50": "VT", "51": "VA", "53": "WA", "54": "WV", "55": "WI",
-        "56": "WY",  # dictionary mapping FIPS code to state abbreviation
+    dict2 = {
+        _FIPS_TO_STATE_NAME[FIPS_code]: value
+        for FIPS_code, value in dict1.items()
     }
 
-    dict2 = {}  # create empty dict
-    for FIPS_code in dict1:
-        new_state_name = fips2state[FIPS_code]  # convert state name
-        dict2.update({new_state_name: dict1[FIPS_code]})
-
-    dict3 = _translate_state_abbrev(dict2, abbrev_to_full=True)
-
-    return dict3
+    return dict2
 
 #%%============================================================================
 def _translate_state_abbrev(dict1, abbrev_to_full=True):
     '''
     Convert state full names into state abbreviations, or the other way.
-    Overseas territories (except Puerto Rico) cannot be converted.
+    Overseas territories can also be converted.
 
     Robustness is not guaranteed: if invalide state names (full or abbreviated)
     exist in dict1, a KeyError will be raised.
@@ -710,163 +4008,29 @@ def _translate_state_abbrev(dict1, abbrev_to_full=True):
     assert(isinstance(dict1, dict))
 
     if abbrev_to_full is True:
-        translation = {
-            'AK': 'Alaska',
-            'AL': 'Alabama',
-            'AR': 'Arkansas',
-            'AS': 'American Samoa',
-            'AZ': 'Arizona',
-            'CA': 'California',
-            'CO': 'Colorado',
-            'CT': 'Connecticut',
-            'DC': 'District of Columbia',
-            'DE': 'Delaware',
-            'FL': 'Florida',
-            'GA': 'Georgia',
-            'GU': 'Guam',
-            'HI': 'Hawaii',
-            'IA': 'Iowa',
-            'ID': 'Idaho',
-            'IL': 'Illinois',
-            'IN': 'Indiana',
-            'KS': 'Kansas',
-            'KY': 'Kentucky',
-            'LA': 'Louisiana',
-            'MA': 'Massachusetts',
-            'MD': 'Maryland',
-            'ME': 'Maine',
-            'MI': 'Michigan',
-            'MN': 'Minnesota',
-            'MO': 'Missouri',
-            'MP': 'Northern Mariana Islands',
-            'MS': 'Mississippi',
-            'MT': 'Montana',
-            'NA': 'National',
-            'NC': 'North Carolina',
-            'ND': 'North Dakota',
-            'NE': 'Nebraska',
-            'NH': 'New Hampshire',
-            'NJ': 'New Jersey',
-            'NM': 'New Mexico',
-            'NV': 'Nevada',
-            'NY': 'New York',
-            'OH': 'Ohio',
-            'OK': 'Oklahoma',
-            'OR': 'Oregon',
-            'PA': 'Pennsylvania',
-            'PR': 'Puerto Rico',
-            'RI': 'Rhode Island',
-            'SC': 'South Carolina',
-            'SD': 'South Dakota',
-            'TN': 'Tennessee',
-            'TX': 'Texas',
-            'UT': 'Utah',
-            'VA': 'Virginia',
-            'VI': 'Virgin Islands',
-            'VT': 'Vermont',
-            'WA': 'Washington',
-            'WI': 'Wisconsin',
-            'WV': 'West Virginia',
-            'WY': 'Wyoming'
-        }
+        translation = _ABBREV_TO_STATE_NAME
     else:
-        translation = {
-            'Alabama': 'AL',
-            'Alaska': 'AK',
-            'Arizona': 'AZ',
-            'Arkansas': 'AR',
-            'California': 'CA',
-            'Colorado': 'CO',
-            'Connecticut': 'CT',
-            'Delaware': 'DE',
-            'District of Columbia': 'DC',
-            'Florida': 'FL',
-            'Georgia': 'GA',
-            'Hawaii': 'HI',
-            'Idaho': 'ID',
-            'Illinois': 'IL',
-            'Indiana': 'IN',
-            'Iowa': 'IA',
-            'Kansas': 'KS',
-            'Kentucky': 'KY',
-            'Louisiana': 'LA',
-            'Maine': 'ME',
-            'Maryland': 'MD',
-            'Massachusetts': 'MA',
-            'Michigan': 'MI',
-            'Minnesota': 'MN',
-            'Mississippi': 'MS',
-            'Missouri': 'MO',
-            'Montana': 'MT',
-            'Nebraska': 'NE',
-            'Nevada': 'NV',
-            'New Hampshire': 'NH',
-            'New Jersey': 'NJ',
-            'New Mexico': 'NM',
-            'New York': 'NY',
-            'North Carolina': 'NC',
-            'North Dakota': 'ND',
-            'Ohio': 'OH',
-            'Oklahoma': 'OK',
-            'Oregon': 'OR',
-            'Pennsylvania': 'PA',
-            'Puerto Rico': 'PR',
-            'Rhode Island': 'RI',
-            'South Carolina': 'SC',
-            'South Dakota': 'SD',
-            'Tennessee': 'TN',
-            'Texas': 'TX',
-            'Utah': 'UT',
-            'Vermont': 'VT',
-            'Virginia': 'VA',
-            'Washington': 'WA',
-            'West Virginia': 'WV',
-            'Wisconsin': 'WI',
-            'Wyoming': 'WY',
-        }
+        translation = _STATE_NAME_TO_ABBREV
 
-    dict2 = {}
-    for state_name in dict1:
-        new_state_name = translation[state_name]  # convert state name
-        dict2.update({new_state_name: dict1[state_name]})
+    dict2 = {translation[state]: value for state, value in dict1.items()}
 
     return dict2
 
 #%%============================================================================
-def _check_all_states(dict1):
+def _normalize_state_identifiers(identifiers):
     '''
-    Check whether dict1 has all 50 states of USA as well as District of
-    Columbia. If not, append missing state(s) to the dictionary and assign
-    np.nan value as its value.
+    Convert state identifiers (full names, abbreviations, or FIPS codes, in
+    any mix, and case-insensitive) into full state names, in one vectorized
+    lookup of ``_STATE_NAME_INDEX``.
 
-    The state names of dict1 must be full names.
+    Returns
+    -------
+    state_names : pandas.Series
+        Full state names (NaN for unrecognized identifiers), in the same order
+        as ``identifiers``.
     '''
-    assert(type(dict1) == dict)
-
-    full_state_list = [
-        'Alabama', 'Alaska', 'Arizona', 'Arkansas', 'California', 'Colorado',
-        'Connecticut', 'Delaware', 'District of Columbia', 'Florida',
-        'Georgia', 'Hawaii', 'Idaho', 'Illinois', 'Indiana', 'Iowa', 'Kansas',
-        'Kentucky', 'Louisiana', 'Maine', 'Maryland', 'Massachusetts',
-        'Michigan', 'Minnesota', 'Mississippi', 'Missouri', 'Montana',
-        'Nebraska', 'Nevada', 'New Hampshire', 'New Jersey', 'New Mexico',
-        'New York', 'North Carolina', 'North Dakota', 'Ohio',
-        'Oklahoma', 'Oregon', 'Pennsylvania', 'Rhode Island',
-        'South Carolina', 'South Dakota', 'Tennessee', 'Texas','Utah',
-        'Vermont', 'Virginia', 'Washington', 'West Virginia',
-        'Wisconsin', 'Wyoming',
-    ]
-
-    if dict1.keys() != set(full_state_list):
-        dict2 = {}
-        for state in full_state_list:
-            if state in dict1:
-                dict2[state] = dict1[state]
-            else:
-                print('%s data missing (replaced with NaN).'%state)
-                dict2[state] = np.nan
-    else:
-        dict2 = dict1
-
-    return dict2
+    keys = pd.Series(np.asarray(identifiers, dtype=object)).astype(str)
+    keys = keys.str.strip().str.upper()
+    keys = keys.where(~keys.str.isdigit(), keys.str.zfill(2))  # 1 --> '01'
 
+    return keys.map(_STATE_NAME_INDEX)
@@ -4,7 +4,6 @@ import numpy as np
 import pandas as pd
 import matplotlib as mpl
 import matplotlib.pyplot as plt
-from distutils.version import LooseVersion
 
 from . import helper as hlp
 from . import colors_and_lines as cl
@@ -256,7 +255,7 @@ def histogram3d(
         zpos = np.zeros_like(xpos)  # zpos is where the bars stand
         dx = dx_factor  # width of bars in x direction (across data sets)
         dy = bar_width * dy_factor  # width of bars in y direction (within data set)
-        if LooseVersion(mpl.__version__) >= LooseVersion('2.0'):
+        if int(mpl.__version__.split('.')[0]) >= 2:
             bar3d_kwargs = {'alpha':alpha}  # lw clashes with alpha in 2.0+ versions
         else:
             bar3d_kwargs = {'alpha':alpha, 'lw':0.5}
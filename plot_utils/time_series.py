@@ -1,11 +1,11 @@
 # -*- coding: utf-8 -*-
 
+import collections
 import numpy as np
 import pandas as pd
 import datetime as dt
 import matplotlib as mpl
 import matplotlib.pyplot as plt
-from distutils.version import LooseVersion
 
 # Explicitly register matplotlib converters:
 from pandas.plotting import register_matplotlib_converters
@@ -14,13 +14,25 @@ register_matplotlib_converters()
 from . import helper as hlp
 from . import colors_and_lines as cl
 
+# Keyword arguments of `plot_timeseries()` that the LineCollection path of
+# `plot_multiple_timeseries()` supports
+_LINE_COLLECTION_KWARGS = [
+    'date_fmt', 'xlabel', 'ylabel', 'color', 'lw', 'ls', 'alpha', 'fontsize',
+    'xgrid_on', 'ygrid_on', 'title', 'month_grid_width',
+]
+
+# Process-level LRU cache of the date formats inferred from date strings
+# (see `_infer_date_format()`)
+_DATE_FORMAT_CACHE_MAXSIZE = 64
+_date_format_cache = collections.OrderedDict()
+
 #%%============================================================================
 def plot_timeseries(
         time_series, date_fmt=None, fig=None, ax=None, figsize=(10,3),
         dpi=100, xlabel='Time', ylabel=None, label=None, color=None,
         lw=2, ls=None, marker=None, fontsize=12, xgrid_on=True,
         ygrid_on=True, title=None, zorder=None, alpha=1.0,
-        month_grid_width=None,
+        month_grid_width=None, downsample=None, n_points=None,
 ):
     '''
     Plot time series (i.e., values a function of dates).
@@ -70,6 +82,32 @@ def plot_timeseries(
         This value determines how X axis labels are displayed (e.g., smaller
         width leads to date labels being displayed with 90 deg rotation).
         Do not change this unless you really know what you are doing.
+    downsample : {``None``, 'minmax', 'lttb', 'auto', 'pyramid'}
+        How to reduce the number of points of long time series before they
+        are plotted, so that the cost of drawing is bounded by the width of
+        the axes (in pixels) rather than by the length of the data, while the
+        line looks (almost) the same. Only time series longer than
+        ``n_points`` (and with sorted dates) are downsampled.
+            - ``None``: plot all the points
+            - 'minmax': split the time range into ``n_points / 2`` equal
+              intervals, and keep the points with the minimum and the maximum
+              values in each interval (so that spikes are kept exactly)
+            - 'lttb': keep ``n_points`` points with the Largest-Triangle-
+              Three-Buckets algorithm, which preserves the visual shape of
+              the line with evenly spread points (missing values are skipped)
+            - 'auto': 'minmax' if ``marker`` is ``None``, otherwise 'lttb'
+            - 'pyramid': index each time series with a
+              :class:`~TimeSeriesPyramid`, and plot the minimum and maximum
+              values of blocks of points. Whenever the X limits change
+              (e.g., when zooming or panning interactively), the lines are
+              re-fetched for the visible dates only, with blocks small
+              enough to show up to ``n_points`` points, so that details
+              appear as you zoom in (the dates are sorted if needed)
+    n_points : int or ``None``
+        The maximum number of points to plot for each time series, if
+        ``downsample`` is not ``None`` (at least 4 for 'minmax', and 3 for
+        'lttb'). If ``None``, it is twice the width of the axes in pixels
+        (i.e., a minimum and a maximum per pixel column).
 
     Returns
     -------
@@ -93,35 +131,38 @@ def plot_timeseries(
     ts = time_series.copy()  # shorten the name + avoid changing input
     ts.index = _as_date(ts.index, date_fmt)  # batch-convert index to Timestamp format of pandas
 
-    if zorder:
-        ax.plot(
-            ts.index, ts, color=color, lw=lw, ls=ls, marker=marker,
-            label=label, zorder=zorder, alpha=alpha,
-        )
+    pyramids = None
+    if downsample is None:
+        xy_pairs = [(ts.index, ts)]
     else:
-        ax.plot(
-            ts.index, ts, color=color, lw=lw, ls=ls, marker=marker,
-            label=label, alpha=alpha,
-        )
-    ax.set_label(label)  # set label for legends using argument 'label'
-    if xlabel: ax.set_xlabel(xlabel)
-    if ylabel: ax.set_ylabel(ylabel)
-    if month_grid_width == None:  # width of each month in inches
-        month_grid_width = float(ax_size[0])/_calc_month_interval(ts.index)
-    ax = _format_xlabel(ax,month_grid_width)
-
-    if ygrid_on == True:
-        ax.yaxis.grid(ls=':', color=[0.75]*3)
-    if xgrid_on == True:
-        ax.xaxis.grid(False, 'major')
-        ax.xaxis.grid(xgrid_on, 'minor', ls=':', color=[0.75]*3)
-    ax.set_axisbelow(True)
-
-    if title is not None:
-        ax.set_title(title)
+        if n_points is None:  # a minimum and a maximum per pixel column
+            n_points = int(2 * ax_size[0] * fig.dpi)
+        if downsample == 'pyramid':
+            pyramids = [TimeSeriesPyramid(_) for _ in _split_columns(ts)]
+            xy_pairs = [pyramid.query(n_points=n_points) for pyramid in pyramids]
+        else:
+            xy_pairs = _downsample_timeseries(ts, downsample, n_points, marker)
 
-    for o in fig.findobj(mpl.text.Text):
-        o.set_fontsize(fontsize)
+    lines = []
+    for x, y in xy_pairs:
+        if zorder:
+            lines += ax.plot(
+                x, y, color=color, lw=lw, ls=ls, marker=marker,
+                label=label, zorder=zorder, alpha=alpha,
+            )
+        else:
+            lines += ax.plot(
+                x, y, color=color, lw=lw, ls=ls, marker=marker,
+                label=label, alpha=alpha,
+            )
+    if pyramids is not None:
+        _connect_pyramids(ax, lines, pyramids, n_points)
+    ax.set_label(label)  # set label for legends using argument 'label'
+    _format_timeseries_axes(
+        fig, ax, ts.index, xlabel=xlabel, ylabel=ylabel, fontsize=fontsize,
+        xgrid_on=xgrid_on, ygrid_on=ygrid_on, title=title,
+        month_grid_width=month_grid_width,
+    )
 
     return fig, ax
 
@@ -129,7 +170,7 @@ def plot_timeseries(
 def plot_multiple_timeseries(
         multiple_time_series, show_legend=True,
         fig=None, ax=None, figsize=(10,3), dpi=100,
-        ncol_legend=5, **kwargs,
+        ncol_legend=5, line_collection=False, **kwargs,
 ):
     '''
     Plot multiple time series.
@@ -159,6 +200,20 @@ def plot_multiple_timeseries(
         this parameter.
     ncol_legend : int
         Number of columns of the legend.
+    line_collection : {False, True, 'auto'}
+        Whether to draw the time series as a few
+        ``matplotlib.collections.LineCollection`` objects (one per line
+        specification) instead of one line per time series, which is much
+        faster for many time series: the dates are converted and the axes are
+        formatted only once. Only the keyword arguments date_fmt, xlabel,
+        ylabel, color, lw, ls, alpha, fontsize, xgrid_on, ygrid_on, title,
+        and month_grid_width are supported in this case. If 'auto', it is
+        used if there are more than 40 time series and if the keyword
+        arguments are supported.
+        Note that the lines are then in ``ax.collections`` rather than in
+        ``ax.lines``, and that the time series sharing a line specification
+        are drawn together, so overlapping lines may stack in a different
+        order than with one line per time series.
     **kwargs :
         Other keyword arguments to be passed to :func:`~plot_timeseries()`, such
         as color, marker, fontsize, alpha, etc.
@@ -180,10 +235,26 @@ def plot_multiple_timeseries(
             '`multiple_time_series` must be a pandas Series or DataFrame.'
         )
 
+    if line_collection not in ['auto', True, False]:
+        raise ValueError("`line_collection` must be 'auto', True, or False.")
+
+    unsupported = sorted(set(kwargs) - set(_LINE_COLLECTION_KWARGS))
+    if line_collection is True and unsupported:
+        raise ValueError(
+            'These keyword arguments are not supported when '
+            '`line_collection` is True: %s' % unsupported
+        )
+    if line_collection == 'auto':
+        line_collection = (
+            isinstance(multiple_time_series, pd.DataFrame)
+            and multiple_time_series.shape[1] > 40
+            and not unsupported
+        )
+
     fig, ax = hlp._process_fig_ax_objects(fig, ax, figsize, dpi)
 
-    if not show_legend:  # if no need to show legends, just pass everything
-        fig, ax = plot_timeseries(multiple_time_series, fig, ax, dpi, **kwargs)
+    if not show_legend and not line_collection:  # just pass everything
+        fig, ax = plot_timeseries(multiple_time_series, fig=fig, ax=ax, **kwargs)
     else:
         if isinstance(multiple_time_series,pd.Series):
             nr_timeseries = 1
@@ -205,32 +276,136 @@ def plot_multiple_timeseries(
                 range_linewidth=range(1, (nr_timeseries - 1) // 240 + 5, 2),
             )
 
-        for j in range(nr_timeseries):
-            tmp_dict = linespecs[j % nr_timeseries].copy()
-            tmp_dict.update(kwargs)  # kwargs overwrites tmp_dict if key already exists in tmp_dict
-            if 'lw' in tmp_dict:  # thinner lines above thicker lines
-                zorder = 1 + 1.0/tmp_dict['lw']  # and "+1" to put all lines above grid line
-
-            plot_timeseries(
-                multiple_time_series.iloc[:,j],
-                fig=fig,
-                ax=ax,
-                zorder=zorder,
-                label=multiple_time_series.columns[j],
-                **tmp_dict,
+        if line_collection:
+            handles = _plot_timeseries_collections(
+                multiple_time_series, linespecs, fig, ax, **kwargs
             )
-
-        if 'title' not in kwargs:
-            bbox_anchor_loc = (0., 1.02, 1., .102)
         else:
-            bbox_anchor_loc = (0., 1.08, 1., .102)
-        ax.legend(
-            bbox_to_anchor=bbox_anchor_loc, loc='lower center', ncol=ncol_legend,
-        )
+            handles = None
+            for j in range(nr_timeseries):
+                tmp_dict = linespecs[j % len(linespecs)].copy()
+                tmp_dict.update(kwargs)  # kwargs overwrites tmp_dict if key already exists in tmp_dict
+                if 'lw' in tmp_dict:  # thinner lines above thicker lines
+                    zorder = 1 + 1.0/tmp_dict['lw']  # and "+1" to put all lines above grid line
+
+                plot_timeseries(
+                    multiple_time_series.iloc[:,j],
+                    fig=fig,
+                    ax=ax,
+                    zorder=zorder,
+                    label=multiple_time_series.columns[j],
+                    **tmp_dict,
+                )
+
+        if show_legend:
+            if 'title' not in kwargs:
+                bbox_anchor_loc = (0., 1.02, 1., .102)
+            else:
+                bbox_anchor_loc = (0., 1.08, 1., .102)
+            ax.legend(
+                handles=handles, bbox_to_anchor=bbox_anchor_loc,
+                loc='lower center', ncol=ncol_legend,
+            )
 
     ax.set_axisbelow(True)
     return fig, ax
 
+#%%============================================================================
+def _plot_timeseries_collections(
+        df, linespecs, fig, ax, date_fmt=None, xlabel='Time', ylabel=None,
+        color=None, lw=None, ls=None, alpha=1.0, fontsize=12, xgrid_on=True,
+        ygrid_on=True, title=None, month_grid_width=None,
+):
+    '''
+    Plot each column of ``df`` (a pandas DataFrame whose index is the date)
+    with the line specifications ``linespecs`` (cycled through), but with one
+    ``matplotlib.collections.LineCollection`` per line specification rather
+    than one line per column. The index is converted and the axes are
+    formatted only once. (See :func:`~plot_timeseries` for the other
+    parameters, which override ``linespecs`` if not ``None``.)
+
+    Returns
+    -------
+    handles : list<matplotlib.lines.Line2D>
+        One line per column (not added to ``ax``), to be used as the legend
+        handles.
+    '''
+    date_index = _as_date(df.index, date_fmt)
+    ax.xaxis.update_units(date_index)  # (so that the X axis is a date axis)
+    x = np.asarray(ax.xaxis.convert_units(date_index), dtype=np.float64)
+    values = np.asarray(df, dtype=np.float64)
+
+    groups = collections.OrderedDict()  # line specification --> columns
+    handles = []
+    for j in range(df.shape[1]):
+        spec = linespecs[j % len(linespecs)].copy()
+        spec.update(
+            {k: v for k, v in [('color', color), ('lw', lw), ('ls', ls)]
+             if v is not None}
+        )
+        key = (mpl.colors.to_rgba(spec['color']), spec['ls'], spec['lw'])
+        groups.setdefault(key, []).append(j)
+        handles.append(mpl.lines.Line2D(
+            [], [], color=spec['color'], ls=spec['ls'], lw=spec['lw'],
+            alpha=alpha, label=df.columns[j],
+        ))
+
+    for (rgba, ls_, lw_), columns in groups.items():
+        segments = np.empty((len(columns), len(x), 2))
+        segments[:, :, 0] = x
+        segments[:, :, 1] = values[:, columns].T
+        if ls_ in ['-', 'solid']:
+            capstyle = mpl.rcParams['lines.solid_capstyle']
+            joinstyle = mpl.rcParams['lines.solid_joinstyle']
+        else:
+            capstyle = mpl.rcParams['lines.dash_capstyle']
+            joinstyle = mpl.rcParams['lines.dash_joinstyle']
+        ax.add_collection(mpl.collections.LineCollection(
+            segments, colors=[rgba], linestyles=ls_, linewidths=lw_,
+            alpha=alpha, capstyle=capstyle, joinstyle=joinstyle,
+            zorder=1 + 1.0/lw_,  # thinner lines above thicker lines
+        ))
+    ax.autoscale_view()
+
+    _format_timeseries_axes(
+        fig, ax, date_index, xlabel=xlabel, ylabel=ylabel, fontsize=fontsize,
+        xgrid_on=xgrid_on, ygrid_on=ygrid_on, title=title,
+        month_grid_width=month_grid_width,
+    )
+
+    return handles
+
+#%%============================================================================
+def _format_timeseries_axes(
+        fig, ax, date_index, xlabel='Time', ylabel=None, fontsize=12,
+        xgrid_on=True, ygrid_on=True, title=None, month_grid_width=None,
+):
+    '''
+    Format the axes of a time series plot whose dates are ``date_index``:
+    the axis labels, the date labels of the X axis, the grid lines, the
+    title, and the font size of all the texts in ``fig``. (See
+    :func:`~plot_timeseries` for the parameters.)
+    '''
+    if xlabel: ax.set_xlabel(xlabel)
+    if ylabel: ax.set_ylabel(ylabel)
+    if month_grid_width == None:  # width of each month in inches
+        ax_size = hlp._get_ax_size(fig, ax)
+        month_grid_width = float(ax_size[0])/_calc_month_interval(date_index)
+    ax = _format_xlabel(ax,month_grid_width)
+
+    if ygrid_on == True:
+        ax.yaxis.grid(ls=':', color=[0.75]*3)
+    if xgrid_on == True:
+        ax.xaxis.grid(False, 'major')
+        ax.xaxis.grid(xgrid_on, 'minor', ls=':', color=[0.75]*3)
+    ax.set_axisbelow(True)
+
+    if title is not None:
+        ax.set_title(title)
+
+    for o in fig.findobj(mpl.text.Text):
+        o.set_fontsize(fontsize)
+
 #%%============================================================================
 def fill_timeseries(
         time_series, upper_bound, lower_bound, date_fmt=None,
@@ -331,14 +506,308 @@ def fill_timeseries(
 
     return fig, ax
 
+#%%============================================================================
+class TimeSeriesPyramid():
+    '''
+    A multi-resolution index of a (long) time series, for plotting any date
+    range of it with a bounded number of points.
+
+    The points are grouped into blocks of 2, 4, 8, ... consecutive points
+    (one "level" per block size), and the positions of the minimum and the
+    maximum values of every block are precomputed, level by level from the
+    previous one, in O(n) time and memory. The sums and the counts of the
+    non-missing values are kept as cumulative sums, so that the mean of any
+    block is also available in O(1). A query then only touches the blocks
+    that overlap the requested date range, at the finest level that fits
+    into the requested number of points, so its cost does not depend on the
+    length of the time series.
+
+    Parameters
+    ----------
+    time_series : pandas.Series
+        A pandas Series, with index being date. It is sorted by date if it
+        is not sorted yet.
+    date_fmt : str
+        Date format specifier, e.g., '%Y-%m' or '%d/%m/%y'.
+
+    Attributes
+    ----------
+    index : pandas.DatetimeIndex
+        The (sorted) dates of the time series.
+    values : numpy.ndarray
+        The values of the time series (as floats), in the order of ``index``.
+    n_levels : int
+        The number of levels of blocks (the blocks of the last level contain
+        all the points).
+    '''
+    def __init__(self, time_series, date_fmt=None):
+
+        if not isinstance(time_series, pd.Series):
+            raise TypeError('`time_series` must be a pandas Series.')
+
+        index = _as_date(time_series.index, date_fmt)
+        values = np.asarray(time_series, dtype=np.float64)
+        if not index.is_monotonic_increasing:
+            order = np.argsort(index.asi8, kind='stable')
+            index, values = index[order], values[order]
+
+        self.index = index
+        self.values = values
+
+        n = len(values)
+        missing = np.isnan(values)
+        self._cum_sum = np.r_[0.0, np.cumsum(np.where(missing, 0.0, values))]
+        self._cum_count = np.r_[0, np.cumsum(~missing)]
+
+        # Positions of the minimum/maximum of each block, level by level
+        # (missing values are never chosen, unless a block has only missing
+        # values, so that the gap in the line is kept):
+        low = np.where(missing, np.inf, values)
+        high = np.where(missing, -np.inf, values)
+        pos_min = pos_max = np.arange(n, dtype=np.int32 if n < 2**31 else np.int64)
+        self._pos_min, self._pos_max = [], []
+        while len(pos_min) > 1:
+            if len(pos_min) % 2 == 1:  # (the last block has no partner)
+                pos_min = np.r_[pos_min, pos_min[-1]]
+                pos_max = np.r_[pos_max, pos_max[-1]]
+            a, b = pos_min[0::2], pos_min[1::2]
+            pos_min = np.where(low[b] < low[a], b, a)
+            a, b = pos_max[0::2], pos_max[1::2]
+            pos_max = np.where(high[b] > high[a], b, a)
+            self._pos_min.append(pos_min)
+            self._pos_max.append(pos_max)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __repr__(self):
+        return 'TimeSeriesPyramid: %d points, %d levels' % (len(self), self.n_levels)
+
+    @property
+    def n_levels(self):
+        return len(self._pos_min)
+
+    def query(self, start=None, end=None, n_points=1000, how='minmax'):
+        '''
+        Get the points to plot between ``start`` and ``end``.
+
+        Parameters
+        ----------
+        start : datetime-like or ``None``
+            The first date of the range. If ``None``, from the first date of
+            the time series. (One more point before the range is included, so
+            that the line does not stop short of the edge of the axes.)
+        end : datetime-like or ``None``
+            The last date of the range. If ``None``, up to the last date of
+            the time series. (One more point after the range is included.)
+        n_points : int
+            The maximum number of points to return (except that the two
+            blocks at the edges of the range may add a few more).
+        how : {'minmax', 'mean', 'first_last'}
+            What to return for each block of points:
+                - 'minmax': the points with the minimum and the maximum values
+                - 'mean': the mean value (at the date of the middle point)
+                - 'first_last': the first and the last points
+
+        Returns
+        -------
+        x : pandas.DatetimeIndex
+            The dates of the points.
+        y : numpy.ndarray
+            The values of the points.
+        '''
+        if how not in ['minmax', 'mean', 'first_last']:
+            raise ValueError("`how` must be 'minmax', 'mean', or 'first_last'.")
+        n_points = int(n_points)
+        if n_points < 2:
+            raise ValueError('`n_points` must be at least 2.')
+
+        n = len(self)
+        i0 = 0 if start is None else max(self.index.searchsorted(start, 'left') - 1, 0)
+        i1 = n if end is None else min(self.index.searchsorted(end, 'right') + 1, n)
+        if i1 <= i0:
+            return self.index[:0], self.values[:0]
+
+        max_blocks = n_points // 2 if how in ['minmax', 'first_last'] else n_points
+        level = 0
+        while level < self.n_levels and ((i1 - 1) >> level) - (i0 >> level) >= max_blocks:
+            level += 1
+
+        if level == 0:
+            keep = np.arange(i0, i1)
+            return self.index[keep], self.values[keep]
+
+        blocks = slice(i0 >> level, ((i1 - 1) >> level) + 1)
+        if how == 'minmax':
+            keep = np.union1d(
+                self._pos_min[level - 1][blocks], self._pos_max[level - 1][blocks]
+            )
+            return self.index[keep], self.values[keep]
+
+        starts = np.arange(blocks.start, blocks.stop, dtype=np.int64) << level
+        ends = np.minimum(starts + 2**level, n)
+        if how == 'first_last':
+            keep = np.union1d(starts, ends - 1)
+            return self.index[keep], self.values[keep]
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            y = (self._cum_sum[ends] - self._cum_sum[starts]) \
+                / (self._cum_count[ends] - self._cum_count[starts])
+        return self.index[(starts + ends - 1) // 2], y
+
+#%%============================================================================
+def _connect_pyramids(ax, lines, pyramids, n_points):
+    '''
+    Re-fetch the data of each of ``lines`` from the corresponding
+    :class:`~TimeSeriesPyramid` in ``pyramids`` (for the visible dates, at
+    most ``n_points`` points per line) whenever the X limits of ``ax``
+    change.
+    '''
+    date_ranges = [mpl.dates.date2num(_.index[[0, -1]]) for _ in pyramids if len(_)]
+    if not date_ranges:
+        return
+    first = min(_[0] for _ in date_ranges)
+    last = max(_[-1] for _ in date_ranges)
+
+    def to_timestamp(num, tz):
+        timestamp = pd.Timestamp(mpl.dates.num2date(np.clip(num, first, last)))
+        return timestamp.tz_localize(None) if tz is None else timestamp.tz_convert(tz)
+
+    def on_xlim_changed(ax):
+        xmin, xmax = sorted(ax.get_xlim())
+        for line, pyramid in zip(lines, pyramids):
+            tz = pyramid.index.tz
+            x, y = pyramid.query(
+                to_timestamp(xmin, tz), to_timestamp(xmax, tz), n_points
+            )
+            line.set_data(x, y)
+
+    ax.callbacks.connect('xlim_changed', on_xlim_changed)
+
+#%%============================================================================
+def _split_columns(ts):
+    '''
+    Return the columns of ``ts`` (a pandas Series or DataFrame) as a list of
+    pandas Series.
+    '''
+    if isinstance(ts, pd.Series):
+        return [ts]
+    return [ts.iloc[:, j] for j in range(ts.shape[1])]
+
+#%%============================================================================
+def _downsample_timeseries(ts, method, n_points, marker=None):
+    '''
+    Downsample the time series ``ts`` (a pandas Series or DataFrame whose
+    index is already converted by :func:`~_as_date`) with ``method`` (see
+    :func:`~plot_timeseries`) to at most ``n_points`` points per column.
+
+    Returns
+    -------
+    xy_pairs : list<(pandas.DatetimeIndex, numpy.ndarray)>
+        The dates and the values of each line to be plotted (one line per
+        column of ``ts``).
+    '''
+    if method == 'auto':
+        method = 'minmax' if marker is None else 'lttb'
+    if method not in ['minmax', 'lttb']:
+        raise ValueError(
+            "`downsample` must be None, 'minmax', 'lttb', 'auto', or 'pyramid'."
+        )
+    n_points = int(n_points)
+    min_points = 4 if method == 'minmax' else 3  # (the first/last points, etc.)
+    if n_points < min_points:
+        raise ValueError(
+            "`n_points` must be at least %d with '%s'." % (min_points, method)
+        )
+
+    if len(ts) <= n_points or not ts.index.is_monotonic_increasing:
+        return [(ts.index, ts)]  # nothing to downsample
+
+    x = ts.index.asi8.astype(np.float64)
+    xy_pairs = []
+    for column in _split_columns(ts):
+        y = np.asarray(column, dtype=np.float64)
+        if method == 'minmax':
+            keep = _downsample_minmax(x, y, n_points)
+        else:
+            keep = _downsample_lttb(x, y, n_points)
+        xy_pairs.append((ts.index[keep], y[keep]))
+
+    return xy_pairs
+
+#%%============================================================================
+def _downsample_minmax(x, y, n_points):
+    '''
+    Split the range of ``x`` (sorted) into ``n_points // 2 - 1`` equal
+    intervals (``n_points`` >= 4), and return the positions of the points
+    with the minimum and the maximum ``y`` in each interval (in one
+    vectorized pass), plus the first and the last points. An interval with only missing values keeps one of them, so
+    that the gap in the line is kept.
+    '''
+    n_bins = max(n_points // 2 - 1, 1)  # (the first and last points are extra)
+    if x[-1] > x[0]:
+        bins = ((x - x[0]) * (n_bins / (x[-1] - x[0]))).astype(np.int64)
+        bins = np.minimum(bins, n_bins - 1)
+    else:
+        bins = np.zeros(len(x), dtype=np.int64)
+    starts = np.flatnonzero(np.r_[True, bins[1:] != bins[:-1]])
+    bin_id = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(y)]))
+
+    keep = [starts[:1], [len(y) - 1]]
+    with np.errstate(invalid='ignore'):
+        for reduce_func in (np.fmin, np.fmax):  # (ignore NaN, unless all NaN)
+            extremes = reduce_func.reduceat(y, starts)
+            hits = np.flatnonzero(y == extremes[bin_id])
+            _, first = np.unique(bin_id[hits], return_index=True)
+            keep.append(hits[first])
+    keep.append(starts[np.isnan(extremes)])  # intervals of only missing values
+
+    return np.unique(np.concatenate(keep))
+
+#%%============================================================================
+def _downsample_lttb(x, y, n_points):
+    '''
+    Select ``n_points`` points with the Largest-Triangle-Three-Buckets (LTTB)
+    algorithm (Steinarsson, 2013): the first and the last points are kept,
+    the others are split into ``n_points - 2`` buckets, and in each bucket
+    the point that forms the largest triangle with the point selected in the
+    previous bucket and the average point of the next bucket is kept.
+    Missing values are skipped. Return the positions of the selected points.
+    '''
+    valid = np.flatnonzero(~np.isnan(y))
+    if len(valid) <= n_points:
+        return valid
+    x, y = x[valid], y[valid]
+    x = x - x[0]  # (smaller numbers for the areas)
+
+    edges = np.linspace(1, len(y) - 1, n_points - 1).astype(np.int64)
+    next_x = np.add.reduceat(x[:-1], edges[:-1]) / np.diff(edges)
+    next_y = np.add.reduceat(y[:-1], edges[:-1]) / np.diff(edges)
+    next_x = np.r_[next_x[1:], x[-1]]  # average of the next bucket
+    next_y = np.r_[next_y[1:], y[-1]]
+
+    keep = np.empty(n_points, dtype=np.int64)
+    keep[0], keep[-1] = 0, len(y) - 1
+    a = 0
+    for j in range(n_points - 2):
+        lo, hi = edges[j], edges[j + 1]
+        areas = np.abs(
+            (x[a] - next_x[j]) * (y[lo:hi] - y[a])
+            - (x[a] - x[lo:hi]) * (next_y[j] - y[a])
+        )
+        a = lo + np.argmax(areas)
+        keep[j + 1] = a
+
+    return valid[keep]
+
 #%%============================================================================
 def _calc_month_interval(date_array):
     '''
     Calculate how many months are there between the first month and the last
     month of the given date_array.
     '''
-    date9 = list(date_array)[-1]
-    date0 = list(date_array)[0]
+    date9 = date_array[-1]
+    date0 = date_array[0]
     delta_days = (date9 - date0).days
     if delta_days < 30:  # within one month
         delta_months = delta_days/30.0  # return a float between 0 and 1
@@ -475,7 +944,17 @@ def _as_date(raw_date, date_fmt=None):
     (C) A single element of: str, int, float, such as:
         [1] 201310
         [2] 201210.0
-    (D) A pandas Series, of length 1 or length larger than 1
+    (D) A pandas Series, a pandas Index (such as a DatetimeIndex, which is
+        returned as is), or a numpy array
+
+    The conversion is vectorized: integer date codes (YYYYMM or YYYYMMDD, as
+    numbers or as strings of digits) are converted with integer arithmetic,
+    and other strings are parsed in one pass, with one date format (the
+    format inferred from the first string, if ``date_fmt`` is ``None``; if
+    it does not fit all the strings, each string is parsed on its own).
+    Repeated dates (such as in panel data, where each date appears once per
+    entity) are converted only once: only the unique values are converted,
+    and then broadcast back to all the entries.
 
     Parameters
     ----------
@@ -489,64 +968,152 @@ def _as_date(raw_date, date_fmt=None):
     Returns
     -------
     date_list :
-        A variable with the same structure (list or scaler-like) as raw_date,
-        whose contents have the data type "pandas._libs.tslib.Timestamp".
+        A pandas DatetimeIndex if raw_date is list-like (of any length), or
+        a single pandas Timestamp if raw_date is a single element.
 
     Reference
     ---------
     https://docs.python.org/2/library/datetime.html#strftime-strptime-behavior
     '''
-    if LooseVersion(pd.__version__) <= LooseVersion('0.17.1'):
-        timestamp_type = pd.tslib.Timestamp
-    else:
-        timestamp_type = pd._libs.tslib.Timestamp
+    if isinstance(raw_date, pd.DatetimeIndex):  # already converted
+        return raw_date
+    if isinstance(raw_date, (pd.Timestamp, dt.date)):  # a single date
+        return raw_date  # no need for conversion
+    if isinstance(raw_date, str):  # a single string, such as '2015-04'
+        return pd.to_datetime(raw_date, format=date_fmt)
+    if isinstance(raw_date, hlp._scalar_like):  # a single number, such as 201504
+        return _as_date([raw_date], date_fmt)[0]
+    if not isinstance(raw_date, (list, tuple, np.ndarray, pd.Series, pd.Index)):
+        raise TypeError('Input data type of `raw_date` not recognized.')
 
-    if isinstance(raw_date,timestamp_type):  # if already a pandas Timestamp obj
-        date_list = raw_date  # return raw_date as is
-    else:
-        # -----------  Convert to list for pd.Series or np.ndarray objects  -------
-        if isinstance(raw_date,(pd.Series,np.ndarray,pd.Index)):
-            raw_date = list(raw_date)
-
-        # ----------  Element-wise checks and conversion  -------------------------
-        if isinstance(raw_date,list):   # if input is a list
-            if len(raw_date) == 0:  # empty list
-                date_list = None   # return an empty object
-            elif len(raw_date) == 1:  # length of string is 1
-                date_ = str(int(raw_date[0]))  # simply unpack it and convert to str int
-                date_list = pd.to_datetime(date_, format=date_fmt)
-            else:  # length is larger than 1
-                nr = len(raw_date)
-                date_list = [[None]] * nr
-                for j in range(nr):  # loop every element in raw_date
-                    j_th = raw_date[j]
-                    if isinstance(j_th, str) and j_th.isdigit():
-                        date_ = str(int(j_th))
-                    elif isinstance(j_th, str) and not j_th.isdigit():
-                        date_ = j_th
-                    elif isinstance(j_th,(int,np.integer,np.float)):
-                        date_ = str(int(j_th))  # robustness not guarenteed!
-                    else:
-                        raise TypeError('Date type of the element(s) in '
-                                        '`raw_date` not recognized.')
-                    date_list[j] = pd.to_datetime(date_, format=date_fmt)
-        elif type(raw_date) == dt.date:  # if a datetime.date object
-            date_list = raw_date  # no need for conversion
-        elif isinstance(raw_date, hlp._scalar_like):
-            date_ = str(int(raw_date))
-            date_list = pd.to_datetime(date_, format=date_fmt)
-        elif isinstance(raw_date, str):  # a single string, such as '2015-04'
-            date_ = raw_date  # no conversion needed
-            date_list = pd.to_datetime(date_, format=date_fmt)
+    values = np.asarray(raw_date)
+    if len(values) == 0:
+        return pd.DatetimeIndex([])
+    if values.dtype.kind == 'U' and isinstance(raw_date, (list, tuple)) \
+        and pd.api.types.infer_dtype(raw_date, skipna=False) != 'string':
+        values = np.array(raw_date, dtype=object)  # keep the numbers as is
+
+    if values.dtype.kind == 'M':  # numpy datetime64
+        return pd.DatetimeIndex(values)
+
+    codes, uniques = pd.factorize(values)
+    if len(uniques) < len(values) and np.all(codes >= 0):  # (-1: missing)
+        return _as_date(np.asarray(uniques), date_fmt)[codes]
+    if values.dtype.kind in 'iuf':  # numbers, such as 201405 or 201405.0
+        return _codes_to_date(values, date_fmt)
+    if values.dtype.kind == 'O':
+        inferred_type = pd.api.types.infer_dtype(values, skipna=False)
+        if inferred_type in ['integer', 'floating', 'mixed-integer-float']:
+            return _codes_to_date(values.astype(float), date_fmt)
+        if inferred_type in ['datetime', 'datetime64', 'date']:
+            return pd.DatetimeIndex(pd.to_datetime(values))
+        if inferred_type != 'string':  # mixed types: numbers become strings
+            values = np.array([_element_to_str(x) for x in values])
+
+    strings = values.astype(str)
+    if date_fmt is None and np.all(np.char.isdigit(strings)):
+        return _codes_to_date(strings.astype(np.int64), date_fmt)
+
+    return _parse_date_strings(strings, date_fmt)
+
+#%%============================================================================
+def _codes_to_date(codes, date_fmt=None):
+    '''
+    Convert an array of numerical date codes to a pandas DatetimeIndex. If
+    ``date_fmt`` is ``None`` and all the codes are YYYYMM (such as 201405) or
+    all are YYYYMMDD (such as 20140525), the years, months, and days are
+    extracted with integer arithmetic. Otherwise, the codes are converted to
+    strings of integers, and are parsed with ``date_fmt``.
+    '''
+    codes = np.asarray(codes)
+    if codes.dtype.kind == 'f':
+        if not np.all(np.isfinite(codes)):
+            raise ValueError('`raw_date` contains NaN or infinite values.')
+    codes = codes.astype(np.int64)  # (floats are truncated)
+
+    if date_fmt is None:
+        if np.all((codes >= 100001) & (codes <= 999912)):  # YYYYMM
+            year, month, day = codes // 100, codes % 100, np.ones_like(codes)
+        elif np.all((codes >= 10000101) & (codes <= 99991231)):  # YYYYMMDD
+            year, month, day = codes // 10000, codes // 100 % 100, codes % 100
         else:
-            raise TypeError('Input data type of `raw_date` not recognized.')
-            print('\ntype(raw_date) is: %s' % type(raw_date))
-            try:
-                print('Length of raw_date is: %s' % len(raw_date))
-            except TypeError:
-                print('raw_date has no length.')
-
-    return date_list
+            year = None
+
+        if year is not None:
+            return pd.DatetimeIndex(pd.to_datetime(
+                pd.DataFrame({'year': year, 'month': month, 'day': day})
+            ))
+
+    return _parse_date_strings(codes.astype(str), date_fmt)
+
+#%%============================================================================
+def _parse_date_strings(strings, date_fmt=None):
+    '''
+    Parse an array of date strings in one pass, with the format ``date_fmt``,
+    or (if it is ``None``) with the format inferred from the first string.
+    If the inferred format does not fit all the strings (such as
+    ['2015-01-01', '2015/01/02']), each string is parsed on its own, as
+    flexibly as the dates are parsed one by one.
+    '''
+    if date_fmt is not None:
+        return pd.DatetimeIndex(pd.to_datetime(strings, format=date_fmt))
+
+    try:
+        date_fmt = _infer_date_format(strings[0])
+        return pd.DatetimeIndex(pd.to_datetime(strings, format=date_fmt))
+    except (ValueError, TypeError):  # the dates have mixed formats
+        if int(pd.__version__.split('.')[0]) >= 2:
+            return pd.DatetimeIndex(pd.to_datetime(strings, format='mixed'))
+        return pd.DatetimeIndex([pd.to_datetime(_) for _ in strings])
+
+#%%============================================================================
+def _infer_date_format(date_str):
+    '''
+    Infer the date format (such as '%Y-%m-%d') of the string ``date_str``, so
+    that all the other dates can be parsed with the same format in one pass.
+    Return ``None`` if the format cannot be inferred (or if this version of
+    pandas cannot infer date formats), in which case pandas parses the dates
+    by itself.
+
+    The inferred formats are cached (in a bounded LRU cache), keyed on
+    ``date_str``, so that plotting the same time series again (such as in a
+    dashboard) does not infer the format again. (The key is the string
+    itself rather than its pattern, because the inferred format can depend
+    on the digits: '01/02/2015' is month first, but '13/02/2015' is day
+    first.)
+    '''
+    key = str(date_str)
+    if key in _date_format_cache:
+        _date_format_cache.move_to_end(key)
+        return _date_format_cache[key]
+
+    try:
+        from pandas.tseries.api import guess_datetime_format
+    except ImportError:  # pandas < 2.2
+        try:
+            from pandas.core.tools.datetimes import guess_datetime_format
+        except ImportError:
+            guess_datetime_format = lambda date_str: None
+
+    date_fmt = guess_datetime_format(key)
+    _date_format_cache[key] = date_fmt
+    while len(_date_format_cache) > _DATE_FORMAT_CACHE_MAXSIZE:
+        _date_format_cache.popitem(last=False)
+
+    return date_fmt
+
+#%%============================================================================
+def _element_to_str(element):
+    '''
+    Convert one element of a list of dates of mixed types to a string: a
+    number (such as 201405 or 201405.0) to a string of an integer, and a
+    string as is.
+    '''
+    if isinstance(element, str):
+        return element
+    if isinstance(element, hlp._scalar_like):
+        return str(int(element))  # robustness not guarenteed!
+    raise TypeError('Date type of the element(s) in `raw_date` not recognized.')
 
 #%%============================================================================
 def _str2date(date_):
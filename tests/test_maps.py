@@ -0,0 +1,518 @@
+# -*- coding: utf-8 -*-
+
+import os
+import collections
+import json
+import shutil
+import struct
+import numpy as np
+import pytest
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+from plot_utils import maps
+
+#%%============================================================================
+def _brute_force_jenks_cost(values, k):
+    '''
+    The smallest total within-class sum of squared deviations of the sorted
+    ``values`` split into ``k`` classes, by the naive O(k * n^2) dynamic
+    programming.
+    '''
+    x = np.sort(values)
+    n = len(x)
+    ssd = np.full((n, n), np.inf)  # ssd[s, j]: class of x[s], ..., x[j]
+    for s in range(n):
+        for j in range(s, n):
+            ssd[s, j] = np.sum((x[s:j + 1] - x[s:j + 1].mean()) ** 2)
+
+    cost = ssd[0].copy()
+    for c in range(1, k):
+        cost = np.array([
+            min([cost[s - 1] + ssd[s, j] for s in range(1, j + 1)] + [np.inf])
+            for j in range(n)
+        ])
+    return cost[-1]
+
+#%%============================================================================
+def _jenks_cost(values, breaks):
+    '''
+    The total within-class sum of squared deviations of ``values`` with the
+    class ``breaks`` returned by ``_fisher_jenks_breaks()``.
+    '''
+    classes = np.searchsorted(breaks[1:-1], values, side='right')
+    return sum(
+        np.sum((values[classes == c] - values[classes == c].mean()) ** 2)
+        for c in np.unique(classes)
+    )
+
+#%%============================================================================
+@pytest.mark.parametrize('seed', range(10))
+def test_fisher_jenks_matches_brute_force(seed):
+    rng = np.random.RandomState(seed)
+    n = rng.randint(8, 40)
+    if seed % 2 == 0:  # with many duplicated values
+        values = rng.randint(0, 12, size=n).astype(float)
+    else:
+        values = rng.lognormal(size=n)
+
+    for k in range(2, 6):
+        if len(np.unique(values)) <= k:
+            continue
+        breaks = maps._fisher_jenks_breaks(values, k)
+        assert len(breaks) == k + 1
+        assert breaks[0] == values.min() and breaks[-1] == values.max()
+        assert np.all(np.diff(breaks[:-1]) > 0)
+        assert np.isclose(
+            _jenks_cost(values, breaks), _brute_force_jenks_cost(values, k),
+        )
+
+#%%============================================================================
+def test_fisher_jenks_few_unique_values():
+    breaks = maps._fisher_jenks_breaks(np.array([3.0, 1.0, 3.0, 1.0]), 5)
+    assert np.array_equal(breaks, [1.0, 3.0, 3.0])
+
+#%%============================================================================
+def test_class_breaks_natural_breaks():
+    values = np.r_[[0.0, 1, 2], [10.0, 11, 12], [20.0, 21, 22]]
+    breaks = maps._get_class_breaks(values, 'natural_breaks', 3, 0.0, 22.0)
+    assert np.array_equal(breaks, [0.0, 10.0, 20.0, 22.0])
+
+#%%============================================================================
+_ST99_D00 = os.path.join(
+    os.path.dirname(maps.__file__), 'shapefiles', 'usa_states', 'st99_d00',
+)
+
+# (number of shapes, (min lon, min lat, max lon, max lat)) of some states
+_ST99_D00_STATES = {
+    'Colorado': (1, (-109.060253, 36.992426, -102.041524, 41.003444)),
+    'Hawaii': (27, (-178.342102, 18.917466, -154.809379, 28.407391)),
+    'Alaska': (81, (-179.14734, 51.219862, 179.77847, 71.352561)),
+}
+
+#%%============================================================================
+def test_read_shapefile_st99_d00():
+    shapes, attributes = maps.read_shapefile(_ST99_D00 + '.shp')
+    assert len(shapes) == len(attributes) == 273
+    assert attributes['NAME'].nunique() == 52  # 50 states, DC, Puerto Rico
+    assert attributes['AREA'].dtype == np.float64
+
+    points = np.concatenate([part for shape in shapes for part in shape])
+    assert np.allclose(
+        [points.min(axis=0), points.max(axis=0)],
+        [[-179.14734, 17.884813], [179.77847, 71.352561]],
+    )
+
+    for name, (n_shapes, bbox) in _ST99_D00_STATES.items():
+        rows = np.flatnonzero(attributes['NAME'] == name)
+        assert len(rows) == n_shapes
+        points = np.concatenate([part for j in rows for part in shapes[j]])
+        assert np.allclose(
+            np.r_[points.min(axis=0), points.max(axis=0)], bbox, atol=1e-6,
+        )
+
+#%%============================================================================
+def test_read_shapefile_matches_pyshp():
+    shapefile = pytest.importorskip('shapefile')
+
+    shapes, attributes = maps.read_shapefile(_ST99_D00)
+    reader = shapefile.Reader(_ST99_D00)
+    for j, (shape, record) in enumerate(
+            zip(reader.shapes(), reader.records())):
+        parts = list(shape.parts) + [len(shape.points)]
+        assert len(shapes[j]) == len(shape.parts)
+        for part, start, end in zip(shapes[j], parts[:-1], parts[1:]):
+            assert np.array_equal(part, shape.points[start:end])
+        assert attributes['NAME'].iloc[j] == record['NAME']
+        assert np.isclose(attributes['AREA'].iloc[j], record['AREA'])
+
+#%%============================================================================
+# (longitude, latitude, state) of some cities, including the Alaska and Hawaii
+# insets; the last one is in the Atlantic Ocean
+_CITIES = [
+    (-104.99, 39.74, 'Colorado'),  # Denver
+    (-87.63, 41.88, 'Illinois'),  # Chicago
+    (-97.74, 30.27, 'Texas'),  # Austin
+    (-80.19, 25.76, 'Florida'),  # Miami
+    (-122.33, 47.61, 'Washington'),  # Seattle
+    (-149.90, 61.22, 'Alaska'),  # Anchorage
+    (-147.72, 64.84, 'Alaska'),  # Fairbanks
+    (-157.86, 21.31, 'Hawaii'),  # Honolulu
+    (-155.09, 19.72, 'Hawaii'),  # Hilo
+    (-50.0, 35.0, None),
+]
+
+#%%============================================================================
+@pytest.fixture(scope='module')
+def state_map():
+    data = dict.fromkeys(maps._STATES_AND_DC, 1.0)
+    choropleth_map = maps.ChoroplethMap(data, level='state')
+    yield choropleth_map
+    plt.close(choropleth_map.fig)
+
+#%%============================================================================
+@pytest.mark.parametrize('lon, lat, state', _CITIES)
+def test_query_lonlat(state_map, lon, lat, state):
+    assert state_map.query_lonlat(lon, lat) == state
+
+#%%============================================================================
+def test_aggregate_points_to_states():
+    lon, lat, states = zip(*_CITIES)
+    aggregated = maps.aggregate_points_to_regions(
+        lon, lat, values=np.arange(1, len(lon) + 1), agg='sum', level='state',
+    )
+    expected = {}
+    for value, state in enumerate(states, start=1):
+        if state is not None:
+            expected[state] = expected.get(state, 0) + value
+    assert aggregated[aggregated != 0].to_dict() == expected
+
+#%%============================================================================
+def test_geojson_round_trip():
+    data = dict.fromkeys(maps._STATES_AND_DC, 1.0)
+    geojson = maps.choropleth_to_geojson(data, level_of_detail=3)
+    raw = maps.choropleth_to_geojson(data, level_of_detail=3, quantization=None)
+    json.dumps(geojson)  # serializable
+
+    scale = np.array(geojson['transform']['scale'])
+    translate = np.array(geojson['transform']['translate'])
+    assert [f['id'] for f in geojson['features']] \
+        == [f['id'] for f in raw['features']]
+    for feature, raw_feature in zip(geojson['features'], raw['features']):
+        rings = [
+            np.cumsum(np.array(ring), axis=0) * scale + translate
+            for polygon in feature['geometry']['coordinates']
+            for ring in polygon
+        ]
+        raw_rings = [
+            np.array(ring)
+            for polygon in raw_feature['geometry']['coordinates']
+            for ring in polygon
+        ]
+        assert 0 < len(rings) <= len(raw_rings)  # (tiny rings are dropped)
+        for ring in rings:
+            assert len(ring) >= 4 and np.allclose(ring[0], ring[-1])
+            # every vertex is within a quantization step of the unquantized one
+            error = min(
+                np.abs(ring[:, None, :] - raw_ring[None, :, :])
+                .max(axis=2).min(axis=1).max()
+                for raw_ring in raw_rings
+            )
+            assert error <= scale[0]
+
+#%%============================================================================
+def test_svg_export():
+    data = dict.fromkeys(maps._STATES_AND_DC, 1.0)
+    svg = maps.choropleth_to_svg(data, level_of_detail=3)
+    assert svg.startswith('<svg') and svg.rstrip().endswith('</svg>')
+    assert svg.count('<path ') == 50
+    assert 'data-id="Colorado"' in svg
+
+#%%============================================================================
+# (longitude, latitude, x, y) near the 180th meridian (the Aleutian Islands)
+# and elsewhere in Alaska and Hawaii, projected with PROJ ("+R=6370997"), and
+# shifted so that the lower-left corner of the map region is at (0, 0)
+_PROJECTED_POINTS = {
+    'lcc': [
+        (179.77, 52.0, -2530671.1, 5842182.1),
+        (172.5, 52.9, -2727649.1, 6317818.1),
+        (-179.5, 51.5, -2545791.1, 5767167.1),
+        (-150.0, 61.0, -423747.7, 5237552.8),
+        (-157.86, 21.31, -3651886.1, 2058859.8),
+    ],
+    'merc': [
+        (179.77, 52.0, 1020857.6, 4249315.1),
+        (172.5, 52.9, 261222.5, 4403624.4),
+        (-179.5, 51.5, 1097134.5, 4164925.3),
+        (-150.0, 61.0, 4179560.1, 5962989.3),
+        (-157.86, 21.31, 3358276.6, 146287.6),
+    ],
+}
+
+#%%============================================================================
+@pytest.mark.parametrize('projection', ['lcc', 'merc'])
+def test_map_projection_near_dateline(projection):
+    proj_params = maps._LCC_PARAMS if projection == 'lcc' else maps._MERC_PARAMS
+    m = maps._MapProjection(**proj_params)
+    lon, lat, x, y = np.array(_PROJECTED_POINTS[projection]).T
+    x_, y_ = m(lon, lat)
+    assert np.allclose(x_, x, atol=0.1) and np.allclose(y_, y, atol=0.1)
+
+#%%============================================================================
+def test_geometry_bundle_becomes_stale(tmp_path, monkeypatch):
+    shp_dir = tmp_path / 'usa_states'
+    shp_dir.mkdir()
+    for ext in ['.shp', '.shx', '.dbf']:
+        shutil.copy(_ST99_D00 + ext, str(shp_dir))
+    shp_path = str(shp_dir / 'st99_d00')
+    bundle_dir, = maps.build_geometry_bundle(str(tmp_path))
+
+    calls = []
+    for name in ['_load_geometry_bundle', '_project_shapefile']:
+        def spy(*args, _name=name, _func=getattr(maps, name)):
+            calls.append(_name)
+            return _func(*args)
+        monkeypatch.setattr(maps, name, spy)
+
+    m = maps._get_projection(maps._LCC_PARAMS)
+    maps.clear_map_cache()
+    segments, _ = maps._read_shapefile_cached(m, maps._LCC_PARAMS, shp_path)
+    assert maps._is_valid_bundle(bundle_dir, shp_path, maps._LCC_PARAMS)
+    assert calls == ['_load_geometry_bundle']
+
+    # move the last vertex of the last shape by one degree (same file size)
+    with open(shp_path + '.shp', 'r+b') as fp:
+        fp.seek(-8, os.SEEK_END)
+        lat = struct.unpack('<d', fp.read(8))[0]
+        fp.seek(-8, os.SEEK_END)
+        fp.write(struct.pack('<d', lat + 1.0))
+
+    maps.clear_map_cache()
+    new_segments, _ = maps._read_shapefile_cached(m, maps._LCC_PARAMS, shp_path)
+    assert not maps._is_valid_bundle(bundle_dir, shp_path, maps._LCC_PARAMS)
+    assert calls == ['_load_geometry_bundle', '_project_shapefile']
+    assert not np.allclose(new_segments[-1][-1], segments[-1][-1])
+    maps.clear_map_cache()
+
+#%%============================================================================
+def test_map_cache_hits_and_evictions(monkeypatch):
+    monkeypatch.setattr(maps, '_MAP_CACHE_MAXBYTES', 10000)
+    maps.clear_map_cache()
+    calls = []
+
+    def get(key, nbytes):
+        def loader():
+            calls.append(key)
+            return np.zeros(nbytes, dtype=np.uint8)
+        return maps._get_from_map_cache(('test', key), loader)
+
+    big = get('big', 6000)
+    assert get('big', 6000) is big  # a hit
+    for j in range(100):  # many small entries do not evict the big one
+        get(j, 10)
+    assert ('test', 'big') in maps._map_cache
+    assert calls.count('big') == 1
+
+    get('big', 6000)  # (most recently used)
+    get('medium', 3500)  # evicts the oldest small entries only
+    assert ('test', 'big') in maps._map_cache
+    assert ('test', 0) not in maps._map_cache
+    assert ('test', 99) in maps._map_cache
+
+    get('other big', 6000)  # the least recently used entries go first
+    assert ('test', 'big') not in maps._map_cache
+    assert ('test', 'medium') in maps._map_cache
+    total = sum(nbytes for _, nbytes in maps._map_cache.values())
+    assert total <= 10000
+
+    get('huge', 20000)  # larger than the limit: kept alone
+    assert list(maps._map_cache) == [('test', 'huge')]
+    maps.clear_map_cache()
+
+#%%============================================================================
+def _signed_area(ring):
+    x, y = np.asarray(ring, dtype=float).T
+    return 0.5 * np.sum(x[:-1] * y[1:] - x[1:] * y[:-1])
+
+#%%============================================================================
+def _net_edges(rings):
+    # Directed edges of the rings, where each pair of opposite edges cancels
+    # out (i.e., borders between two rings, and zero-width spikes)
+    edges = collections.Counter()
+    for ring in rings:
+        ring = [tuple(xy) for xy in np.asarray(ring, dtype=float)]
+        edges.update((a, b) for a, b in zip(ring[:-1], ring[1:]) if a != b)
+    for a, b in list(edges):
+        n_opposite = min(edges[(a, b)], edges[(b, a)])
+        edges[(a, b)] -= n_opposite
+        edges[(b, a)] -= n_opposite
+    return +edges
+
+#%%============================================================================
+def _split_rings(path):
+    starts = np.flatnonzero(path.codes == path.MOVETO)
+    return np.split(path.vertices, starts[1:])
+
+#%%============================================================================
+def _check_dissolved_outline(path, member_rings):
+    rings = _split_rings(path)
+    assert all(np.array_equal(ring[0], ring[-1]) for ring in rings)
+
+    # The outline must consist of exactly the edges that are not shared by
+    # two members (so no ring is closed by a made-up edge), and enclose the
+    # same (signed) area
+    assert _net_edges(rings) == _net_edges(member_rings)
+
+    area = sum(_signed_area(ring) for ring in rings)
+    member_area = sum(_signed_area(ring) for ring in member_rings)
+    assert area == pytest.approx(member_area, rel=1e-9)
+
+#%%============================================================================
+def test_dissolved_layer_grid_with_enclave():
+    # A 3x3 grid of unit squares, where the center square has its own color
+    squares = [
+        np.array([[x, y], [x, y + 1], [x + 1, y + 1], [x + 1, y], [x, y]])
+        for x in range(3) for y in range(3)
+    ]
+    colors = np.array([[0, 0, 1, 1]] * 9, dtype=float)
+    colors[4] = [1, 0, 0, 1]
+
+    fig, ax = plt.subplots()
+    layer = maps._DissolvedLayer(ax, squares, np.arange(9))
+    layer.set_colors(colors, np.zeros(9, dtype=bool))
+    paths = layer.collection.get_paths()
+    plt.close(fig)
+
+    assert len(paths) == 2
+    outer, center = paths  # (the unique colors are sorted)
+    assert len(_split_rings(outer)) == 2  # the outline and the hole
+    assert len(_split_rings(center)) == 1
+    _check_dissolved_outline(outer, squares[:4] + squares[5:])
+    _check_dissolved_outline(center, [squares[4]])
+    assert abs(sum(_signed_area(r) for r in _split_rings(outer))) == 8  # (a hole)
+
+#%%============================================================================
+def test_dissolved_layer_states():
+    m = maps._get_projection(maps._LCC_PARAMS)
+    segments, table = maps._read_shapefile_cached(
+        m, maps._LCC_PARAMS, _ST99_D00, tolerance=maps._LOD_TOLERANCES[3],
+    )
+    # Three groups of states that border each other in complicated ways
+    group = np.array([len(name) % 3 for name in table['NAME'].values])
+    palette = np.array([[1, 0, 0, 1], [0, 1, 0, 1], [0, 0, 1, 1]], dtype=float)
+    colors = palette[group]
+
+    fig, ax = plt.subplots()
+    layer = maps._DissolvedLayer(ax, segments, np.arange(len(segments)))
+    layer.set_colors(colors, np.zeros(len(segments), dtype=bool))
+    paths = layer.collection.get_paths()
+    plt.close(fig)
+
+    assert len(paths) == 3
+    for g, path in zip([2, 1, 0], paths):  # (the unique colors are sorted)
+        members = [seg for seg, k in zip(segments, group) if k == g]
+        _check_dissolved_outline(path, members)
+        assert len(path.vertices) < sum(len(seg) for seg in members)
+
+#%%============================================================================
+def _hit_test(segments, points):
+    # The label (``j + 1``) of the topmost (i.e., last) polygon that contains
+    # each point, or 0 if no polygon contains it
+    from matplotlib.path import Path
+
+    labels = np.zeros(len(points), dtype=int)
+    for j, seg in enumerate(segments):
+        labels[Path(seg).contains_points(points)] = j + 1
+    return labels
+
+#%%============================================================================
+def test_raster_layer_matches_vector_hit_test():
+    m = maps._get_projection(maps._LCC_PARAMS)
+    segments, table = maps._read_shapefile_cached(m, maps._LCC_PARAMS, _ST99_D00)
+    segments = [  # (the contiguous states only, to keep the image small)
+        seg for seg, name in zip(segments, table['NAME'].values)
+        if name not in ('Alaska', 'Hawaii', 'Puerto Rico')
+    ]
+    pixel_size = 25000.0
+    rng = np.random.RandomState(0)
+    colors = np.column_stack([rng.rand(len(segments), 3), np.ones(len(segments))])
+
+    fig, ax = plt.subplots()
+    layer = maps._RasterLayer(ax, segments, np.arange(len(segments)), pixel_size)
+    layer.set_colors(colors, np.zeros(len(segments), dtype=bool))
+    image = layer.image.get_array()
+    left, right, bottom, top = layer.image.get_extent()
+    plt.close(fig)
+
+    n_rows, n_cols = layer.labels.shape
+    assert right - left == n_cols * pixel_size
+    assert top - bottom == n_rows * pixel_size
+
+    # Hit tests at the pixel centers (the first row is the top)
+    xx, yy = np.meshgrid(
+        left + pixel_size * (np.arange(n_cols) + 0.5),
+        top - pixel_size * (np.arange(n_rows) + 0.5),
+    )
+    expected = _hit_test(segments, np.column_stack([xx.ravel(), yy.ravel()]))
+    expected = expected.reshape(n_rows, n_cols)
+
+    # Pixels that a polygon boundary passes through (or next to) may go
+    # either way; all the other pixels must have the label of their centers
+    is_border = np.zeros((n_rows, n_cols), dtype=bool)
+    for seg in segments:
+        n_steps = np.ceil(
+            np.hypot(*np.diff(seg, axis=0).T) / (pixel_size / 4)
+        ).astype(int) + 1
+        t = np.concatenate([np.arange(n) / n for n in n_steps])
+        start = np.repeat(seg[:-1], n_steps, axis=0)
+        end = np.repeat(seg[1:], n_steps, axis=0)
+        points = start + (end - start) * t[:, None]
+        cols = np.floor((points[:, 0] - left) / pixel_size).astype(int)
+        rows = np.floor((top - points[:, 1]) / pixel_size).astype(int)
+        for di in (-1, 0, 1):
+            for dk in (-1, 0, 1):
+                is_border[
+                    np.clip(rows + di, 0, n_rows - 1),
+                    np.clip(cols + dk, 0, n_cols - 1),
+                ] = True
+
+    is_interior = ~is_border
+    assert (expected[is_interior] > 0).sum() > 5000
+    assert (expected[is_interior] == 0).sum() > 1000
+    np.testing.assert_array_equal(
+        layer.labels[is_interior], expected[is_interior],
+    )
+
+    lut = np.zeros((len(segments) + 1, 4), dtype=np.uint8)  # 0: transparent
+    lut[1:] = np.round(colors * 255)
+    np.testing.assert_array_equal(
+        image[is_interior], lut[expected[is_interior]],
+    )
+
+    # Even at the borders, most pixels have the label of their centers
+    assert (layer.labels == expected).mean() > 0.9
+
+#%%============================================================================
+def _get_shared_vertices(segments, states):
+    # The vertices that each pair of polygons of different states share
+    owners = {}
+    for j, seg in enumerate(segments):
+        for xy in set(map(tuple, seg)):
+            owners.setdefault(xy, set()).add(j)
+    shared = {}
+    for xy, js in owners.items():
+        for i in js:
+            for j in js:
+                if i < j and states[i] != states[j]:
+                    shared.setdefault((i, j), set()).add(xy)
+    return shared
+
+#%%============================================================================
+@pytest.fixture(scope='module', params=['lcc', 'merc'])
+def state_borders(request):
+    proj_params = maps._LCC_PARAMS if request.param == 'lcc' else maps._MERC_PARAMS
+    m = maps._get_projection(proj_params)
+    segments, table = maps._read_shapefile_cached(m, proj_params, _ST99_D00)
+    shared = _get_shared_vertices(segments, table.index.values)
+    return m, proj_params, shared
+
+#%%============================================================================
+@pytest.mark.parametrize('level', range(1, len(maps._LOD_TOLERANCES)))
+def test_simplification_keeps_shared_borders(state_borders, level):
+    m, proj_params, shared = state_borders
+    assert len(shared) > 100
+
+    segments, _ = maps._read_shapefile_cached(
+        m, proj_params, _ST99_D00, tolerance=maps._LOD_TOLERANCES[level],
+    )
+    vertices = [set(map(tuple, seg)) for seg in segments]
+    n_full, n_simplified = 0, 0
+    for (i, j), border in shared.items():
+        kept = vertices[i] & border
+        assert kept == vertices[j] & border  # the same simplified border
+        assert len(kept) > 0  # (adjacent states stay adjacent)
+        n_full += len(border)
+        n_simplified += len(kept)
+    assert n_simplified < n_full
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+
+import datetime as dt
+import numpy as np
+import pandas as pd
+import pytest
+
+import matplotlib as mpl
+mpl.use('Agg')
+import matplotlib.pyplot as plt
+
+from plot_utils import time_series
+
+#%%============================================================================
+@pytest.mark.parametrize('raw_date, expected', [
+    (['20150101', '20150201', '20160101'],
+     ['2015-01-01', '2015-02-01', '2016-01-01']),
+    (['2015-01-01', '2015-02-01', '2016-01-01'],
+     ['2015-01-01', '2015-02-01', '2016-01-01']),
+    ([201405, 201406, 201407], ['2014-05-01', '2014-06-01', '2014-07-01']),
+    ([201405.0, 201406.0, 201407.0],
+     ['2014-05-01', '2014-06-01', '2014-07-01']),
+    ([20140525, 20150101], ['2014-05-25', '2015-01-01']),
+    ([201405], ['2014-05-01']),
+    (['2014-05-25'], ['2014-05-25']),
+    ([201412.0], ['2014-12-01']),
+    (np.array([201405, 201406]), ['2014-05-01', '2014-06-01']),
+    (pd.Series(['2015-03', '2015-04']), ['2015-03-01', '2015-04-01']),
+    ([201405, '201406', 201407.0], ['2014-05-01', '2014-06-01', '2014-07-01']),
+    (['2015-01-01', '2015/01/02'], ['2015-01-01', '2015-01-02']),
+    (['01/02/2015', '13/02/2015'], ['2015-01-02', '2015-02-13']),
+    (['2015-01-01', '2015-01-02'] * 3,
+     ['2015-01-01', '2015-01-02'] * 3),
+])
+def test_as_date_list_like(raw_date, expected):
+    result = time_series._as_date(raw_date)
+    assert isinstance(result, pd.DatetimeIndex)
+    assert result.equals(pd.DatetimeIndex(pd.to_datetime(expected)))
+
+#%%============================================================================
+@pytest.mark.parametrize('raw_date, expected', [
+    (201310, '2013-10-01'),
+    (201210.0, '2012-10-01'),
+    ('2014-05-25', '2014-05-25'),
+])
+def test_as_date_single_element(raw_date, expected):
+    assert time_series._as_date(raw_date) == pd.Timestamp(expected)
+
+#%%============================================================================
+def test_as_date_date_fmt():
+    result = time_series._as_date(['01/02/15', '03/04/15'], '%d/%m/%y')
+    assert result.equals(pd.DatetimeIndex(['2015-02-01', '2015-04-03']))
+    with pytest.raises(ValueError):
+        time_series._as_date(['2015-01-01', '2015/01/02'], '%Y-%m-%d')
+
+#%%============================================================================
+def test_as_date_no_conversion():
+    index = pd.date_range('2015-01-01', periods=3)
+    assert time_series._as_date(index) is index
+    assert time_series._as_date(dt.date(2015, 1, 1)) == dt.date(2015, 1, 1)
+    assert len(time_series._as_date([])) == 0
+
+#%%============================================================================
+def test_as_date_invalid_element():
+    with pytest.raises(TypeError):
+        time_series._as_date([201405, None, object()])
+
+#%%============================================================================
+def _random_walk(n, seed=0, n_missing=0):
+    rng = np.random.RandomState(seed)
+    x = np.sort(rng.uniform(0, 1e6, size=n))
+    y = np.cumsum(rng.normal(size=n))
+    y[rng.choice(n, size=n_missing, replace=False)] = np.nan
+    return x, y
+
+#%%============================================================================
+@pytest.mark.parametrize('n_missing', [0, 500])
+@pytest.mark.parametrize('n_points', [4, 5, 10, 101, 1000])
+def test_downsample_minmax(n_points, n_missing):
+    x, y = _random_walk(20000, n_missing=n_missing)
+    y[5000:5200] = np.nan  # a gap
+    keep = time_series._downsample_minmax(x, y, n_points)
+
+    assert len(keep) <= n_points
+    assert np.all(np.diff(keep) > 0)
+    assert keep[0] == 0 and keep[-1] == len(y) - 1
+    assert np.nanargmax(y) in keep and np.nanargmin(y) in keep
+    if n_points >= 1000:  # the gap is wider than an interval: it is kept
+        assert np.any(np.isnan(y[keep]))
+
+#%%============================================================================
+@pytest.mark.parametrize('n_missing', [0, 500])
+@pytest.mark.parametrize('n_points', [3, 10, 101, 1000])
+def test_downsample_lttb(n_points, n_missing):
+    x, y = _random_walk(20000, n_missing=n_missing)
+    y[12345] = 1000.0  # a spike
+    keep = time_series._downsample_lttb(x, y, n_points)
+
+    valid = np.flatnonzero(~np.isnan(y))
+    assert len(keep) == n_points
+    assert np.all(np.diff(keep) > 0)
+    assert keep[0] == valid[0] and keep[-1] == valid[-1]
+    assert not np.any(np.isnan(y[keep]))  # missing values are skipped
+    if n_points > 3:
+        assert 12345 in keep
+
+#%%============================================================================
+def test_downsample_timeseries():
+    index = pd.date_range('2000-01-01', periods=5000, freq='h')
+    df = pd.DataFrame({'a': np.arange(5000.0), 'b': -np.arange(5000.0)}, index)
+    xy_pairs = time_series._downsample_timeseries(df, 'auto', 100)
+    assert len(xy_pairs) == 2
+    for (x, y), column in zip(xy_pairs, ['a', 'b']):
+        assert len(x) == len(y) <= 100
+        assert np.array_equal(y, df.loc[x, column].values)
+
+    with pytest.raises(ValueError):
+        time_series._downsample_timeseries(df, 'minmax', 3)
+
+    short = df.iloc[:50]  # shorter than n_points: not downsampled
+    (x, y), = time_series._downsample_timeseries(short, 'minmax', 100)
+    assert x.equals(short.index)
+
+#%%============================================================================
+def _pyramid_series(n=100003, seed=0):
+    rng = np.random.RandomState(seed)
+    y = np.cumsum(rng.normal(size=n))
+    y[3000:3100] = np.nan
+    return pd.Series(y, pd.date_range('2000-01-01', periods=n, freq='min'))
+
+#%%============================================================================
+@pytest.mark.parametrize('start, end, n_points', [
+    (None, None, 1000),
+    ('2000-01-02', '2000-01-20', 1000),
+    ('2000-01-03 02:00', '2000-01-03 09:00', 300),
+    ('2000-01-03 02:00', '2000-01-03 03:00', 300),  # all the points
+])
+def test_pyramid_query_resolution(start, end, n_points):
+    ts = _pyramid_series()
+    pyramid = time_series.TimeSeriesPyramid(ts)
+    x, y = pyramid.query(start, end, n_points)
+
+    # the visible points, plus one on each side
+    n = len(ts)
+    i0 = 0 if start is None else ts.index.searchsorted(pd.Timestamp(start)) - 1
+    i1 = n if end is None \
+        else ts.index.searchsorted(pd.Timestamp(end), 'right') + 1
+    # the finest level whose blocks overlapping [i0, i1) fit into n_points
+    level = 0
+    while ((i1 - 1) >> level) - (i0 >> level) + 1 > n_points // 2:
+        level += 1
+
+    values = ts.values
+    expected = []
+    for b in range(i0 >> level, ((i1 - 1) >> level) + 1):
+        block = np.arange(b << level, min((b + 1) << level, n))
+        if level == 0:
+            expected.append(block[0])
+        elif np.all(np.isnan(values[block])):
+            expected.append(block[0])
+        else:
+            expected += [
+                block[np.nanargmin(values[block])],
+                block[np.nanargmax(values[block])],
+            ]
+    expected = np.unique(expected)
+
+    assert x.equals(ts.index[expected])
+    assert np.array_equal(y, values[expected], equal_nan=True)
+    assert len(x) <= n_points + 4  # (the partial blocks at the edges)
+
+#%%============================================================================
+def test_pyramid_query_mean_and_first_last():
+    ts = _pyramid_series(n=1024)
+    pyramid = time_series.TimeSeriesPyramid(ts)
+    assert pyramid.n_levels == 10
+
+    x, y = pyramid.query(n_points=16, how='mean')  # blocks of 64 points
+    assert len(x) == 16
+    means = ts.groupby(np.arange(1024) // 64).mean().values
+    assert np.allclose(y, means, equal_nan=True)
+    assert x.equals(ts.index[np.arange(16) * 64 + 31])
+
+    x, y = pyramid.query(n_points=16, how='first_last')  # blocks of 128
+    positions = np.sort(np.r_[np.arange(8) * 128, np.arange(8) * 128 + 127])
+    assert x.equals(ts.index[positions])
+
+#%%============================================================================
+def test_pyramid_xlim_changed_callback():
+    ts = _pyramid_series()
+    fig, ax = time_series.plot_timeseries(
+        ts, downsample='pyramid', n_points=500, month_grid_width=1,
+    )
+    line, = ax.lines
+    assert len(line.get_xdata()) <= 504
+    full_x = line.get_xdata()
+
+    start, end = pd.Timestamp('2000-01-04 02:00'), pd.Timestamp('2000-01-04 03:00')
+    ax.set_xlim(start, end)  # zoom in: all the (61 + 2) points are drawn
+    x = pd.DatetimeIndex(line.get_xdata())
+    assert x.equals(ts.loc['2000-01-04 01:59':'2000-01-04 03:01'].index)
+    assert np.array_equal(line.get_ydata(), ts.loc[x].values)
+
+    ax.set_xlim(ts.index[0], ts.index[-1])  # zoom out again
+    assert pd.DatetimeIndex(line.get_xdata()).equals(pd.DatetimeIndex(full_x))
+    plt.close(fig)
+
+#%%============================================================================
+def test_line_collection_matches_lines():
+    rng = np.random.RandomState(0)
+    index = pd.date_range('2015-01-01', periods=200)
+    df = pd.DataFrame(
+        rng.normal(size=(200, 130)).cumsum(axis=0), index=index,
+        columns=['s%d' % j for j in range(130)],
+    )
+    df.iloc[50:60, 3] = np.nan
+
+    fig_1, ax_1 = time_series.plot_multiple_timeseries(df)
+    fig_2, ax_2 = time_series.plot_multiple_timeseries(df, line_collection=True)
+    assert len(ax_1.lines) == 130 and len(ax_2.lines) == 0
+
+    # vertices, colors, and line widths of each time series, in column order
+    lines = [
+        (tuple(mpl.colors.to_rgba(line.get_color())), line.get_linewidth(),
+         line.get_xydata())
+        for line in ax_1.lines
+    ]
+    segments = {}
+    for collection in ax_2.collections:
+        key = (tuple(collection.get_color()[0]), collection.get_linewidth()[0])
+        segments.setdefault(key, []).extend(  # (with the missing values)
+            path.vertices for path in collection.get_paths()
+        )
+    for rgba, lw, xy in lines:  # (line styles are compared in the legend)
+        candidates = segments[(rgba, lw)]
+        matches = [
+            k for k, segment in enumerate(candidates)
+            if np.array_equal(segment, xy, equal_nan=True)
+        ]
+        assert len(matches) == 1
+        candidates.pop(matches[0])
+    assert all(len(_) == 0 for _ in segments.values())
+
+    assert ax_1.get_xlim() == ax_2.get_xlim()
+    assert np.allclose(ax_1.get_ylim(), ax_2.get_ylim())
+
+    legend_1, legend_2 = ax_1.get_legend(), ax_2.get_legend()
+    assert [_.get_text() for _ in legend_1.get_texts()] \
+        == [_.get_text() for _ in legend_2.get_texts()] == list(df.columns)
+    for handle_1, handle_2 in zip(legend_1.legend_handles, legend_2.legend_handles):
+        assert handle_1.get_color() == handle_2.get_color()
+        assert handle_1.get_linestyle() == handle_2.get_linestyle()
+        assert handle_1.get_linewidth() == handle_2.get_linewidth()
+
+    plt.close(fig_1)
+    plt.close(fig_2)